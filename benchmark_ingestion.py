@@ -0,0 +1,254 @@
+"""Benchmark RUM ingestion on synthetic bundles of 1k to 1M events.
+
+For every size a bundle is generated with synthetic_rum.py (sessions, events
+per session, error ratio, script count and script size are configurable) and
+its scripts are served from a local HTTP server standing in for the CDN. The
+script then times each ingestion stage on it, with a cold JS source cache:
+
+    read    streaming the error sessions out of the .json.gz bundle
+    parse   parse_stage over those sessions (read time excluded)
+    ingest  parse_rum_js_errors end to end: parse, fetch and enrich (read excluded)
+    split   split_errors_by_line_column on the parsed errors
+    unique  keep_unique_error_descriptions on the errors with a line and column
+
+and reports events/s, the peak traced memory of each stage and the process's
+peak RSS. Timings come from an untraced run of each stage; the peak comes from
+a second run under tracemalloc, which --no-tracemalloc skips.
+
+--output writes the results as JSON; --baseline compares them with an earlier
+--output file and exits with status 1 when any stage's throughput dropped by
+more than --tolerance.
+
+Usage:
+    python3 benchmark_ingestion.py [--sizes 1000,10000,100000,1000000] [--error-ratio 0.05]
+        [--scripts 20 --script-kb 64] [--output ingestion.json] [--baseline ingestion.json]
+"""
+import argparse
+import json
+import os
+import resource
+import sys
+import tempfile
+import time
+import tracemalloc
+
+import requests
+
+import pipeline
+from js_source_cache import JSSourceCache
+from rum_stream import iter_error_sessions_from_file
+from source_map import SourceMapResolver
+from synthetic_rum import generate_scripts, generate_sessions, route_to_local, start_script_server, write_bundle
+
+DEFAULT_SIZES = "1000,10000,100000,1000000"
+STAGES = ("read", "parse", "ingest", "split", "unique")
+# Stages faster than this in both runs are too noisy to compare with a baseline
+MIN_COMPARED_SECONDS = 0.01
+
+
+class TimedIterator:
+    """Wraps an iterable and adds up the time spent producing its items, to subtract from downstream stages."""
+
+    def __init__(self, iterable):
+        self.iterator = iter(iterable)
+        self.seconds = 0.0
+
+    def __iter__(self):
+        return self
+
+    def __next__(self):
+        started = time.perf_counter()
+        try:
+            return next(self.iterator)
+        finally:
+            self.seconds += time.perf_counter() - started
+
+
+def measure(run, trace_memory):
+    """(result, seconds, peak traced bytes or None) of a stage.
+
+    run() returns (result, seconds spent upstream to exclude). It is timed
+    untraced, then run again under tracemalloc for the peak, since tracing
+    slows pure-Python stages down by an order of magnitude.
+    """
+    started = time.perf_counter()
+    result, upstream_seconds = run()
+    seconds = time.perf_counter() - started - upstream_seconds
+    peak = None
+    if trace_memory:
+        tracemalloc.start()
+        try:
+            run()
+            peak = tracemalloc.get_traced_memory()[1]
+        finally:
+            tracemalloc.stop()
+    return result, seconds, peak
+
+
+def peak_rss_mb():
+    # ru_maxrss is in kilobytes on Linux and in bytes on macOS
+    rss = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    return rss / (1 << 20) if sys.platform == "darwin" else rss / 1024
+
+
+def use_cold_cache(cache_dir, local_base, pool_size):
+    """Point pipeline at a fresh, empty JS source cache whose requests go to the local script server."""
+    session = route_to_local(requests.Session(), local_base, pool_size=pool_size)
+    pipeline.js_source_cache = JSSourceCache(cache_dir=cache_dir, session=session, pool_size=pool_size,
+                                             max_per_host=pool_size)
+    pipeline.source_map_resolver = SourceMapResolver(pipeline.js_source_cache)
+
+
+def run_size(events, args, sites, local_base, server_stats, workdir):
+    bundle_path = os.path.join(workdir, f"bundle-{events}.json.gz")
+    sessions = generate_sessions(events, sites, args.events_per_session, args.error_ratio,
+                                 args.distinct_errors, seed=args.seed)
+    started = time.perf_counter()
+    session_count = write_bundle(bundle_path, sessions)
+    generate_seconds = time.perf_counter() - started
+
+    stages = {}
+
+    def record(name, seconds, peak):
+        stages[name] = {
+            "seconds": round(seconds, 4),
+            "events_per_second": round(events / seconds) if seconds > 0 else None,
+            "peak_mb": round(peak / (1 << 20), 2) if peak is not None else None,
+        }
+
+    error_sessions, seconds, peak = measure(
+        lambda: (sum(1 for _ in iter_error_sessions_from_file(bundle_path)), 0), args.trace_memory)
+    record("read", seconds, peak)
+
+    def parse():
+        reader = TimedIterator(iter_error_sessions_from_file(bundle_path))
+        return sum(1 for kind, _, _ in pipeline.parse_stage(reader, args.deminify) if kind == "error"), reader.seconds
+
+    error_count, seconds, peak = measure(parse, args.trace_memory)
+    record("parse", seconds, peak)
+
+    requests_before = server_stats["requests"]
+    runs = []
+
+    def ingest():
+        runs.append(1)
+        use_cold_cache(os.path.join(workdir, f"js_cache-{events}-{len(runs)}"), local_base, args.concurrency)
+        reader = TimedIterator(iter_error_sessions_from_file(bundle_path))
+        return (pipeline.parse_rum_js_errors(reader, args.concurrency, args.deminify, args.token_budget),
+                reader.seconds)
+
+    parsed, seconds, peak = measure(ingest, args.trace_memory)
+    record("ingest", seconds, peak)
+    script_requests = (server_stats["requests"] - requests_before) // len(runs)
+    rum_errors_by_url, error_fingerprints = parsed[0], parsed[5]
+
+    split, seconds, peak = measure(lambda: (pipeline.split_errors_by_line_column(rum_errors_by_url), 0),
+                                   args.trace_memory)
+    record("split", seconds, peak)
+    unique, seconds, peak = measure(lambda: (pipeline.keep_unique_error_descriptions(split[0]), 0),
+                                    args.trace_memory)
+    record("unique", seconds, peak)
+
+    os.remove(bundle_path)
+    return {
+        "events": events,
+        "sessions": session_count,
+        "error_sessions": error_sessions,
+        "errors": error_count,
+        "fingerprints": len(error_fingerprints),
+        "pages": len(rum_errors_by_url),
+        "unique_errors": sum(len(errors) for errors in unique.values()),
+        "script_requests": script_requests,
+        "generate_seconds": round(generate_seconds, 3),
+        "stages": stages,
+        "peak_rss_mb": round(peak_rss_mb(), 1),
+    }
+
+
+def print_result(result):
+    print(f"\n📦 {result['events']:,} events: {result['sessions']:,} sessions ({result['error_sessions']:,} with errors), "
+          f"{result['errors']:,} errors, {result['fingerprints']:,} fingerprints on {result['pages']:,} pages, "
+          f"{result['script_requests']} script requests")
+    for name in STAGES:
+        stage = result["stages"][name]
+        rate = f"{stage['events_per_second']:>12,} events/s" if stage["events_per_second"] else f"{'-':>21}"
+        peak = f"{stage['peak_mb']:>9.2f} MB peak" if stage["peak_mb"] is not None else ""
+        print(f"   - {name:<7}{stage['seconds']:>9.3f}s {rate}{peak}")
+    print(f"   - peak RSS so far: {result['peak_rss_mb']:.1f} MB")
+
+
+def compare_with_baseline(results, baseline_path, tolerance):
+    """Stage names whose throughput fell by more than tolerance (a fraction) against the baseline file."""
+    with open(baseline_path, "r", encoding="utf-8") as f:
+        baseline = {entry["events"]: entry for entry in json.load(f).get("results", [])}
+    regressions = []
+    for result in results:
+        previous = baseline.get(result["events"])
+        if previous is None:
+            continue
+        for name in STAGES:
+            before = previous["stages"].get(name, {}).get("events_per_second")
+            after = result["stages"][name]["events_per_second"]
+            if max(previous["stages"].get(name, {}).get("seconds", 0), result["stages"][name]["seconds"]) < MIN_COMPARED_SECONDS:
+                continue
+            if before and after and after < before * (1 - tolerance):
+                regressions.append(f"{name} @ {result['events']:,} events: {before:,} -> {after:,} events/s "
+                                   f"({after / before - 1:+.0%})")
+    return regressions
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--sizes", default=DEFAULT_SIZES, help=f"Comma-separated event counts (default: {DEFAULT_SIZES})")
+    parser.add_argument("--events-per-session", type=int, default=20, help="Events per session (default: 20)")
+    parser.add_argument("--error-ratio", type=float, default=0.05, help="Share of events that are errors (default: 0.05)")
+    parser.add_argument("--distinct-errors", type=int, default=500,
+                        help="Distinct script/line/column/description combinations (default: 500)")
+    parser.add_argument("--scripts", type=int, default=20, help="Generated JS files (default: 20)")
+    parser.add_argument("--script-kb", type=int, default=64, help="Approximate size of each JS file in KB (default: 64)")
+    parser.add_argument("--seed", type=int, default=1)
+    parser.add_argument("--concurrency", type=int, default=8, help="Enrichment workers (default: 8)")
+    parser.add_argument("--token-budget", type=int, default=pipeline.DEFAULT_CONTEXT_TOKEN_BUDGET)
+    parser.add_argument("--no-deminify", dest="deminify", action="store_false")
+    parser.add_argument("--no-tracemalloc", dest="trace_memory", action="store_false",
+                        help="Skip the traced second run of each stage that measures its peak memory")
+    parser.add_argument("--output", help="Write the results to this JSON file")
+    parser.add_argument("--baseline", help="Earlier --output file to compare throughput with")
+    parser.add_argument("--tolerance", type=float, default=0.2,
+                        help="Allowed throughput drop against --baseline, as a fraction (default: 0.2)")
+    args = parser.parse_args()
+    sizes = [int(size) for size in args.sizes.split(",") if size.strip()]
+
+    scripts, sites = generate_scripts(args.scripts, args.script_kb)
+    server, local_base, server_stats = start_script_server(scripts)
+    print(f"🌐 Serving {len(scripts)} synthetic scripts (~{args.script_kb} KB each) from {local_base}")
+
+    results = []
+    try:
+        with tempfile.TemporaryDirectory(prefix="benchmark_ingestion_") as workdir:
+            for events in sizes:
+                result = run_size(events, args, sites, local_base, server_stats, workdir)
+                print_result(result)
+                results.append(result)
+    finally:
+        server.shutdown()
+
+    if args.output:
+        config = {key: value for key, value in vars(args).items() if key not in ("output", "baseline")}
+        with open(args.output, "w", encoding="utf-8") as f:
+            json.dump({"timestamp": time.strftime("%Y-%m-%dT%H:%M:%S"), "python": sys.version.split()[0],
+                       "config": config, "results": results}, f, indent=2)
+        print(f"\n📈 Results written to {args.output}")
+
+    if args.baseline:
+        regressions = compare_with_baseline(results, args.baseline, args.tolerance)
+        if regressions:
+            print(f"\n❌ Throughput regressions beyond {args.tolerance:.0%} against {args.baseline}:")
+            for regression in regressions:
+                print(f"   - {regression}")
+            sys.exit(1)
+        print(f"\n✅ No throughput regression beyond {args.tolerance:.0%} against {args.baseline}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,104 @@
+"""Benchmark snippet/context extraction: full splitlines() per error vs the pipeline's line index.
+
+The indexed side runs pipeline.get_error_part_in_code and the context
+functions on a script seeded into the pipeline's JSSourceCache; the budgeted
+context enrichment builds (get_code_context_within_budget) is timed too.
+Columns are 1-based, as in RUM errors.
+
+Usage:
+    python3 benchmark_line_index.py                      # synthetic 5 MB bundle
+    python3 benchmark_line_index.py path/to/script.js    # a real script
+"""
+import argparse
+import random
+import time
+
+import pipeline
+from js_line_index import LineIndex
+from js_source_cache import JSSourceCache
+
+
+def synthetic_script(size_mb):
+    line = "  if (window.dataLayer && window.dataLayer.push) { window.dataLayer.push({ event: 'view', id: %d }); }"
+    lines = []
+    total = 0
+    i = 0
+    while total < size_mb * 1024 * 1024:
+        text = line % i
+        lines.append(text)
+        total += len(text) + 1
+        i += 1
+    return "\n".join(lines).encode("utf-8")
+
+
+def splitlines_path(content, line, column, context_radius=30, snippet_radius=20):
+    # What get_error_part_in_code / get_code_context_and_max_tokens did per error before the line index:
+    # decode and split the whole script, once for the snippet and once for the context
+    js_lines = content.decode("utf-8").splitlines()
+    line_index = line - 1
+    column_index = column - 1
+    if line_index < 0 or line_index >= len(js_lines):
+        snippet = "Line number out of bounds!"
+    elif column_index < 0 or column_index >= len(js_lines[line_index]):
+        snippet = "Column number out of bounds!"
+    else:
+        target_line = js_lines[line_index]
+        snippet = target_line[max(0, column_index - snippet_radius):column_index + snippet_radius + 1]
+    js_lines = content.decode("utf-8").splitlines()
+    start = max(0, line_index - context_radius)
+    context_lines = js_lines[start:min(len(js_lines), line_index + context_radius + 1)]
+    return snippet, "\n".join(context_lines), max((len(l.split()) for l in context_lines), default=0)
+
+
+def pipeline_path(url, line, column):
+    # The functions enrichment calls, reading the script from pipeline.js_source_cache
+    context, max_tokens = pipeline.get_code_context_and_max_tokens(url, line)
+    return pipeline.get_error_part_in_code(url, line, column), context, max_tokens
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("script", nargs="?", help="JS file to benchmark against (default: synthetic)")
+    parser.add_argument("--size-mb", type=float, default=5, help="Size of the synthetic script (default: 5)")
+    parser.add_argument("--errors", type=int, default=200, help="Number of error lookups (default: 200)")
+    args = parser.parse_args()
+
+    if args.script:
+        with open(args.script, "rb") as f:
+            content = f.read()
+    else:
+        content = synthetic_script(args.size_mb)
+
+    line_count = len(LineIndex(content))
+    rng = random.Random(42)
+    lookups = [(rng.randint(1, line_count), rng.randint(1, 41)) for _ in range(args.errors)]
+    print(f"Script: {len(content) / 1024 / 1024:.1f} MB, {line_count} lines, {args.errors} error lookups")
+
+    started = time.perf_counter()
+    baseline = [splitlines_path(content, line, column) for line, column in lookups]
+    baseline_time = time.perf_counter() - started
+
+    url = "https://example.com/benchmark.js"
+    pipeline.js_source_cache = JSSourceCache(cache_dir=None)
+    started = time.perf_counter()
+    source = pipeline.js_source_cache.put(url, content)
+    source.line_index
+    build_time = time.perf_counter() - started
+    indexed = [pipeline_path(url, line, column) for line, column in lookups]
+    indexed_time = time.perf_counter() - started
+
+    started = time.perf_counter()
+    for line, column in lookups:
+        pipeline.get_code_context_within_budget(url, line, column)
+    budget_time = time.perf_counter() - started
+
+    print(f"splitlines per error : {baseline_time * 1000:9.1f} ms ({baseline_time / args.errors * 1000:.2f} ms/error)")
+    print(f"line index           : {indexed_time * 1000:9.1f} ms ({indexed_time / args.errors * 1000:.3f} ms/error, "
+          f"index build {build_time * 1000:.1f} ms, {source.line_index.starts.itemsize * 2 * line_count / 1024:.0f} KiB)")
+    print(f"speedup              : {baseline_time / indexed_time:9.1f}x")
+    print(f"identical output     : {baseline == indexed}")
+    print(f"budgeted context     : {budget_time * 1000:9.1f} ms ({budget_time / args.errors * 1000:.3f} ms/error)")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,77 @@
+"""Benchmark per-error CrewAI orchestration overhead, separately from LLM latency.
+
+Runs the analyzer/fixer crew for synthetic errors against the local stub LLM
+endpoint (stub_llm_server.py), once building fresh agents for every error and
+once reusing them. Setup is timed on its own (agents, tasks and crew, no
+LLM call); end to end, the time the stub spent answering is subtracted from
+the wall time, which leaves the orchestration overhead per error.
+
+Usage:
+    python3 benchmark_orchestration.py [--errors 20] [--latency 0.2]
+"""
+import argparse
+import os
+import time
+
+from stub_llm_server import start_stub_server
+
+
+def synthetic_errors(count):
+    return [
+        {
+            "error_description": f"TypeError: Cannot read properties of undefined (reading 'item{i}')",
+            "error_part_in_code": f"const value = data.item{i}.name;",
+            "context_code": f"function render{i}(data) {{\n  const value = data.item{i}.name;\n  return value;\n}}",
+        }
+        for i in range(count)
+    ]
+
+
+def time_setup(iterate, agents, errors):
+    """Seconds per error spent building agents, tasks and the crew."""
+    started = time.perf_counter()
+    for i, error in enumerate(errors):
+        error_input = iterate.error_input_for(f"error_benchmark_{i}", error)
+        analyze_task = agents.analyze_errors_task(error_input)
+        fix_task = agents.fix_errors_task(error_input, analyzer_output=analyze_task)
+        agents.error_crew(analyze_task, fix_task, verbose=False)
+    return (time.perf_counter() - started) / len(errors)
+
+
+def time_end_to_end(iterate, agents, errors, stub_state):
+    """(wall seconds, LLM seconds) per error for full crew runs against the stub."""
+    busy_before = stub_state.busy_seconds
+    started = time.perf_counter()
+    for i, error in enumerate(errors):
+        iterate.run_error_crew(agents, f"error_benchmark_{i}", error, verbose=False)
+    wall = time.perf_counter() - started
+    return wall / len(errors), (stub_state.busy_seconds - busy_before) / len(errors)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--errors", type=int, default=20, help="Errors per mode (default: 20)")
+    parser.add_argument("--latency", type=float, default=0.2, help="Stub LLM latency per call in seconds (default: 0.2)")
+    args = parser.parse_args()
+
+    server, stub_state, base_url = start_stub_server(latency=args.latency)
+    os.environ["OPENAI_BASE_URL"] = base_url
+    os.environ.setdefault("OPENAI_API_KEY", "stub")
+    import test_iterate_single_error as iterate
+
+    errors = synthetic_errors(args.errors)
+    print(f"{args.errors} errors per mode, stub LLM latency {args.latency * 1000:.0f} ms per call at {base_url}\n")
+    print(f"{'mode':<16}{'setup/error':>14}{'wall/error':>14}{'LLM/error':>14}{'overhead/error':>17}")
+    for label, reuse in (("fresh agents", False), ("reused agents", True)):
+        agents = iterate.JavascriptErrorAgents(os.environ["OPENAI_API_KEY"], reuse_agents=reuse)
+        # Warm-up: first-use imports and client construction are not per-error costs
+        iterate.run_error_crew(agents, "error_benchmark_warmup", errors[0], verbose=False)
+        setup = time_setup(iterate, agents, errors)
+        wall, llm = time_end_to_end(iterate, agents, errors, stub_state)
+        print(f"{label:<16}{setup * 1000:>11.1f} ms{wall * 1000:>11.1f} ms{llm * 1000:>11.1f} ms"
+              f"{(wall - llm) * 1000:>14.1f} ms")
+    server.shutdown()
+
+
+if __name__ == "__main__":
+    main()
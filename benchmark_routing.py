@@ -0,0 +1,146 @@
+"""Benchmark the collector's routing profiles: page load time and error capture, with and without blocking.
+
+Loads the same pages from a rum_errors_by_url.json once per routing profile
+(browser_routing.py), each time in a fresh browser, and reports for every
+profile the median and p95 load and settle time per page, the requests it
+blocked and the errors captured: JavaScript errors, network errors, CSP
+violations and everything filtered out. The JavaScript errors are compared
+with those of the first profile (off by default). An error found there but
+not with a profile may have been lost to blocking; one found only with a
+profile may have been caused by it (a ReferenceError from a blocked ga or
+fbq, a SyntaxError from parsing an empty response). Both are listed.
+
+Usage:
+    python3 benchmark_routing.py [--input rum_errors_by_url.json] [--pages 20]
+        [--profiles off,lean,scripts] [--output routing.json]
+"""
+import argparse
+import json
+import sys
+import time
+
+from browser_routing import ROUTING_PROFILES
+from error_stack_collector import SETTLE_MAX_MS, SETTLE_QUIET_MS, DiagnosticErrorCollector
+
+DEFAULT_PROFILES = "off,lean,scripts"
+LISTED_ERRORS = 10
+
+
+def percentile(values, q):
+    if not values:
+        return None
+    values = sorted(values)
+    return round(values[min(len(values) - 1, int(q * len(values)))], 3)
+
+
+def javascript_errors(collector):
+    """(page, message) of every JavaScript error kept for error_traces.json."""
+    return {(url, (error.get("message") or "")[:200])
+            for url, errors in collector.error_stacks.items() for error in errors
+            if error.get("category") == "javascript_error" or not error.get("category")}
+
+
+def run_profile(profile, rum_errors, urls, args):
+    collector = DiagnosticErrorCollector(quiet_ms=args.settle_quiet_ms, max_settle_ms=args.settle_max_ms,
+                                         routing=profile)
+    collector.rum_errors = rum_errors
+    started = time.perf_counter()
+    try:
+        collector.start_browser(headless=True)
+        collector.setup_error_listeners()
+        for i, url in enumerate(urls, 1):
+            print(f"   [{profile} {i}/{len(urls)}] {url}")
+            collector.collect_error_stacks(url)
+    finally:
+        collector.close()
+    wall_seconds = time.perf_counter() - started
+
+    timings = collector.page_timings.values()
+    load = [t["load_seconds"] for t in timings]
+    settle = [t["settle_seconds"] for t in timings]
+    return {
+        "profile": profile,
+        "pages": len(urls),
+        "failed_pages": len(urls) - len(collector.page_timings),
+        "wall_seconds": round(wall_seconds, 2),
+        "load_seconds": {"p50": percentile(load, 0.5), "p95": percentile(load, 0.95)},
+        "settle_seconds": {"p50": percentile(settle, 0.5), "p95": percentile(settle, 0.95)},
+        "settle_timeouts": sum(t["settle_timeouts"] for t in timings),
+        "stats": collector.stats,
+        "javascript_errors": sorted(javascript_errors(collector)),
+    }
+
+
+def print_results(results):
+    print(f"\n{'profile':<9}{'pages':>6}{'failed':>7}{'load p50':>10}{'load p95':>10}{'settle p50':>12}"
+          f"{'total':>9}{'blocked':>9}{'JS errors':>11}{'network':>9}{'CSP':>6}{'filtered':>10}{'missed':>8}{'added':>7}")
+    for result in results:
+        stats = result["stats"]
+        print(f"{result['profile']:<9}{result['pages']:>6}{result['failed_pages']:>7}"
+              f"{_seconds(result['load_seconds']['p50']):>10}{_seconds(result['load_seconds']['p95']):>10}"
+              f"{_seconds(result['settle_seconds']['p50']):>12}{result['wall_seconds']:>8.1f}s"
+              f"{stats['blocked_requests']:>9}{len(result['javascript_errors']):>11}{stats['network_errors']:>9}"
+              f"{stats['csp_violations']:>6}{stats['filtered_out']:>10}{len(result['missed_javascript_errors']):>8}"
+              f"{len(result['added_javascript_errors']):>7}")
+    reference = results[0]["profile"]
+    for result in results:
+        print_errors(f"JavaScript errors seen with {reference} but not with {result['profile']}",
+                     result["missed_javascript_errors"])
+        print_errors(f"JavaScript errors seen with {result['profile']} but not with {reference}",
+                     result["added_javascript_errors"])
+
+
+def print_errors(title, errors):
+    if not errors:
+        return
+    print(f"\n⚠️ {title}:")
+    for url, message in errors[:LISTED_ERRORS]:
+        print(f"   - {url}: {message[:100]}")
+    if len(errors) > LISTED_ERRORS:
+        print(f"   ... and {len(errors) - LISTED_ERRORS} more")
+
+
+def _seconds(value):
+    return f"{value:.2f}s" if value is not None else "-"
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--input", default="rum_errors_by_url.json", help="Errors by page URL, as written by main.py")
+    parser.add_argument("--pages", type=int, default=20, help="Pages to load per profile, 0 for all (default: 20)")
+    parser.add_argument("--profiles", default=DEFAULT_PROFILES,
+                        help=f"Comma-separated routing profiles; the first is the reference (default: {DEFAULT_PROFILES})")
+    parser.add_argument("--settle-quiet-ms", type=int, default=SETTLE_QUIET_MS)
+    parser.add_argument("--settle-max-ms", type=int, default=SETTLE_MAX_MS)
+    parser.add_argument("--output", help="Write the results to this JSON file")
+    args = parser.parse_args()
+
+    profiles = [name.strip() for name in args.profiles.split(",") if name.strip()]
+    unknown = [name for name in profiles if name not in ROUTING_PROFILES]
+    if unknown:
+        sys.exit(f"Unknown routing profile(s): {', '.join(unknown)} (available: {', '.join(ROUTING_PROFILES)})")
+
+    with open(args.input, "r", encoding="utf-8") as f:
+        rum_errors = json.load(f)
+    urls = list(rum_errors)[:args.pages or None]
+    print(f"🌐 Loading {len(urls)} pages with each of the routing profiles: {', '.join(profiles)}")
+
+    results = []
+    for profile in profiles:
+        results.append(run_profile(profile, rum_errors, urls, args))
+    reference = set(map(tuple, results[0]["javascript_errors"]))
+    for result in results:
+        found = set(map(tuple, result["javascript_errors"]))
+        result["missed_javascript_errors"] = sorted(reference - found)
+        result["added_javascript_errors"] = sorted(found - reference)
+    print_results(results)
+
+    if args.output:
+        with open(args.output, "w", encoding="utf-8") as f:
+            json.dump({"timestamp": time.strftime("%Y-%m-%dT%H:%M:%S"), "input": args.input, "results": results},
+                      f, indent=2)
+        print(f"\n📈 Results written to {args.output}")
+
+
+if __name__ == "__main__":
+    main()
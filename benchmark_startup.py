@@ -0,0 +1,127 @@
+"""Benchmark the startup cost of the entry-point modules with `python -X importtime`.
+
+Each module is imported in a fresh interpreter (best of --repeat runs). The
+script reports the wall time of the process, the cumulative import time of the
+module itself, its slowest direct imports, and whether any heavy dependency
+(crewai, langchain, Playwright, tiktoken) was loaded along the way. Ingestion
+and stats entry points are expected to load none of them.
+
+Results can be appended to a JSON-lines history file (--history) so startup
+time can be tracked from commit to commit; --max-ms makes the run fail when a
+module's import time exceeds a budget.
+
+Usage:
+    python3 benchmark_startup.py [--repeat 5] [--history startup_history.jsonl] [--max-ms 500]
+"""
+import argparse
+import json
+import os
+import subprocess
+import sys
+import time
+
+ENTRY_POINTS = (
+    "main",
+    "pipeline",
+    "test_iterate_single_error",
+    "test_single_error",
+    "compare_modes",
+    "error_stack_collector",
+)
+HEAVY_MODULES = ("crewai", "langchain_openai", "langchain_core", "litellm", "playwright", "tiktoken")
+REPO_DIR = os.path.dirname(os.path.abspath(__file__))
+
+
+def parse_importtime(stderr):
+    """[(self_us, cumulative_us, depth, name)] from `-X importtime` output, in import order."""
+    imports = []
+    for line in stderr.splitlines():
+        if not line.startswith("import time:") or "self [us]" in line:
+            continue
+        self_us, cumulative_us, name = line[len("import time:"):].split("|")
+        depth = (len(name) - len(name.lstrip())) // 2
+        imports.append((int(self_us), int(cumulative_us), depth, name.strip()))
+    return imports
+
+
+def measure(module):
+    """(wall seconds, parsed importtime lines) of importing module in a fresh interpreter."""
+    started = time.perf_counter()
+    result = subprocess.run([sys.executable, "-X", "importtime", "-c", f"import {module}"],
+                            cwd=REPO_DIR, capture_output=True, text=True)
+    wall = time.perf_counter() - started
+    if result.returncode != 0:
+        raise RuntimeError(result.stderr.strip().splitlines()[-1] if result.stderr.strip() else "import failed")
+    return wall, parse_importtime(result.stderr)
+
+
+def summarize(module, imports, wall):
+    position = next((i for i in range(len(imports) - 1, -1, -1) if imports[i][3] == module), None)
+    own = imports[position] if position is not None else None
+    # Children are printed before their parent: walk back over the deeper lines preceding the module
+    direct = []
+    if own:
+        for entry in reversed(imports[:position]):
+            if entry[2] <= own[2]:
+                break
+            if entry[2] == own[2] + 1:
+                direct.append(entry)
+    loaded = {entry[3].split(".")[0] for entry in imports}
+    return {
+        "module": module,
+        "wall_ms": round(wall * 1000, 1),
+        "import_ms": round((own[1] if own else 0) / 1000, 1),
+        "slowest_imports": [[name, round(cumulative / 1000, 1)]
+                            for _, cumulative, _, name in sorted(direct, key=lambda e: -e[1])[:3]],
+        "heavy_modules": sorted(name for name in HEAVY_MODULES if name in loaded),
+    }
+
+
+def git_revision():
+    try:
+        return subprocess.run(["git", "rev-parse", "--short", "HEAD"], cwd=REPO_DIR,
+                              capture_output=True, text=True).stdout.strip() or None
+    except OSError:
+        return None
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("modules", nargs="*", default=list(ENTRY_POINTS), help="Modules to import (default: the entry points)")
+    parser.add_argument("--repeat", type=int, default=5, help="Runs per module; the fastest is reported (default: 5)")
+    parser.add_argument("--history", help="Append this run's results as one JSON line to this file")
+    parser.add_argument("--max-ms", type=float, help="Exit with status 1 if any module's import time exceeds this")
+    args = parser.parse_args()
+
+    results = []
+    print(f"{'module':<28}{'wall':>10}{'import':>10}  slowest direct imports / heavy dependencies loaded")
+    for module in args.modules:
+        try:
+            runs = [measure(module) for _ in range(max(args.repeat, 1))]
+        except RuntimeError as e:
+            print(f"{module:<28}  ❌ {e}")
+            results.append({"module": module, "error": str(e)})
+            continue
+        wall, imports = min(runs, key=lambda run: run[0])
+        summary = summarize(module, imports, wall)
+        results.append(summary)
+        slowest = ", ".join(f"{name} {ms:.0f} ms" for name, ms in summary["slowest_imports"])
+        heavy = f"  ⚠️ loads {', '.join(summary['heavy_modules'])}" if summary["heavy_modules"] else ""
+        print(f"{module:<28}{summary['wall_ms']:>7.0f} ms{summary['import_ms']:>7.0f} ms  {slowest}{heavy}")
+
+    if args.history:
+        record = {"timestamp": time.strftime("%Y-%m-%dT%H:%M:%S"), "revision": git_revision(),
+                  "python": sys.version.split()[0], "results": results}
+        with open(args.history, "a", encoding="utf-8") as f:
+            f.write(json.dumps(record) + "\n")
+        print(f"\n📈 Results appended to {args.history}")
+
+    if args.max_ms is not None:
+        over = [r["module"] for r in results if "error" in r or r["import_ms"] > args.max_ms]
+        if over:
+            print(f"❌ Over the {args.max_ms:.0f} ms import budget: {', '.join(over)}")
+            sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
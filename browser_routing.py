@@ -0,0 +1,119 @@
+from typing import Iterable, Optional
+from urllib.parse import urlparse
+
+# Analytics, advertising and session-recording hosts (and their subdomains).
+# Tag managers (googletagmanager.com, adobedtm.com) are left out on purpose:
+# they load the site's own tags, which are often the scripts that throw.
+TRACKER_HOSTS = (
+    "google-analytics.com",
+    "analytics.google.com",
+    "doubleclick.net",
+    "googlesyndication.com",
+    "googleadservices.com",
+    "adservice.google.com",
+    "facebook.net",
+    "connect.facebook.net",
+    "bat.bing.com",
+    "clarity.ms",
+    "hotjar.com",
+    "hotjar.io",
+    "fullstory.com",
+    "mouseflow.com",
+    "segment.io",
+    "cdn.segment.com",
+    "api.segment.io",
+    "mixpanel.com",
+    "amplitude.com",
+    "heapanalytics.com",
+    "snap.licdn.com",
+    "px.ads.linkedin.com",
+    "static.ads-twitter.com",
+    "analytics.tiktok.com",
+    "sc-static.net",
+    "ct.pinterest.com",
+    "criteo.com",
+    "criteo.net",
+    "taboola.com",
+    "outbrain.com",
+    "adnxs.com",
+    "rubiconproject.com",
+    "pubmatic.com",
+    "quantserve.com",
+    "scorecardresearch.com",
+    "demdex.net",
+    "omtrdc.net",
+    "everesttech.net",
+    "krxd.net",
+    "bluekai.com",
+)
+# Second-level labels under which sites register one level deeper (example.co.uk)
+_PUBLIC_SECOND_LEVEL = {"co", "com", "org", "net", "gov", "ac", "edu", "ne", "or"}
+
+
+def is_tracker(host: str) -> bool:
+    return any(host == tracker or host.endswith("." + tracker) for tracker in TRACKER_HOSTS)
+
+
+def site_of(host: str) -> str:
+    """Registrable domain of host, e.g. www.wilson.com -> wilson.com (a heuristic, not the public suffix list)."""
+    labels = host.lower().rstrip(".").split(".")
+    if len(labels) >= 3 and labels[-2] in _PUBLIC_SECOND_LEVEL and len(labels[-1]) == 2:
+        return ".".join(labels[-3:])
+    return ".".join(labels[-2:])
+
+
+class RoutingProfile:
+    """Which of a page's requests the collector answers with an empty response instead of loading.
+
+    Blocked are resources of blocked_types, requests to TRACKER_HOSTS when
+    block_trackers is set, and third-party requests of first_party_types.
+    The page's own document is always loaded, and so are scripts from the
+    hosts the page's RUM errors point at.
+    """
+
+    def __init__(self, name: str, blocked_types: Iterable[str] = (), block_trackers: bool = False,
+                 first_party_types: Iterable[str] = ()):
+        self.name = name
+        self.blocked_types = frozenset(blocked_types)
+        self.block_trackers = block_trackers
+        self.first_party_types = frozenset(first_party_types)
+
+    @property
+    def enabled(self) -> bool:
+        return bool(self.blocked_types or self.block_trackers or self.first_party_types)
+
+    def block_reason(self, resource_type: str, request_url: str, page_url: str,
+                     allowed_script_hosts: Iterable[str] = (), main_document: bool = False) -> Optional[str]:
+        """Why the request should be blocked ("image", "tracker", "third_party", ...), or None to load it."""
+        parsed = urlparse(request_url)
+        if main_document or parsed.scheme not in ("http", "https"):
+            return None
+        host = (parsed.hostname or "").lower()
+        if resource_type == "script" and host in allowed_script_hosts:
+            return None
+        if resource_type in self.blocked_types:
+            return resource_type
+        if self.block_trackers and is_tracker(host):
+            return "tracker"
+        if resource_type in self.first_party_types and site_of(host) != site_of(urlparse(page_url).hostname or ""):
+            return "third_party"
+        return None
+
+
+ROUTING_PROFILES = {
+    # Load everything
+    "off": RoutingProfile("off"),
+    # Skip what cannot throw (images, media, fonts) and known trackers; keep every script, stylesheet and XHR
+    "lean": RoutingProfile("lean", blocked_types=("image", "media", "font"), block_trackers=True),
+    # As lean, and keep stylesheets, XHR/fetch and other requests only when they are first-party
+    "scripts": RoutingProfile("scripts", blocked_types=("image", "media", "font", "texttrack", "manifest"),
+                              block_trackers=True,
+                              first_party_types=("stylesheet", "xhr", "fetch", "eventsource", "other", "ping")),
+}
+DEFAULT_ROUTING_PROFILE = "lean"
+
+
+def error_script_hosts(rum_errors) -> frozenset:
+    """Hosts of the scripts a page's RUM errors come from, which routing never blocks."""
+    return frozenset((urlparse(error.get("code_link") or "").hostname or "").lower()
+                     for error in rum_errors or []) - {""}
@@ -0,0 +1,143 @@
+import gzip
+import json
+import os
+import shutil
+import time
+from collections import deque
+from concurrent.futures import FIRST_COMPLETED, ThreadPoolExecutor, wait
+from datetime import date, timedelta
+from itertools import chain
+from urllib.parse import urlencode
+
+import requests
+from requests.adapters import HTTPAdapter
+
+from metrics import get_logger, metrics
+from rum_stream import iter_error_sessions_from_file
+
+BUNDLES_BASE_URL = "https://bundles.aem.page/bundles"
+DEFAULT_BUNDLE_CACHE_DIR = ".bundle_cache"
+
+log = get_logger("bundle_fetcher")
+
+
+def load_domains(path):
+    """Load domain/domainkey pairs from a JSON file: [{"domain": ..., "domainkey": ...}, ...]."""
+    with open(path, "r", encoding="utf-8") as f:
+        domains = json.load(f)
+    for entry in domains:
+        if not entry.get("domain") or not entry.get("domainkey"):
+            raise ValueError(f"Domain entry needs both 'domain' and 'domainkey': {entry}")
+    return domains
+
+
+def daterange(start, end):
+    """Inclusive list of days from start to end."""
+    return [start + timedelta(days=i) for i in range((end - start).days + 1)]
+
+
+def bundle_url(domain, domainkey, day):
+    query = urlencode({"domainkey": domainkey})
+    return f"{BUNDLES_BASE_URL}/{domain}/{day:%Y/%m/%d}?{query}"
+
+
+def bundle_cache_path(cache_dir, domain, day):
+    return os.path.join(cache_dir, domain, f"{day:%Y}", f"{day:%m}", f"{day:%d}.json.gz")
+
+
+def download_bundle(url, path, session=None, timeout=120):
+    """Stream one daily bundle into a gzip file, replacing it atomically."""
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    tmp_path = f"{path}.tmp.{os.getpid()}"
+    started = time.perf_counter()
+    try:
+        with (session or requests).get(url, stream=True, timeout=timeout) as response:
+            response.raise_for_status()
+            response.raw.decode_content = True
+            with gzip.open(tmp_path, "wb", compresslevel=6) as out:
+                shutil.copyfileobj(response.raw, out, length=1 << 16)
+        os.replace(tmp_path, path)
+    finally:
+        metrics.observe("bundle_fetch_seconds", time.perf_counter() - started, source="bulk")
+        if os.path.exists(tmp_path):
+            os.remove(tmp_path)
+    return path
+
+
+def fetch_bundles(domains, start, end, cache_dir=DEFAULT_BUNDLE_CACHE_DIR, max_workers=8,
+                  max_per_domain=2, refresh=False):
+    """Download the daily bundles for every domain in [start, end] into the local cache.
+
+    Downloads run on a thread pool. Scheduling is round-robin across domains with
+    at most max_per_domain downloads in flight per domain, so one domain with a long
+    window cannot starve the others. Past days already in the cache are reused;
+    today's bundle is still growing and is always refetched.
+
+    Returns the cached paths that are available, ordered by domain then day.
+    """
+    max_workers = max(1, max_workers)
+    max_per_domain = max(1, max_per_domain)
+    days = daterange(start, end)
+    today = date.today()
+    queues = {}
+    results = {}
+    for entry in domains:
+        domain = entry["domain"]
+        queue = queues.setdefault(domain, deque())
+        for day in days:
+            path = bundle_cache_path(cache_dir, domain, day)
+            results[(domain, day)] = path
+            if not refresh and day < today and os.path.exists(path):
+                continue
+            queue.append((bundle_url(domain, entry["domainkey"], day), path, day))
+
+    total = sum(len(q) for q in queues.values())
+    metrics.inc("bundle_fetch_total", len(results) - total, source="bulk", outcome="cached")
+    print(f"Fetching {total} bundles for {len(queues)} domains over {len(days)} days "
+          f"({len(results) - total} already cached)", flush=True)
+
+    session = requests.Session()
+    adapter = HTTPAdapter(pool_connections=max_workers, pool_maxsize=max_workers)
+    session.mount("https://", adapter)
+    session.mount("http://", adapter)
+
+    active = {domain: 0 for domain in queues}
+    rotation = deque(domain for domain, queue in queues.items() if queue)
+    in_flight = {}
+    done = 0
+    with ThreadPoolExecutor(max_workers=max_workers) as executor:
+        while rotation or in_flight:
+            # Hand out work round-robin to domains that still have spare slots
+            skipped = 0
+            while rotation and len(in_flight) < max_workers and skipped < len(rotation):
+                domain = rotation[0]
+                rotation.rotate(-1)
+                if active[domain] >= max_per_domain:
+                    skipped += 1
+                    continue
+                skipped = 0
+                url, path, day = queues[domain].popleft()
+                if not queues[domain]:
+                    rotation.remove(domain)
+                active[domain] += 1
+                in_flight[executor.submit(download_bundle, url, path, session)] = (domain, day)
+
+            finished, _ = wait(list(in_flight), return_when=FIRST_COMPLETED)
+            for future in finished:
+                domain, day = in_flight.pop(future)
+                active[domain] -= 1
+                done += 1
+                try:
+                    future.result()
+                    metrics.inc("bundle_fetch_total", source="bulk", outcome="fetched")
+                    log.info(f"[{done}/{total}] Fetched bundle {domain} {day}", extra={"sample": "bundle_fetched"})
+                except Exception as e:
+                    metrics.inc("bundle_fetch_total", source="bulk", outcome="failed")
+                    log.warning(f"[{done}/{total}] Error fetching bundle {domain} {day}: {str(e)}")
+
+    return [path for path in results.values() if os.path.exists(path)]
+
+
+def iter_error_sessions_from_bundles(paths):
+    """Stream error sessions from several cached bundle files as one merged sequence."""
+    return chain.from_iterable(iter_error_sessions_from_file(path) for path in paths)
@@ -0,0 +1,142 @@
+"""Compare the two-agent crew with the single-call mode on latency, tokens and agreement.
+
+Both modes are run, uncached, on the same errors from a parsed errors file
+(by default the historical rum_errors_by_url_unique_description.json). For
+every error the script records each mode's latency and token usage and how
+closely their analyses and fixed code agree (difflib similarity, 0 to 1).
+Per-error rows and the summary are written to compare_modes.json.
+
+Usage:
+    python3 compare_modes.py [--input errors.json] [--limit 20] [--base-url http://127.0.0.1:8808/v1]
+"""
+import argparse
+import json
+import os
+import statistics
+import time
+from difflib import SequenceMatcher
+from dotenv import load_dotenv
+
+from error_batching import parse_json_answer
+from error_fingerprint import fingerprint_of
+from test_iterate_single_error import JavascriptErrorAgents, error_input_for, hash_url, run_single_call
+
+
+def select_errors(rum_errors_by_url, limit):
+    """(error_key, error) pairs with a location and a context, one per fingerprint, in file order."""
+    selected = []
+    seen = set()
+    for url, errors in rum_errors_by_url.items():
+        for idx, error in enumerate(errors):
+            if error.get("line") is None or error.get("column") is None or not error.get("context_code"):
+                continue
+            fingerprint = fingerprint_of(error)
+            if fingerprint in seen:
+                continue
+            seen.add(fingerprint)
+            selected.append((f"error_{hash_url(url)}_{idx}", error))
+            if len(selected) >= limit:
+                return selected
+    return selected
+
+
+def answer_text(response, fields):
+    """The given fields of a structured agent response joined as text, or the raw response."""
+    answer = parse_json_answer(response)
+    if isinstance(answer, list) and answer and isinstance(answer[0], dict):
+        answer = answer[0]
+    if isinstance(answer, dict):
+        return "\n".join(str(answer.get(field, "")) for field in fields)
+    return response or ""
+
+
+def similarity(a, b):
+    return SequenceMatcher(None, " ".join(a.split()), " ".join(b.split())).ratio()
+
+
+class CrewRunner:
+    """Runs the crew like run_error_crew, also reporting the tokens each run used."""
+
+    def __init__(self, agents):
+        self.agents = agents
+        self.previous_total = 0
+
+    def run(self, error_key, error):
+        error_input = error_input_for(error_key, error)
+        analyze_task = self.agents.analyze_errors_task(error_input)
+        fix_task = self.agents.fix_errors_task(error_input, analyzer_output=analyze_task)
+        result = self.agents.error_crew(analyze_task, fix_task, verbose=False).kickoff()
+        # Usage is summed per agent LLM over its lifetime; reused agents make it cumulative
+        total = getattr(getattr(result, "token_usage", None), "total_tokens", 0) or 0
+        tokens = total - self.previous_total if total >= self.previous_total else total
+        self.previous_total = total
+        agent1_response = analyze_task.output.raw if hasattr(analyze_task.output, 'raw') else str(analyze_task.output)
+        agent2_response = fix_task.output.raw if hasattr(fix_task.output, 'raw') else str(fix_task.output)
+        return agent1_response, agent2_response, tokens
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--input", default="rum_errors_by_url_unique_description.json")
+    parser.add_argument("--limit", type=int, default=20, help="Errors to compare (default: 20)")
+    parser.add_argument("--output", default="compare_modes.json")
+    parser.add_argument("--base-url", help="OpenAI-compatible endpoint, e.g. a local stub_llm_server.py")
+    args = parser.parse_args()
+    if args.base_url:
+        os.environ["OPENAI_BASE_URL"] = args.base_url
+
+    with open(args.input, "r", encoding="utf-8") as f:
+        errors = select_errors(json.load(f), args.limit)
+    load_dotenv()
+    agents = JavascriptErrorAgents(os.environ["OPENAI_API_KEY"])
+    crew = CrewRunner(agents)
+    print(f"Comparing crew and single-call modes on {len(errors)} errors from {args.input}")
+
+    rows = []
+    for number, (error_key, error) in enumerate(errors, 1):
+        row = {"error": error_key, "error_description": error.get("error_description")}
+        try:
+            started = time.perf_counter()
+            crew_analysis, crew_fix, crew_tokens = crew.run(error_key, error)
+            row["crew_seconds"] = time.perf_counter() - started
+            row["crew_tokens"] = crew_tokens
+
+            started = time.perf_counter()
+            single_analysis, single_fix, usage = run_single_call(agents, error_key, error)
+            row["single_call_seconds"] = time.perf_counter() - started
+            row["single_call_tokens"] = usage.get("total_tokens", 0)
+
+            analysis_fields = ("issue", "suggestion")
+            row["analysis_agreement"] = similarity(answer_text(crew_analysis, analysis_fields),
+                                                   answer_text(single_analysis, analysis_fields))
+            row["fixed_code_agreement"] = similarity(answer_text(crew_fix, ("fixed_code",)),
+                                                     answer_text(single_fix, ("fixed_code",)))
+            print(f"✅ {number}/{len(errors)} crew {row['crew_seconds']:.1f}s/{crew_tokens} tokens, "
+                  f"single-call {row['single_call_seconds']:.1f}s/{row['single_call_tokens']} tokens, "
+                  f"agreement {row['analysis_agreement']:.2f} analysis / {row['fixed_code_agreement']:.2f} code")
+        except Exception as e:
+            row["failure"] = f"{type(e).__name__}: {str(e)}"
+            print(f"❌ {number}/{len(errors)} {row['failure']}")
+        rows.append(row)
+
+    completed = [row for row in rows if "failure" not in row]
+    summary = {"errors": len(rows), "compared": len(completed)}
+    for field in ("crew_seconds", "single_call_seconds", "crew_tokens", "single_call_tokens",
+                  "analysis_agreement", "fixed_code_agreement"):
+        values = [row[field] for row in completed]
+        summary[f"mean_{field}"] = statistics.mean(values) if values else None
+    with open(args.output, "w", encoding="utf-8") as f:
+        json.dump({"summary": summary, "errors": rows}, f, indent=2)
+
+    print(f"\n📊 Compared {summary['compared']}/{summary['errors']} errors (details in {args.output})")
+    if completed:
+        print(f"   - Latency per error: crew {summary['mean_crew_seconds']:.2f}s, "
+              f"single-call {summary['mean_single_call_seconds']:.2f}s")
+        print(f"   - Tokens per error: crew {summary['mean_crew_tokens']:.0f}, "
+              f"single-call {summary['mean_single_call_tokens']:.0f}")
+        print(f"   - Agreement: analysis {summary['mean_analysis_agreement']:.2f}, "
+              f"fixed code {summary['mean_fixed_code_agreement']:.2f}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,176 @@
+import re
+
+# Tokenizer of the model the agents run on (see JavascriptErrorAgents)
+TOKENIZER_MODEL = "gpt-4o"
+DEFAULT_CONTEXT_TOKEN_BUDGET = 1500
+MAX_CONTEXT_RADIUS = 30
+MAX_LINE_CHARS = 400
+MIN_ERROR_LINE_CHARS = 40
+ELLIPSIS = "…"
+
+_PIECES = re.compile(r"[A-Za-z_$]+|\d+|\s+|.", re.DOTALL)
+_encoder = None
+_encoder_loaded = False
+
+
+def _get_encoder():
+    global _encoder, _encoder_loaded
+    if not _encoder_loaded:
+        try:
+            import tiktoken
+            _encoder = tiktoken.encoding_for_model(TOKENIZER_MODEL)
+        except Exception:
+            # tiktoken missing, or its BPE file cannot be downloaded: fall back to the estimator
+            _encoder = None
+        _encoder_loaded = True
+    return _encoder
+
+
+def estimate_tokens(text):
+    """Conservative BPE token estimate for JavaScript source.
+
+    Identifiers count one token per 4 characters, numbers one per 3, every
+    punctuation character one, and whitespace runs one when they contain a
+    newline or indentation. Real tokenizers merge common punctuation pairs, so
+    this over-counts slightly, which keeps budgets safe.
+    """
+    tokens = 0
+    for match in _PIECES.finditer(text):
+        piece = match.group()
+        first = piece[0]
+        if first.isspace():
+            if "\n" in piece or len(piece) > 1:
+                tokens += 1
+        elif first.isdigit():
+            tokens += (len(piece) + 2) // 3
+        elif first.isalpha() or first in "_$":
+            tokens += (len(piece) + 3) // 4
+        else:
+            tokens += 1
+    return tokens
+
+
+def count_tokens(text):
+    """Token count of text for TOKENIZER_MODEL (tiktoken when available, else estimate_tokens)."""
+    if not text:
+        return 0
+    encoder = _get_encoder()
+    if encoder is not None:
+        return len(encoder.encode(text, disallowed_special=()))
+    return estimate_tokens(text)
+
+
+def crop_line(text, column, max_chars):
+    """Crop text to at most max_chars characters centred on column, marking cut ends with an ellipsis."""
+    if len(text) <= max_chars:
+        return text
+    column = min(max(column or 0, 0), len(text))
+    start = max(0, min(column - max_chars // 2, len(text) - max_chars))
+    end = start + max_chars
+    return (ELLIPSIS if start > 0 else "") + text[start:end] + (ELLIPSIS if end < len(text) else "")
+
+
+def build_context_window(source, line_index, column, token_budget=DEFAULT_CONTEXT_TOKEN_BUDGET,
+                         max_radius=MAX_CONTEXT_RADIUS, max_line_chars=MAX_LINE_CHARS):
+    """Largest window of lines around line_index (0-based) whose text fits token_budget.
+
+    The error line is always included; when it is too long (typically minified
+    code) it is cropped around the error column until it fits. Neighbouring lines
+    are then added alternately above and below, each cropped to max_line_chars,
+    for as long as they fit and stay within max_radius of the error line.
+    """
+    if line_index < 0 or line_index >= source.line_count:
+        return {"context_code": "", "max_tokens": 0, "context_tokens": 0,
+                "context_start_line": None, "context_end_line": None}
+
+    error_line = source.line(line_index)
+    max_chars = max_line_chars
+    cropped = crop_line(error_line, column, max_chars)
+    while count_tokens(cropped) > token_budget and max_chars > MIN_ERROR_LINE_CHARS:
+        max_chars = max(MIN_ERROR_LINE_CHARS, max_chars // 2)
+        cropped = crop_line(error_line, column, max_chars)
+
+    lines = {line_index: cropped}
+    total = count_tokens(cropped)
+
+    def candidate(index):
+        if abs(index - line_index) > max_radius or not 0 <= index < source.line_count:
+            return None, None
+        text = crop_line(source.line(index), 0, max_line_chars)
+        # One extra token for the newline joining the line to the window
+        return text, count_tokens(text) + 1
+
+    above, below = line_index - 1, line_index + 1
+    grow_above = grow_below = True
+    while grow_above or grow_below:
+        if grow_above:
+            text, cost = candidate(above)
+            grow_above = text is not None and total + cost <= token_budget
+            if grow_above:
+                lines[above] = text
+                total += cost
+                above -= 1
+        if grow_below:
+            text, cost = candidate(below)
+            grow_below = text is not None and total + cost <= token_budget
+            if grow_below:
+                lines[below] = text
+                total += cost
+                below += 1
+
+    # Per-line counts only approximate the joined text; trim the far ends until it truly fits
+    start, end = above + 1, below - 1
+    context_code = "\n".join(lines[i] for i in range(start, end + 1))
+    context_tokens = count_tokens(context_code)
+    while context_tokens > token_budget and start < end:
+        if line_index - start >= end - line_index:
+            start += 1
+        else:
+            end -= 1
+        context_code = "\n".join(lines[i] for i in range(start, end + 1))
+        context_tokens = count_tokens(context_code)
+
+    return {
+        "context_code": context_code,
+        "max_tokens": max(len(lines[i].split()) for i in range(start, end + 1)),
+        "context_tokens": context_tokens,
+        "context_start_line": start + 1,
+        "context_end_line": end + 1,
+    }
+
+
+def build_scope_context(source, line_index, column, token_budget=DEFAULT_CONTEXT_TOKEN_BUDGET,
+                        max_radius=MAX_CONTEXT_RADIUS, max_line_chars=MAX_LINE_CHARS):
+    """Context made of the smallest function, method or class enclosing the error.
+
+    The script's symbol index is built once and shared by every error in it.
+    Falls back to build_context_window when the error is at top level or the
+    enclosing scope does not fit token_budget.
+    """
+    scope = None
+    if 0 <= line_index < source.line_count:
+        scope = source.symbol_index.enclosing(source.offset_of(line_index, column))
+    if scope is not None:
+        start_line = source.line_of(scope.start)
+        end_line = source.line_of(max(scope.start, scope.end - 1))
+        if start_line == end_line:
+            # Minified code: the scope is a slice of one long line
+            scope_lines = [source.decode(source.content[scope.start:scope.end])]
+        else:
+            scope_lines = source.lines(start_line, end_line + 1)
+        if len(scope_lines) == 1 or all(len(line) <= max_line_chars for line in scope_lines):
+            context_code = "\n".join(scope_lines)
+            context_tokens = count_tokens(context_code)
+            if context_tokens <= token_budget:
+                return {
+                    "context_code": context_code,
+                    "max_tokens": max(len(line.split()) for line in scope_lines),
+                    "context_tokens": context_tokens,
+                    "context_start_line": start_line + 1,
+                    "context_end_line": end_line + 1,
+                    "context_scope": {"kind": scope.kind, "name": scope.name},
+                }
+
+    context = build_context_window(source, line_index, column, token_budget, max_radius, max_line_chars)
+    context["context_scope"] = None
+    return context
@@ -0,0 +1,216 @@
+import re
+from bisect import bisect_right
+
+from context_budget import count_tokens
+from js_symbol_index import SymbolIndex
+
+# A function body shorter than this is cheaper to keep than to replace with a marker
+MIN_ELIDED_BODY_LINES = 3
+
+_IMPORT_START = re.compile(r"^\s*import\b(?!\s*\()")
+_IMPORT_COMPLETE = re.compile(r"""\bfrom\s*['"][^'"]*['"]|^\s*import\s*['"]""")
+_IDENTIFIER = re.compile(r"[A-Za-z_$][\w$]*")
+
+
+def comment_lines(lines, protected):
+    """Lines holding nothing but a comment: license headers, doc blocks, eslint directives."""
+    elided = set()
+    block = None
+    for i, line in enumerate(lines):
+        stripped = line.strip()
+        if block is not None:
+            block.append(i)
+            if "*/" in stripped:
+                # Only when no code follows the end of the comment on its last line
+                if stripped.endswith("*/"):
+                    elided.update(block)
+                block = None
+        elif stripped.startswith("//"):
+            elided.add(i)
+        elif stripped.startswith("/*"):
+            if "*/" not in stripped[2:]:
+                block = [i]
+            elif stripped.endswith("*/") and stripped.index("*/", 2) == len(stripped) - 2:
+                elided.add(i)
+    return elided - protected
+
+
+def blank_lines(lines, protected):
+    return {i for i, line in enumerate(lines) if not line.strip()} - protected
+
+
+def _import_statements(lines):
+    """(first, last, text) of every static import statement, multi-line ones included."""
+    i = 0
+    while i < len(lines):
+        if not _IMPORT_START.match(lines[i]):
+            i += 1
+            continue
+        j = i
+        text = lines[i]
+        while not (_IMPORT_COMPLETE.search(text) or text.rstrip().endswith(";")) and j + 1 < len(lines):
+            j += 1
+            text += "\n" + lines[j]
+        yield i, j, text
+        i = j + 1
+
+
+def _imported_names(statement):
+    """Local bindings of an import statement (`a as b` binds b, `* as ns` binds ns)."""
+    clause = re.split(r"\bfrom\s*['\"]", statement, maxsplit=1)[0]
+    clause = re.sub(r"^\s*import\s+(?:type\s+)?", "", clause)
+    if clause.lstrip().startswith(("'", '"')):
+        # Side-effect import such as `import './styles.css'`: binds nothing
+        return []
+    names = []
+    renaming = False
+    for name in _IDENTIFIER.findall(clause):
+        if name == "as":
+            renaming = True
+            continue
+        if renaming and names and names[-1] != "*":
+            names.pop()
+        renaming = False
+        names.append(name)
+    return names
+
+
+def unused_import_lines(lines, protected):
+    """Import statements none of whose bindings are used by the rest of the context."""
+    statements = list(_import_statements(lines))
+    if not statements:
+        return set()
+    in_import = set()
+    for first, last, _ in statements:
+        in_import.update(range(first, last + 1))
+    body = "\n".join(line for i, line in enumerate(lines) if i not in in_import)
+    used = set(_IDENTIFIER.findall(body))
+    elided = set()
+    for first, last, text in statements:
+        if not any(name in used for name in _imported_names(text)):
+            elided.update(range(first, last + 1))
+    return elided - protected
+
+
+def sibling_function_lines(lines, protected):
+    """Bodies of functions, methods and classes that neither contain an error line nor are named on one."""
+    content = "\n".join(lines).encode("utf-8")
+    line_starts = [0]
+    for line in lines[:-1]:
+        line_starts.append(line_starts[-1] + len(line.encode("utf-8")) + 1)
+    referenced = set()
+    for i in protected:
+        referenced.update(_IDENTIFIER.findall(lines[i]))
+
+    elided = set()
+    covered_until = -1
+    for scope in SymbolIndex(content).scopes:
+        first = bisect_right(line_starts, scope.start) - 1
+        last = bisect_right(line_starts, max(scope.start, scope.end - 1)) - 1
+        if first <= covered_until:
+            continue
+        if any(first <= i <= last for i in protected) or (scope.name and scope.name in referenced):
+            continue
+        if last - first - 1 < MIN_ELIDED_BODY_LINES:
+            continue
+        # Keep the header and closing lines so the signature stays visible
+        elided.update(range(first + 1, last))
+        covered_until = last
+    return elided - protected
+
+
+COMPRESSION_PASSES = {
+    "comments": comment_lines,
+    "blank": blank_lines,
+    "imports": unused_import_lines,
+    "siblings": sibling_function_lines,
+}
+DEFAULT_PASSES = tuple(COMPRESSION_PASSES)
+
+
+def resolve_passes(spec):
+    """Pass names from a CLI value: "all", "none" or a comma-separated list of COMPRESSION_PASSES keys."""
+    if spec in (None, "", "all"):
+        return DEFAULT_PASSES
+    if spec == "none":
+        return ()
+    names = tuple(name.strip() for name in spec.split(",") if name.strip())
+    unknown = [name for name in names if name not in COMPRESSION_PASSES]
+    if unknown:
+        raise ValueError(f"Unknown compression pass(es): {', '.join(unknown)} "
+                         f"(available: {', '.join(COMPRESSION_PASSES)})")
+    return names
+
+
+def _marker(lines, first, last, start_line):
+    indent = next((line[:len(line) - len(line.lstrip())] for line in lines[first:last + 1] if line.strip()), "")
+    if start_line is None:
+        return f"{indent}/* … {last - first + 1} lines omitted … */"
+    if first == last:
+        return f"{indent}/* … line {start_line + first} omitted … */"
+    return f"{indent}/* … lines {start_line + first}-{start_line + last} omitted … */"
+
+
+def compress_context(context_code, start_line, keep_lines, passes=DEFAULT_PASSES):
+    """Run the compression passes over a code context.
+
+    keep_lines are the 1-based script line numbers (usually the error lines)
+    that stay verbatim. Every run of removed lines becomes one marker comment
+    naming the script lines it replaces, so the remaining lines keep their
+    numbering; a run is only replaced when the marker is cheaper in tokens.
+    Returns (compressed_code, report) with tokens before/after/saved and the
+    number of lines elided.
+    """
+    lines = context_code.split("\n")
+    protected = {line - start_line for line in keep_lines if 0 <= line - start_line < len(lines)}
+    elided = set()
+    for name in passes:
+        elided |= COMPRESSION_PASSES[name](lines, protected)
+
+    output = []
+    lines_elided = 0
+    i = 0
+    while i < len(lines):
+        if i not in elided:
+            output.append(lines[i])
+            i += 1
+            continue
+        j = i
+        while j + 1 < len(lines) and j + 1 in elided:
+            j += 1
+        marker = _marker(lines, i, j, start_line)
+        if count_tokens(marker) < count_tokens("\n".join(lines[i:j + 1])):
+            output.append(marker)
+            lines_elided += j - i + 1
+        else:
+            output.extend(lines[i:j + 1])
+        i = j + 1
+
+    compressed = "\n".join(output)
+    tokens_before = count_tokens(context_code)
+    tokens_after = count_tokens(compressed) if lines_elided else tokens_before
+    return compressed if lines_elided else context_code, {
+        "tokens_before": tokens_before,
+        "tokens_after": tokens_after,
+        "tokens_saved": tokens_before - tokens_after,
+        "lines_elided": lines_elided,
+    }
+
+
+def compress_error(error, passes=DEFAULT_PASSES):
+    """Copy of a parsed error with its context compressed, and the report; (error, None) when not applicable.
+
+    Needs the context's line range to locate the error line; single-line
+    contexts (slices of minified code) are left alone.
+    """
+    code = error.get("context_code")
+    start = error.get("context_start_line")
+    end = error.get("context_end_line")
+    line = error.get("line")
+    if not passes or not code or start is None or end is None or line is None or end <= start:
+        return error, None
+    compressed, report = compress_context(code, start, {line}, passes)
+    compressed_error = dict(error)
+    compressed_error["context_code"] = compressed
+    compressed_error["context_tokens"] = report["tokens_after"]
+    return compressed_error, report
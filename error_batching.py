@@ -0,0 +1,135 @@
+import ast
+import json
+import re
+
+from context_budget import count_tokens
+
+DEFAULT_BATCH_SIZE = 6
+DEFAULT_BATCH_CONTEXT_TOKENS = 3000
+
+_CODE_FENCE = re.compile(r"```(?:json|javascript|js)?")
+
+
+def _context_range(error):
+    """(first, last) 1-based script lines of error's context, or None if it cannot be merged by line.
+
+    Contexts of a single line may be a slice of a long minified line rather
+    than the whole line, and old records carry no range at all; both only
+    group with contexts identical to their own.
+    """
+    start = error.get("context_start_line")
+    end = error.get("context_end_line")
+    if not error.get("context_code") or start is None or end is None or end <= start:
+        return None
+    return start, end
+
+
+def _merged_lines(errors):
+    lines = {}
+    for error in errors:
+        start = error["context_start_line"]
+        for offset, text in enumerate(error["context_code"].split("\n")):
+            lines.setdefault(start + offset, text)
+    # A long error line is cropped around the error column in its own context; keep that version
+    for error in errors:
+        own = error["context_code"].split("\n")
+        index = (error.get("line") or 0) - error["context_start_line"]
+        if 0 <= index < len(own):
+            lines[error["line"]] = own[index]
+    return lines
+
+
+def merge_contexts(errors):
+    """(context_code, context_start_line) covering the contexts of every error in a group."""
+    first = errors[0]
+    if all(error.get("context_code") == first.get("context_code") for error in errors):
+        return first.get("context_code") or "", first.get("context_start_line")
+    lines = _merged_lines(errors)
+    start, end = min(lines), max(lines)
+    return "\n".join(lines[n] for n in range(start, end + 1)), start
+
+
+def group_errors(items, max_batch_size=DEFAULT_BATCH_SIZE, max_context_tokens=DEFAULT_BATCH_CONTEXT_TOKENS):
+    """Group (url, idx, error_key, error) items whose errors can share one code context.
+
+    Errors are grouped per script (code_link). Within a script, errors with the
+    same context form one unit, and units whose line ranges overlap or touch
+    are merged as long as the group stays within max_batch_size errors and its
+    merged context within max_context_tokens. Groups come back ordered by the
+    position of their first item.
+    """
+    position = {id(item): i for i, item in enumerate(items)}
+    by_script = {}
+    for item in items:
+        error = item[3]
+        script = by_script.setdefault(error.get("code_link"), {})
+        script.setdefault(error.get("context_code"), []).append(item)
+
+    groups = []
+    for units in by_script.values():
+        mergeable = []
+        for unit in units.values():
+            if _context_range(unit[0][3]) is None:
+                groups.extend(unit[i:i + max_batch_size] for i in range(0, len(unit), max_batch_size))
+            else:
+                mergeable.append(unit)
+        mergeable.sort(key=lambda unit: _context_range(unit[0][3]))
+
+        current, current_end = [], None
+        for unit in mergeable:
+            start, end = _context_range(unit[0][3])
+            candidate = current + unit
+            fits = (
+                current
+                and start <= current_end + 1
+                and len(candidate) <= max_batch_size
+                and count_tokens(merge_contexts([item[3] for item in candidate])[0]) <= max_context_tokens
+            )
+            if fits:
+                current, current_end = candidate, max(current_end, end)
+                continue
+            if current:
+                groups.append(current)
+            # A unit larger than a batch is split; the rest starts the next group
+            while len(unit) > max_batch_size:
+                groups.append(unit[:max_batch_size])
+                unit = unit[max_batch_size:]
+            current, current_end = unit, end
+        if current:
+            groups.append(current)
+
+    for group in groups:
+        group.sort(key=lambda item: position[id(item)])
+    groups.sort(key=lambda group: position[id(group[0])])
+    return groups
+
+
+def parse_json_answer(text):
+    """The JSON (or Python-literal) object or list in a model answer, optionally fenced; None if there is none."""
+    if not text:
+        return None
+    cleaned = _CODE_FENCE.sub("", text)
+    first = min((i for i in (cleaned.find("{"), cleaned.find("[")) if i != -1), default=-1)
+    last = max(cleaned.rfind("}"), cleaned.rfind("]"))
+    if first == -1 or last < first:
+        return None
+    blob = cleaned[first:last + 1]
+    for loader in (json.loads, ast.literal_eval):
+        try:
+            return loader(blob)
+        except (ValueError, SyntaxError, TypeError, MemoryError, RecursionError):
+            continue
+    return None
+
+
+def parse_keyed_response(text):
+    """Parse a model answer holding one object keyed by error id; {} if it cannot be read.
+
+    Also accepts a list of entries that each carry their id under "error".
+    """
+    data = parse_json_answer(text)
+    if isinstance(data, list):
+        data = {entry["error"]: entry for entry in data if isinstance(entry, dict) and "error" in entry}
+    if not isinstance(data, dict):
+        return {}
+    return {key: value for key, value in data.items() if isinstance(value, dict)}
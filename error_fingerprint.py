@@ -0,0 +1,59 @@
+import hashlib
+import re
+
+_WHITESPACE = re.compile(r"\s+")
+
+
+def normalize_description(description):
+    """Normalize an error description the same way for every page it was seen on."""
+    if not isinstance(description, str):
+        return description
+    return _WHITESPACE.sub(" ", description.strip().lower())
+
+
+def error_fingerprint(error_description, code_link, line, column):
+    """Stable identifier for "the same error" across pages, sessions and runs."""
+    key = "\x1f".join([
+        str(normalize_description(error_description)),
+        code_link or "",
+        "" if line is None else str(line),
+        "" if column is None else str(column),
+    ])
+    return hashlib.sha1(key.encode("utf-8")).hexdigest()[:16]
+
+
+def fingerprint_of(error_info):
+    """Fingerprint of a parsed error record, computing it for older records that lack one."""
+    return error_info.get("fingerprint") or error_fingerprint(
+        error_info.get("error_description"),
+        error_info.get("code_link"),
+        error_info.get("line"),
+        error_info.get("column"),
+    )
+
+
+def add_occurrence(error_fingerprints, error_info, url):
+    """Record one occurrence of error_info on url in the per-fingerprint aggregates.
+
+    Returns True the first time a fingerprint is seen.
+    """
+    fingerprint = fingerprint_of(error_info)
+    aggregate = error_fingerprints.get(fingerprint)
+    is_new = aggregate is None
+    if is_new:
+        aggregate = error_fingerprints[fingerprint] = {
+            "fingerprint": fingerprint,
+            "error_description": error_info.get("error_description"),
+            "code_link": error_info.get("code_link"),
+            "line": error_info.get("line"),
+            "column": error_info.get("column"),
+            "occurrences": 0,
+            "urls": {},
+            "user_agents": {},
+        }
+    aggregate["occurrences"] += 1
+    aggregate["urls"][url] = aggregate["urls"].get(url, 0) + 1
+    user_agent = error_info.get("user_agent")
+    if user_agent:
+        aggregate["user_agents"][user_agent] = aggregate["user_agents"].get(user_agent, 0) + 1
+    return is_new
@@ -1,13 +1,222 @@
+import argparse
+import asyncio
+import functools
 import json
 import time
-from playwright.sync_api import sync_playwright, ConsoleMessage
-from typing import Dict, List, Any, Optional
+from typing import TYPE_CHECKING, Dict, List, Any, Optional
 import os
 from datetime import datetime
 import re
+from concurrent.futures import ProcessPoolExecutor, as_completed
+
+from browser_routing import DEFAULT_ROUTING_PROFILE, ROUTING_PROFILES, RoutingProfile, error_script_hosts
+from metrics import add_arguments as add_metrics_arguments, configure_from_args, export_from_args, get_logger, metrics
+import profiling
+
+log = get_logger("browser")
+
+if TYPE_CHECKING:
+    from playwright.sync_api import ConsoleMessage
+
+USER_AGENT = 'Mozilla/5.0 (Macintosh; Intel Mac OS X 10_15_7) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/136.0.0.0 Safari/537.36'
+BROWSER_ARGS = ['--disable-blink-features=AutomationControlled']
+CONTEXT_OPTIONS = {
+    'viewport': {'width': 1280, 'height': 720},
+    'user_agent': USER_AGENT,
+    'ignore_https_errors': True
+}
+NAVIGATION_TIMEOUT_MS = 60000
+# Answer for requests the routing profile blocks. Aborting them would log a
+# "Failed to load resource" console error per request, the very network noise
+# blocking is meant to remove.
+BLOCKED_RESPONSE = {'status': 204, 'body': ''}
+# A page has settled once it has been quiet this long, or after SETTLE_MAX_MS at the latest
+SETTLE_QUIET_MS = 500
+SETTLE_MAX_MS = 15000
+# Open requests tolerated while quiet, for pages that keep a long-polling or streaming connection
+SETTLE_MAX_INFLIGHT = 0
+SETTLE_POLL_MS = 100
+# Long tasks and errors seen by the page so far; a change in either counts as activity
+ACTIVITY_PROBE = "[(window.__allErrors || []).length, window.__longTaskCount || 0]"
+CAPTURED_PREFIX = 'JS_ERROR_CAPTURED:'
+# Error source patterns from the RUM data and the interaction that reproduces them
+SIMULATIONS = (
+    ("HTMLButtonElement", "_simulate_button_clicks"),
+    ("a._onFocus", "_simulate_focus_events"),
+    ("a._onInvalid", "_simulate_form_validation"),
+    ("Object.handleValueChange", "_simulate_input_changes"),
+    ("nn._initializeBackDrop", "_simulate_modal_interactions"),
+)
+
+# Injected into every page before its own scripts run
+ERROR_CAPTURE_SCRIPT = """
+    // Store all types of errors
+    window.__allErrors = [];
+    window.__jsErrors = [];
+    
+    // Capture error events
+    window.addEventListener('error', function(event) {
+        const errorInfo = {
+            type: 'error_event',
+            message: event.message,
+            filename: event.filename,
+            lineno: event.lineno,
+            colno: event.colno,
+            stack: event.error ? event.error.stack : 'No stack trace',
+            timestamp: new Date().toISOString(),
+            error: event.error
+        };
+        window.__allErrors.push(errorInfo);
+        
+        // Check if it's a real JS error
+        if (event.error && event.error.stack && !event.message.includes('[Report Only]')) {
+            window.__jsErrors.push(errorInfo);
+            console.error('JS_ERROR_CAPTURED:', JSON.stringify(errorInfo));
+        }
+    }, true);
+    
+    // Capture unhandled promise rejections
+    window.addEventListener('unhandledrejection', function(event) {
+        const errorInfo = {
+            type: 'unhandled_rejection',
+            message: event.reason ? event.reason.toString() : 'Unhandled Promise Rejection',
+            stack: event.reason && event.reason.stack ? event.reason.stack : 'No stack trace',
+            timestamp: new Date().toISOString()
+        };
+        window.__allErrors.push(errorInfo);
+        window.__jsErrors.push(errorInfo);
+        console.error('JS_ERROR_CAPTURED:', JSON.stringify(errorInfo));
+    }, true);
+    
+    // Count main-thread tasks over 50ms, so settle detection sees the page is still busy
+    window.__longTaskCount = 0;
+    try {
+        new PerformanceObserver(function(list) {
+            window.__longTaskCount += list.getEntries().length;
+        }).observe({type: 'longtask', buffered: true});
+    } catch (e) {}
+    
+    // Monitor console.error calls
+    const originalConsoleError = console.error;
+    console.error = function(...args) {
+        const errorInfo = {
+            type: 'console_error_direct',
+            message: args.join(' '),
+            timestamp: new Date().toISOString()
+        };
+        window.__allErrors.push(errorInfo);
+        originalConsoleError.apply(console, args);
+    };
+"""
+
+
+class SettleMonitor:
+    """Tells when a page has settled: no requests in flight, no new long tasks and no new captured errors.
+
+    wait() (sync pages) and wait_async() (async pages) poll the page until it
+    has been quiet for quiet_ms, or give up after max_ms, and return the
+    seconds waited and whether the page went quiet. waited, waits and
+    timeouts add up every wait since the monitor was created or reset().
+    """
+
+    def __init__(self, page, quiet_ms: int = SETTLE_QUIET_MS, max_ms: int = SETTLE_MAX_MS,
+                 max_inflight: int = SETTLE_MAX_INFLIGHT):
+        self.page = page
+        self.quiet_seconds = quiet_ms / 1000
+        self.max_seconds = max_ms / 1000
+        self.max_inflight = max_inflight
+        self.inflight = set()
+        self.last_activity = time.monotonic()
+        self.last_counts = None
+        self.waited = 0.0
+        self.waits = 0
+        self.timeouts = 0
+        page.on("request", self._on_request)
+        page.on("requestfinished", self._on_request_done)
+        page.on("requestfailed", self._on_request_done)
+
+    def _on_request(self, request):
+        self.inflight.add(request)
+        self.last_activity = time.monotonic()
+
+    def _on_request_done(self, request):
+        self.inflight.discard(request)
+        self.last_activity = time.monotonic()
+
+    def reset(self):
+        """Forget the previous page's requests and wait times before the next navigation."""
+        self.inflight.clear()
+        self.last_counts = None
+        self.waited = 0.0
+        self.waits = 0
+        self.timeouts = 0
+
+    def _check(self, started: float, counts) -> Optional[str]:
+        """'quiet' or 'max' once the wait is over, None to keep polling."""
+        now = time.monotonic()
+        if counts != self.last_counts or len(self.inflight) > self.max_inflight:
+            self.last_counts = counts
+            self.last_activity = now
+        if now - max(self.last_activity, started) >= self.quiet_seconds:
+            return "quiet"
+        if now - started >= self.max_seconds:
+            return "max"
+        return None
+
+    def _finish(self, started: float, outcome: str):
+        waited = time.monotonic() - started
+        self.waited += waited
+        self.waits += 1
+        self.timeouts += outcome == "max"
+        metrics.observe("settle_wait_seconds", waited, outcome=outcome)
+        return waited, outcome == "quiet"
+
+    def wait(self):
+        started = time.monotonic()
+        while True:
+            try:
+                counts = self.page.evaluate(ACTIVITY_PROBE)
+            except Exception:
+                counts = None  # navigating or closed: nothing to compare
+            outcome = self._check(started, counts)
+            if outcome:
+                return self._finish(started, outcome)
+            # Unlike time.sleep, this lets Playwright deliver the request and console events
+            self.page.wait_for_timeout(SETTLE_POLL_MS)
+
+    async def wait_async(self):
+        started = time.monotonic()
+        while True:
+            try:
+                counts = await self.page.evaluate(ACTIVITY_PROBE)
+            except Exception:
+                counts = None
+            outcome = self._check(started, counts)
+            if outcome:
+                return self._finish(started, outcome)
+            await asyncio.sleep(SETTLE_POLL_MS / 1000)
+
+    def timings(self, load_seconds: float) -> Dict[str, Any]:
+        return {
+            "load_seconds": round(load_seconds, 3),
+            "settle_seconds": round(self.waited, 3),
+            "settle_waits": self.waits,
+            "settle_timeouts": self.timeouts
+        }
+
+
+def _json_values(args):
+    """JSON values of a console message's arguments, skipping those that can't be serialized."""
+    for arg in args:
+        try:
+            yield arg.json_value()
+        except:
+            continue
+
 
 class DiagnosticErrorCollector:
-    def __init__(self):
+    def __init__(self, quiet_ms: int = SETTLE_QUIET_MS, max_settle_ms: int = SETTLE_MAX_MS,
+                 max_inflight: int = SETTLE_MAX_INFLIGHT, routing: str = DEFAULT_ROUTING_PROFILE):
         self.playwright = None
         self.browser = None
         self.context = None
@@ -16,91 +225,72 @@ class DiagnosticErrorCollector:
         self.all_errors = {}  # Store ALL errors before filtering
         self.filtered_errors = {}  # Store what was filtered out
         self.rum_errors = None
+        self.settle_options = {'quiet_ms': quiet_ms, 'max_ms': max_settle_ms, 'max_inflight': max_inflight}
+        self.settle_monitor = None
+        self.page_timings = {}  # Load and settle time per URL
+        self.routing = ROUTING_PROFILES[routing]
+        self.blocked_requests = {}  # Requests blocked by the routing profile per URL, until its timings are recorded
+        self.current_url = None
+        self.current_script_hosts = frozenset()
         self.stats = {
             'total_console_errors': 0,
             'total_page_errors': 0,
             'csp_violations': 0,
             'network_errors': 0,
             'javascript_errors': 0,
-            'filtered_out': 0
+            'filtered_out': 0,
+            'blocked_requests': 0
         }
 
     def start_browser(self, headless=True):
         """Initialize the browser."""
+        # Playwright is only loaded when a browser is actually needed
+        from playwright.sync_api import sync_playwright
         print(f"Starting browser in {'headless' if headless else 'headful'} mode...")
         self.playwright = sync_playwright().start()
         self.browser = self.playwright.chromium.launch(
             headless=headless,
             slow_mo=0 if headless else 300,  # Slow down in headful mode
-            args=['--disable-blink-features=AutomationControlled']
-        )
-        self.context = self.browser.new_context(
-            viewport={'width': 1280, 'height': 720},
-            user_agent='Mozilla/5.0 (Macintosh; Intel Mac OS X 10_15_7) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/136.0.0.0 Safari/537.36',
-            ignore_https_errors=True
+            args=BROWSER_ARGS
         )
+        self.context = self.browser.new_context(**CONTEXT_OPTIONS)
         
         # Inject comprehensive error capturing script
-        self.context.add_init_script("""
-            // Store all types of errors
-            window.__allErrors = [];
-            window.__jsErrors = [];
-            
-            // Capture error events
-            window.addEventListener('error', function(event) {
-                const errorInfo = {
-                    type: 'error_event',
-                    message: event.message,
-                    filename: event.filename,
-                    lineno: event.lineno,
-                    colno: event.colno,
-                    stack: event.error ? event.error.stack : 'No stack trace',
-                    timestamp: new Date().toISOString(),
-                    error: event.error
-                };
-                window.__allErrors.push(errorInfo);
-                
-                // Check if it's a real JS error
-                if (event.error && event.error.stack && !event.message.includes('[Report Only]')) {
-                    window.__jsErrors.push(errorInfo);
-                    console.error('JS_ERROR_CAPTURED:', JSON.stringify(errorInfo));
-                }
-            }, true);
-            
-            // Capture unhandled promise rejections
-            window.addEventListener('unhandledrejection', function(event) {
-                const errorInfo = {
-                    type: 'unhandled_rejection',
-                    message: event.reason ? event.reason.toString() : 'Unhandled Promise Rejection',
-                    stack: event.reason && event.reason.stack ? event.reason.stack : 'No stack trace',
-                    timestamp: new Date().toISOString()
-                };
-                window.__allErrors.push(errorInfo);
-                window.__jsErrors.push(errorInfo);
-                console.error('JS_ERROR_CAPTURED:', JSON.stringify(errorInfo));
-            }, true);
-            
-            // Monitor console.error calls
-            const originalConsoleError = console.error;
-            console.error = function(...args) {
-                const errorInfo = {
-                    type: 'console_error_direct',
-                    message: args.join(' '),
-                    timestamp: new Date().toISOString()
-                };
-                window.__allErrors.push(errorInfo);
-                originalConsoleError.apply(console, args);
-            };
-        """)
+        self.context.add_init_script(ERROR_CAPTURE_SCRIPT)
+
+        if self.routing.enabled:
+            self.context.route("**/*", self._route_request)
+        print(f"Routing profile: {self.routing.name}")
         
         self.page = self.context.new_page()
         print("Browser started.")
 
+    def _route_request(self, route):
+        if self._block_reason(self.current_url, route.request, self.current_script_hosts):
+            route.fulfill(**BLOCKED_RESPONSE)
+        else:
+            route.continue_()
+
+    def _block_reason(self, url: str, request, allowed_script_hosts) -> Optional[str]:
+        """Why the routing profile blocks this request of the page at url (None to load it), counted per URL."""
+        try:
+            main_document = request.is_navigation_request() and request.frame.parent_frame is None
+        except Exception:
+            main_document = True  # e.g. service worker requests have no frame; let them through
+        reason = self.routing.block_reason(request.resource_type, request.url, url, allowed_script_hosts,
+                                           main_document)
+        if reason:
+            self.stats['blocked_requests'] += 1
+            self.blocked_requests[url] = self.blocked_requests.get(url, 0) + 1
+            metrics.inc("blocked_requests_total", reason=reason)
+        return reason
+
     def setup_error_listeners(self):
         """Set up event listeners for console errors and page errors."""
         print("Setting up error listeners...")
         self.page.on("console", self._handle_console_msg)
         self.page.on("pageerror", self._handle_page_error)
+        self.settle_monitor = SettleMonitor(self.page, **self.settle_options)
         print("Error listeners set up.")
 
     def _categorize_error(self, message: str, stack_trace: str = "") -> str:
@@ -120,93 +310,104 @@ class DiagnosticErrorCollector:
         else:
             return 'other'
 
-    def _handle_console_msg(self, msg: ConsoleMessage):
+    def _handle_console_msg(self, msg: "ConsoleMessage"):
         """Handle console messages and capture error details."""
         if msg.type == "error":
-            self.stats['total_console_errors'] += 1
-            message_text = msg.text
-            
-            # Special handling for our captured errors
-            if message_text.startswith('JS_ERROR_CAPTURED:'):
-                try:
-                    error_data = json.loads(message_text.replace('JS_ERROR_CAPTURED:', '').strip())
-                    self._store_error(error_data, filtered=False)
-                    print(f"  ✓ Captured JavaScript error: {error_data.get('message', '')[:80]}...")
-                    return
-                except:
-                    pass
-            
-            # Categorize the error
-            error_category = self._categorize_error(message_text)
-            
-            # Update stats
-            if error_category == 'csp_violation':
-                self.stats['csp_violations'] += 1
-            elif error_category == 'network_error':
-                self.stats['network_errors'] += 1
-            elif error_category == 'javascript_error':
-                self.stats['javascript_errors'] += 1
-            
-            print(f"  [{error_category.upper()}] {message_text[:100]}...")
-            
-            # Get location and stack trace
             location_data = msg.location if hasattr(msg, 'location') and msg.location else {}
-            stack_trace = ""
-            
-            # Try to extract stack trace
+            self._record_console_error(self.page.url, msg.text, location_data, _json_values(msg.args))
+
+    def _handle_page_error(self, error):
+        """Handle uncaught page errors."""
+        self._record_page_error(self.page.url, error)
+
+    def _user_agent(self) -> str:
+        return self.page.evaluate("navigator.userAgent")
+
+    def _record_console_error(self, url: str, message_text: str, location_data: Dict[str, Any], arg_values):
+        """Categorize and store a console error logged by the page at url.
+
+        arg_values are the JSON values of the message's arguments, searched for a stack trace.
+        """
+        self.stats['total_console_errors'] += 1
+
+        # Special handling for our captured errors
+        if message_text.startswith(CAPTURED_PREFIX):
             try:
-                for arg in msg.args:
-                    try:
-                        arg_value = arg.json_value()
-                        if isinstance(arg_value, dict) and 'stack' in arg_value:
-                            stack_trace = arg_value.get('stack', '')
-                            break
-                        elif isinstance(arg_value, str) and 'at ' in arg_value:
-                            stack_trace = arg_value
-                            break
-                    except:
-                        continue
-                        
-                # Extract location from message if available
-                if not location_data and 'at https://' in message_text:
-                    match = re.search(r'at\s+(https?://[^\s]+):(\d+):(\d+)', message_text)
-                    if match:
-                        location_data = {
-                            'url': match.group(1),
-                            'lineNumber': match.group(2),
-                            'columnNumber': match.group(3)
-                        }
-                        if not stack_trace:
-                            stack_trace = message_text
+                error_data = json.loads(message_text.replace(CAPTURED_PREFIX, '').strip())
+                self._store_error(error_data, filtered=False, url=url)
+                metrics.inc("browser_errors_total", category="javascript_error", source="console")
+                log.info(f"  ✓ Captured JavaScript error: {error_data.get('message', '')[:80]}...",
+                         extra={"sample": "browser_error"})
+                return
             except:
                 pass
-            
-            error_info = {
-                "type": "console_error",
-                "category": error_category,
-                "message": message_text,
-                "location": {
-                    "url": location_data.get("url", self.page.url),
-                    "line": location_data.get("lineNumber", ""),
-                    "column": location_data.get("columnNumber", "")
-                },
-                "timestamp": datetime.now().isoformat(),
-                "stack_trace": stack_trace,
-                "user_agent": self.page.evaluate("navigator.userAgent")
-            }
-            
-            # Store in all_errors
-            self._store_error(error_info, filtered=False, category='all')
-            
-            # Store in filtered or main based on category
-            if error_category in ['csp_violation', 'network_error', 'ad_blocker']:
-                self._store_error(error_info, filtered=True)
-                self.stats['filtered_out'] += 1
-            else:
-                self._store_error(error_info, filtered=False)
+        
+        # Categorize the error
+        error_category = self._categorize_error(message_text)
+        
+        # Update stats
+        if error_category == 'csp_violation':
+            self.stats['csp_violations'] += 1
+        elif error_category == 'network_error':
+            self.stats['network_errors'] += 1
+        elif error_category == 'javascript_error':
+            self.stats['javascript_errors'] += 1
+        
+        metrics.inc("browser_errors_total", category=error_category, source="console")
+        log.info(f"  [{error_category.upper()}] {message_text[:100]}...", extra={"sample": "browser_error"})
+        
+        stack_trace = ""
+        
+        # Try to extract stack trace
+        try:
+            for arg_value in arg_values:
+                if isinstance(arg_value, dict) and 'stack' in arg_value:
+                    stack_trace = arg_value.get('stack', '')
+                    break
+                elif isinstance(arg_value, str) and 'at ' in arg_value:
+                    stack_trace = arg_value
+                    break
+                    
+            # Extract location from message if available
+            if not location_data and 'at https://' in message_text:
+                match = re.search(r'at\s+(https?://[^\s]+):(\d+):(\d+)', message_text)
+                if match:
+                    location_data = {
+                        'url': match.group(1),
+                        'lineNumber': match.group(2),
+                        'columnNumber': match.group(3)
+                    }
+                    if not stack_trace:
+                        stack_trace = message_text
+        except:
+            pass
+        
+        error_info = {
+            "type": "console_error",
+            "category": error_category,
+            "message": message_text,
+            "location": {
+                "url": location_data.get("url", url),
+                "line": location_data.get("lineNumber", ""),
+                "column": location_data.get("columnNumber", "")
+            },
+            "timestamp": datetime.now().isoformat(),
+            "stack_trace": stack_trace,
+            "user_agent": self._user_agent()
+        }
+        
+        # Store in all_errors
+        self._store_error(error_info, filtered=False, category='all', url=url)
+        
+        # Store in filtered or main based on category
+        if error_category in ['csp_violation', 'network_error', 'ad_blocker']:
+            self._store_error(error_info, filtered=True, url=url)
+            self.stats['filtered_out'] += 1
+        else:
+            self._store_error(error_info, filtered=False, url=url)
 
-    def _handle_page_error(self, error):
-        """Handle uncaught page errors."""
+    def _record_page_error(self, url: str, error):
+        """Categorize and store an uncaught error thrown by the page at url."""
         self.stats['total_page_errors'] += 1
         error_str = str(error)
         error_category = self._categorize_error(error_str, str(error))
@@ -214,7 +415,8 @@ class DiagnosticErrorCollector:
         if error_category == 'javascript_error':
             self.stats['javascript_errors'] += 1
         
-        print(f"  [PAGE ERROR - {error_category.upper()}] {error_str[:100]}...")
+        metrics.inc("browser_errors_total", category=error_category, source="pageerror")
+        log.info(f"  [PAGE ERROR - {error_category.upper()}] {error_str[:100]}...", extra={"sample": "browser_error"})
         
         error_info = {
             "type": "page_error",
@@ -222,28 +424,74 @@ class DiagnosticErrorCollector:
             "message": error_str,
             "timestamp": datetime.now().isoformat(),
             "stack_trace": getattr(error, 'stack', str(error)),
-            "user_agent": self.page.evaluate("navigator.userAgent")
+            "user_agent": self._user_agent()
         }
         
         # Store in all_errors
-        self._store_error(error_info, filtered=False, category='all')
+        self._store_error(error_info, filtered=False, category='all', url=url)
         
         # Only store JavaScript errors in main collection
         if error_category == 'javascript_error':
-            self._store_error(error_info, filtered=False)
+            self._store_error(error_info, filtered=False, url=url)
         else:
-            self._store_error(error_info, filtered=True)
+            self._store_error(error_info, filtered=True, url=url)
             self.stats['filtered_out'] += 1
 
+    def _record_injected_errors(self, url: str, all_errors: List[Dict[str, Any]], js_errors: List[Dict[str, Any]]):
+        """Store the JavaScript errors our injected script collected on the page at url."""
+        log.info(f"\nInjected script captured:\n  - Total errors: {len(all_errors)}\n"
+                 f"  - JavaScript errors: {len(js_errors)}", extra={"sample": "page_injected"})
+        
+        for error in js_errors:
+            error_info = {
+                "type": error.get('type', 'captured_error'),
+                "category": "javascript_error",
+                "message": error.get('message', ''),
+                "location": {
+                    "url": error.get('filename', url),
+                    "line": error.get('lineno', ''),
+                    "column": error.get('colno', '')
+                },
+                "timestamp": error.get('timestamp', datetime.now().isoformat()),
+                "stack_trace": error.get('stack', ''),
+                "user_agent": self._user_agent()
+            }
+            self._store_error(error_info, filtered=False, url=url)
+            metrics.inc("browser_errors_total", category="javascript_error", source="injected")
+            log.info(f"  ✓ Captured JS error: {error_info['message'][:80]}...", extra={"sample": "browser_error"})
+
+    def _record_page_timings(self, url: str, monitor: SettleMonitor, load_seconds: float):
+        timings = monitor.timings(load_seconds)
+        timings["blocked_requests"] = self.blocked_requests.pop(url, 0)
+        self.page_timings[url] = timings
+        log.info(f"Settled in {timings['settle_seconds']:.2f}s over {timings['settle_waits']} waits"
+                 + (f" ({timings['settle_timeouts']} hit the {monitor.max_seconds:g}s limit)" if timings['settle_timeouts'] else ""),
+                 extra={"sample": "page_settled"})
+
+    def _record_navigation_error(self, url: str, error: Exception, current_url: Optional[str] = None):
+        metrics.inc("pages_total", outcome="failed")
+        self.blocked_requests.pop(url, None)
+        log.error(f"! Error analyzing {url}: {str(error)}")
+        error_info = {
+            "type": "navigation_error",
+            "category": "navigation_error",
+            "message": str(error),
+            "timestamp": datetime.now().isoformat(),
+            "stack_trace": "",
+            "user_agent": "N/A"
+        }
+        self._store_error(error_info, filtered=False, url=current_url or url)
+
     def _handle_response(self, response):
         """Handle HTTP responses to catch 4xx/5xx errors."""
         if response.status >= 400 and self.error_filters.get('capture_http_errors', False):
             print(f"HTTP Error {response.status} for {response.url}")
             # You can store these separately if needed
 
-    def _store_error(self, error_info: Dict[str, Any], filtered: bool = False, category: str = 'main'):
-        """Store error information."""
-        current_url = self.page.url
+    def _store_error(self, error_info: Dict[str, Any], filtered: bool = False, category: str = 'main',
+                     url: Optional[str] = None):
+        """Store error information under url (default: the page's current URL)."""
+        current_url = url or self.page.url
         
         if category == 'all':
             if current_url not in self.all_errors:
@@ -258,70 +506,53 @@ class DiagnosticErrorCollector:
                 self.error_stacks[current_url] = []
             self.error_stacks[current_url].append(error_info)
 
+    @profiling.profiled("collect_error_stacks")
     def collect_error_stacks(self, url: str):
         """Collect error stacks for a given URL."""
-        print(f"\n{'='*60}")
-        print(f"Analyzing URL: {url}")
-        print(f"{'='*60}")
+        log.info(f"\n{'='*60}\nAnalyzing URL: {url}\n{'='*60}", extra={"sample": "page_start"})
         
+        self.settle_monitor.reset()
+        self.current_url = url
+        self.current_script_hosts = error_script_hosts(self.rum_errors.get(url))
+        started = time.perf_counter()
         try:
-            # Navigate to the URL
-            print(f"Navigating to {url}...")
-            response = self.page.goto(url, wait_until="networkidle", timeout=60000)
-            print(f"Page loaded with status: {response.status if response else 'N/A'}")
+            # Navigate to the URL; settle detection below replaces waiting for networkidle
+            log.debug(f"Navigating to {url}...")
+            try:
+                response = self.page.goto(url, wait_until="load", timeout=NAVIGATION_TIMEOUT_MS)
+            except Exception:
+                metrics.observe("browser_navigation_seconds", time.perf_counter() - started, outcome="failed")
+                raise
+            loaded = time.perf_counter()
+            metrics.observe("browser_navigation_seconds", loaded - started, outcome="loaded")
+            log.info(f"Page loaded with status: {response.status if response else 'N/A'}", extra={"sample": "page_loaded"})
 
             # Wait for initial JavaScript execution
-            time.sleep(3)
+            self.settle_monitor.wait()
 
             # Check for errors captured by our injected script
             try:
                 all_errors = self.page.evaluate("window.__allErrors || []")
                 js_errors = self.page.evaluate("window.__jsErrors || []")
-                
-                print(f"\nInjected script captured:")
-                print(f"  - Total errors: {len(all_errors)}")
-                print(f"  - JavaScript errors: {len(js_errors)}")
-                
-                for error in js_errors:
-                    error_info = {
-                        "type": error.get('type', 'captured_error'),
-                        "category": "javascript_error",
-                        "message": error.get('message', ''),
-                        "location": {
-                            "url": error.get('filename', url),
-                            "line": error.get('lineno', ''),
-                            "column": error.get('colno', '')
-                        },
-                        "timestamp": error.get('timestamp', datetime.now().isoformat()),
-                        "stack_trace": error.get('stack', ''),
-                        "user_agent": self.page.evaluate("navigator.userAgent")
-                    }
-                    self._store_error(error_info, filtered=False)
-                    print(f"  ✓ Captured JS error: {error_info['message'][:80]}...")
+                self._record_injected_errors(self.page.url, all_errors, js_errors)
             except Exception as e:
-                print(f"  ! Could not retrieve injected script errors: {e}")
+                log.warning(f"  ! Could not retrieve injected script errors: {e}")
 
             # Simulate user interactions if needed
             if url in self.rum_errors and self.rum_errors[url]:
-                print("\nSimulating user interactions based on RUM data...")
+                log.debug("\nSimulating user interactions based on RUM data...")
                 self._simulate_user_interaction(url)
-                time.sleep(2)
 
-            # Final error check
-            print("\nFinal error check...")
-            time.sleep(2)
+                # Final error check
+                log.debug("\nFinal error check...")
+                self.settle_monitor.wait()
+            # Everything after the load event: waits, injected-error collection and simulated interactions
+            metrics.observe("page_settle_seconds", time.perf_counter() - loaded)
+            metrics.inc("pages_total", outcome="analyzed")
+            self._record_page_timings(url, self.settle_monitor, loaded - started)
 
         except Exception as e:
-            print(f"! Error analyzing {url}: {str(e)}")
-            error_info = {
-                "type": "navigation_error",
-                "category": "navigation_error",
-                "message": str(e),
-                "timestamp": datetime.now().isoformat(),
-                "stack_trace": "",
-                "user_agent": "N/A"
-            }
-            self._store_error(error_info, filtered=False)
+            self._record_navigation_error(url, e, self.page.url)
 
     def _simulate_user_interaction(self, url: str):
         """Simulate user interactions based on error sources from RUM data."""
@@ -329,21 +560,21 @@ class DiagnosticErrorCollector:
         
         for error in url_errors:
             error_source = error.get("error_source", "")
-            print(f"  - Simulating based on error source: {error_source}")
+            log.debug(f"  - Simulating based on error source: {error_source}")
             
             try:
-                if "HTMLButtonElement" in error_source:
-                    self._simulate_button_clicks()
-                elif "a._onFocus" in error_source:
-                    self._simulate_focus_events()
-                elif "a._onInvalid" in error_source:
-                    self._simulate_form_validation()
-                elif "Object.handleValueChange" in error_source:
-                    self._simulate_input_changes()
-                elif "nn._initializeBackDrop" in error_source:
-                    self._simulate_modal_interactions()
+                simulation = self._simulation_for(error_source)
+                if simulation:
+                    simulation()
             except Exception as e:
-                print(f"    ! Simulation error: {e}")
+                log.warning(f"    ! Simulation error: {e}")
+
+    def _simulation_for(self, error_source: str):
+        """The _simulate_* method that reproduces an error from error_source, or None."""
+        for pattern, method in SIMULATIONS:
+            if pattern in error_source:
+                return getattr(self, method)
+        return None
 
     def _simulate_button_clicks(self):
         """Simulate clicking buttons."""
@@ -352,7 +583,7 @@ class DiagnosticErrorCollector:
             for button in buttons:
                 if button.is_visible() and button.is_enabled():
                     button.click(timeout=2000)
-                    time.sleep(1)
+                    self.settle_monitor.wait()
         except:
             pass
 
@@ -363,7 +594,7 @@ class DiagnosticErrorCollector:
             for input_elem in inputs:
                 if input_elem.is_visible() and input_elem.is_enabled():
                     input_elem.focus()
-                    time.sleep(0.5)
+                    self.settle_monitor.wait()
         except:
             pass
 
@@ -381,7 +612,7 @@ class DiagnosticErrorCollector:
                     form.evaluate("form => form.submit()")
                 except:
                     pass
-                time.sleep(1)
+                self.settle_monitor.wait()
         except:
             pass
 
@@ -393,7 +624,7 @@ class DiagnosticErrorCollector:
                 if input_elem.is_visible() and input_elem.is_editable():
                     input_elem.fill("test")
                     input_elem.dispatch_event("change")
-                    time.sleep(0.5)
+                    self.settle_monitor.wait()
         except:
             pass
 
@@ -406,7 +637,7 @@ class DiagnosticErrorCollector:
                     close_btn = modal.locator(".close, .modal-close").first
                     if close_btn and close_btn.is_visible():
                         close_btn.click(timeout=2000)
-                        time.sleep(1)
+                        self.settle_monitor.wait()
         except:
             pass
 
@@ -428,7 +659,7 @@ class DiagnosticErrorCollector:
 
             # Process each URL
             for i, url in enumerate(self.rum_errors.keys(), 1):
-                print(f"\n[{i}/{len(self.rum_errors)}] Processing...")
+                log.info(f"\n[{i}/{len(self.rum_errors)}] Processing...", extra={"sample": "page_progress"})
                 self.collect_error_stacks(url)
 
             # Save all results
@@ -472,6 +703,7 @@ class DiagnosticErrorCollector:
                 "urls_with_js_errors": len(formatted_error_traces),
                 "stats": self.stats
             },
+            "page_timings": self.page_timings,
             "all_errors": self.all_errors,
             "filtered_errors": self.filtered_errors,
             "javascript_errors": formatted_error_traces
@@ -495,6 +727,11 @@ class DiagnosticErrorCollector:
         print(f"  - Network errors: {self.stats['network_errors']}")
         print(f"  - JavaScript errors: {self.stats['javascript_errors']}")
         print(f"  - Errors filtered out: {self.stats['filtered_out']}")
+        print(f"  - Requests blocked ({self.routing.name} routing): {self.stats['blocked_requests']}")
+        if self.page_timings:
+            settle_times = sorted(t['settle_seconds'] for t in self.page_timings.values())
+            print(f"\nSettle time per page: median {settle_times[len(settle_times) // 2]:.2f}s, max {settle_times[-1]:.2f}s, "
+                  f"{sum(1 for t in self.page_timings.values() if t['settle_timeouts'])} pages hit the limit")
         
         print(f"\nURLs with JavaScript errors:")
         for url, errors in self.error_stacks.items():
@@ -519,11 +756,318 @@ class DiagnosticErrorCollector:
         except Exception as e:
             print(f"Error during cleanup: {e}")
 
-def run_diagnostic_collection():
-    """Run the diagnostic collection."""
-    collector = DiagnosticErrorCollector()
-    collector.process_urls_from_json("rum_errors_by_url.json")
+class AsyncDiagnosticErrorCollector(DiagnosticErrorCollector):
+    """Loads the pages concurrently with async Playwright, each in its own browser context.
+
+    Up to `contexts` pages are in flight at once. Every page gets a fresh,
+    isolated context (cookies, storage and the error capture script of its
+    own), and its console, page and injected errors are stored under the RUM
+    URL it was opened for, so concurrent pages never mix their errors. With
+    processes > 1 the URLs are sharded across that many processes, each
+    running its own browser and context pool, and their results are merged.
+    The output files are the same as the sequential collector's.
+    """
+
+    def __init__(self, contexts: int = 4, processes: int = 1, headless: bool = True, **options):
+        super().__init__(**options)
+        self.contexts = max(1, contexts)
+        self.processes = max(1, processes)
+        self.headless = headless
+
+    def _user_agent(self) -> str:
+        # Every context is created with CONTEXT_OPTIONS, so there is no page to ask
+        return USER_AGENT
+
+    def process_urls_from_json(self, json_file_path: str):
+        """Process all URLs from the JSON file."""
+        print(f"Processing URLs from {json_file_path}...")
+
+        if not os.path.exists(json_file_path):
+            raise FileNotFoundError(f"JSON file not found: {json_file_path}")
+
+        with open(json_file_path, 'r') as f:
+            self.rum_errors = json.load(f)
+        print(f"Loaded {len(self.rum_errors)} URLs from RUM data.")
+        print(f"Loading pages in {self.contexts} browser contexts"
+              + (f" in each of {self.processes} processes..." if self.processes > 1 else "..."))
+
+        started = time.perf_counter()
+        if self.processes > 1:
+            self._collect_in_processes()
+        else:
+            self.collect_all()
+        print(f"Collected {len(self.rum_errors)} pages in {time.perf_counter() - started:.1f}s")
+
+        self.save_all_results()
+        self.print_summary()
+
+    def collect_all(self):
+        """Load every page of self.rum_errors in this process."""
+        with profiling.stage("collect_error_stacks"):
+            asyncio.run(self._collect(list(self.rum_errors)))
+        self._order_by_input()
+
+    def _collect_in_processes(self):
+        urls = list(self.rum_errors)
+        shards = [urls[i::self.processes] for i in range(self.processes)]
+        with ProcessPoolExecutor(max_workers=self.processes) as executor:
+            futures = [executor.submit(_collect_shard, {url: self.rum_errors[url] for url in shard},
+                                       self.contexts, self.headless, self.settle_options, self.routing,
+                                       profiling.is_active())
+                       for shard in shards if shard]
+            for future in as_completed(futures):
+                (error_stacks, all_errors, filtered_errors, page_timings, stats, metrics_state,
+                 profile_state) = future.result()
+                self.error_stacks.update(error_stacks)
+                self.all_errors.update(all_errors)
+                self.filtered_errors.update(filtered_errors)
+                self.page_timings.update(page_timings)
+                for key, value in stats.items():
+                    self.stats[key] += value
+                metrics.merge(metrics_state)
+                profiling.merge(profile_state)
+        self._order_by_input()
+
+    def _order_by_input(self):
+        """Put the collected pages back in input order, since they finish in any order."""
+        for name in ("error_stacks", "all_errors", "filtered_errors", "page_timings"):
+            collected = getattr(self, name)
+            setattr(self, name, {url: collected[url] for url in self.rum_errors if url in collected})
+
+    async def _collect(self, urls: List[str]):
+        from playwright.async_api import async_playwright
+        async with async_playwright() as playwright:
+            browser = await playwright.chromium.launch(
+                headless=self.headless,
+                slow_mo=0 if self.headless else 300,  # Slow down in headful mode
+                args=BROWSER_ARGS
+            )
+            try:
+                # The workers share one iterator, so each URL is taken by exactly one of them
+                queue = enumerate(urls, 1)
+                workers = [self._worker(browser, queue, len(urls)) for _ in range(min(self.contexts, len(urls)))]
+                await asyncio.gather(*workers)
+            finally:
+                await browser.close()
+
+    async def _worker(self, browser, queue, total: int):
+        for i, url in queue:
+            log.info(f"\n[{i}/{total}] Processing...", extra={"sample": "page_progress"})
+            await self.collect_error_stacks(browser, url)
+
+    async def collect_error_stacks(self, browser, url: str):
+        """Collect error stacks for a given URL in a context of its own."""
+        log.info(f"\n{'='*60}\nAnalyzing URL: {url}\n{'='*60}", extra={"sample": "page_start"})
+
+        context = None
+        started = time.perf_counter()
+        try:
+            context = await browser.new_context(**CONTEXT_OPTIONS)
+            await context.add_init_script(ERROR_CAPTURE_SCRIPT)
+            if self.routing.enabled:
+                await context.route("**/*", functools.partial(self._route_request_async, url,
+                                                              error_script_hosts(self.rum_errors.get(url))))
+            page = await context.new_page()
+            page.on("console", functools.partial(self._handle_console_msg_async, url))
+            page.on("pageerror", functools.partial(self._record_page_error, url))
+            monitor = SettleMonitor(page, **self.settle_options)
+
+            # Settle detection below replaces waiting for networkidle
+            log.debug(f"Navigating to {url}...")
+            try:
+                response = await page.goto(url, wait_until="load", timeout=NAVIGATION_TIMEOUT_MS)
+            except Exception:
+                metrics.observe("browser_navigation_seconds", time.perf_counter() - started, outcome="failed")
+                raise
+            loaded = time.perf_counter()
+            metrics.observe("browser_navigation_seconds", loaded - started, outcome="loaded")
+            log.info(f"Page loaded with status: {response.status if response else 'N/A'}", extra={"sample": "page_loaded"})
+
+            # Wait for initial JavaScript execution
+            await monitor.wait_async()
+
+            # Check for errors captured by our injected script
+            try:
+                all_errors = await page.evaluate("window.__allErrors || []")
+                js_errors = await page.evaluate("window.__jsErrors || []")
+                self._record_injected_errors(url, all_errors, js_errors)
+            except Exception as e:
+                log.warning(f"  ! Could not retrieve injected script errors: {e}")
+
+            # Simulate user interactions if needed
+            if self.rum_errors.get(url):
+                log.debug("\nSimulating user interactions based on RUM data...")
+                await self._simulate_user_interaction(monitor, url)
+
+                # Final error check
+                log.debug("\nFinal error check...")
+                await monitor.wait_async()
+            metrics.observe("page_settle_seconds", time.perf_counter() - loaded)
+            metrics.inc("pages_total", outcome="analyzed")
+            self._record_page_timings(url, monitor, loaded - started)
+
+        except Exception as e:
+            self._record_navigation_error(url, e)
+        finally:
+            if context:
+                try:
+                    await context.close()
+                except Exception as e:
+                    log.warning(f"  ! Could not close the browser context of {url}: {e}")
+
+    async def _route_request_async(self, url: str, allowed_script_hosts, route):
+        if self._block_reason(url, route.request, allowed_script_hosts):
+            await route.fulfill(**BLOCKED_RESPONSE)
+        else:
+            await route.continue_()
+
+    async def _handle_console_msg_async(self, url: str, msg):
+        if msg.type != "error":
+            return
+        arg_values = []
+        # Our captured errors carry everything in the message text
+        if not msg.text.startswith(CAPTURED_PREFIX):
+            for arg in msg.args:
+                try:
+                    arg_values.append(await arg.json_value())
+                except:
+                    continue
+        self._record_console_error(url, msg.text, msg.location or {}, arg_values)
+
+    async def _simulate_user_interaction(self, monitor: SettleMonitor, url: str):
+        """Simulate user interactions based on error sources from RUM data."""
+        for error in self.rum_errors.get(url, []):
+            error_source = error.get("error_source", "")
+            log.debug(f"  - Simulating based on error source: {error_source}")
+
+            try:
+                simulation = self._simulation_for(error_source)
+                if simulation:
+                    await simulation(monitor)
+            except Exception as e:
+                log.warning(f"    ! Simulation error: {e}")
+
+    async def _simulate_button_clicks(self, monitor: SettleMonitor):
+        """Simulate clicking buttons."""
+        try:
+            buttons = (await monitor.page.locator("button, [role='button'], .btn, .button").all())[:3]  # Limit to first 3
+            for button in buttons:
+                if await button.is_visible() and await button.is_enabled():
+                    await button.click(timeout=2000)
+                    await monitor.wait_async()
+        except:
+            pass
+
+    async def _simulate_focus_events(self, monitor: SettleMonitor):
+        """Simulate focus events."""
+        try:
+            inputs = (await monitor.page.locator("input, textarea, select").all())[:3]  # Limit to first 3
+            for input_elem in inputs:
+                if await input_elem.is_visible() and await input_elem.is_enabled():
+                    await input_elem.focus()
+                    await monitor.wait_async()
+        except:
+            pass
+
+    async def _simulate_form_validation(self, monitor: SettleMonitor):
+        """Simulate form validation."""
+        try:
+            forms = (await monitor.page.locator("form").all())[:2]  # Limit to first 2 forms
+            for form in forms:
+                required_inputs = await form.locator("[required]").all()
+                for input_elem in required_inputs[:3]:  # Limit inputs per form
+                    if await input_elem.is_visible() and await input_elem.is_editable():
+                        await input_elem.fill("")
+                # Try to submit
+                try:
+                    await form.evaluate("form => form.submit()")
+                except:
+                    pass
+                await monitor.wait_async()
+        except:
+            pass
+
+    async def _simulate_input_changes(self, monitor: SettleMonitor):
+        """Simulate input changes."""
+        try:
+            inputs = (await monitor.page.locator("input[type='text'], textarea").all())[:3]
+            for input_elem in inputs:
+                if await input_elem.is_visible() and await input_elem.is_editable():
+                    await input_elem.fill("test")
+                    await input_elem.dispatch_event("change")
+                    await monitor.wait_async()
+        except:
+            pass
+
+    async def _simulate_modal_interactions(self, monitor: SettleMonitor):
+        """Simulate modal interactions."""
+        try:
+            modals = await monitor.page.locator(".modal, .dialog, [role='dialog']").all()
+            for modal in modals[:2]:
+                if await modal.is_visible():
+                    close_btn = modal.locator(".close, .modal-close").first
+                    if close_btn and await close_btn.is_visible():
+                        await close_btn.click(timeout=2000)
+                        await monitor.wait_async()
+        except:
+            pass
+
+
+def _collect_shard(rum_errors: Dict[str, Any], contexts: int, headless: bool, settle_options: Dict[str, int],
+                   routing: RoutingProfile, profile: bool = False):
+    """Worker process: collect one shard of the pages and return what was found, with the shard's metrics
+    and, with profile, its stage profile."""
+    metrics.reset()  # a forked worker starts with a copy of the parent's metrics
+    profiling.start_worker(profile)  # and a copy of the parent's profiler, whose results would be lost
+    collector = AsyncDiagnosticErrorCollector(contexts, headless=headless)
+    collector.rum_errors = rum_errors
+    collector.settle_options = settle_options
+    collector.routing = routing
+    collector.collect_all()
+    return (collector.error_stacks, collector.all_errors, collector.filtered_errors, collector.page_timings,
+            collector.stats, metrics.state(), profiling.state())
+
+def run_diagnostic_collection(json_file_path="rum_errors_by_url.json", contexts=1, processes=1, **options):
+    """Run the diagnostic collection.
+
+    contexts > 1 or processes > 1 loads the pages concurrently with
+    AsyncDiagnosticErrorCollector; otherwise they are loaded one at a time.
+    options are passed to the collector: quiet_ms, max_settle_ms and max_inflight
+    tune when a page counts as settled, routing names a ROUTING_PROFILES entry.
+    """
+    if contexts > 1 or processes > 1:
+        collector = AsyncDiagnosticErrorCollector(contexts, processes, **options)
+    else:
+        collector = DiagnosticErrorCollector(**options)
+    collector.process_urls_from_json(json_file_path)
     return collector.error_stacks
 
 if __name__ == "__main__":
-    run_diagnostic_collection()
\ No newline at end of file
+    parser = argparse.ArgumentParser(description="Load every page with RUM errors in Chromium and collect its JavaScript error stacks")
+    parser.add_argument("--input", default="rum_errors_by_url.json", help="Errors by page URL, as written by main.py")
+    parser.add_argument("--contexts", type=int, default=1,
+                        help="Pages loaded at once, each in its own browser context (default: 1, one page at a time)")
+    parser.add_argument("--processes", type=int, default=1,
+                        help="Processes to shard the pages across, each with its own browser (default: 1)")
+    parser.add_argument("--settle-quiet-ms", type=int, default=SETTLE_QUIET_MS,
+                        help="A page has settled once it has had no requests in flight, long tasks or new errors "
+                             f"for this long (default: {SETTLE_QUIET_MS})")
+    parser.add_argument("--settle-max-ms", type=int, default=SETTLE_MAX_MS,
+                        help=f"Longest wait for a page to settle (default: {SETTLE_MAX_MS})")
+    parser.add_argument("--settle-max-inflight", type=int, default=SETTLE_MAX_INFLIGHT,
+                        help=f"Open requests a settled page may keep, e.g. long-polling (default: {SETTLE_MAX_INFLIGHT})")
+    parser.add_argument("--routing", choices=sorted(ROUTING_PROFILES), default=DEFAULT_ROUTING_PROFILE,
+                        help="Requests to block: off loads everything, lean skips images, media, fonts and trackers, "
+                             f"scripts also skips third-party stylesheets and XHR (default: {DEFAULT_ROUTING_PROFILE})")
+    add_metrics_arguments(parser)
+    profiling.add_arguments(parser)
+    args = parser.parse_args()
+    configure_from_args(args)
+    profiling.start_from_args(args)
+    try:
+        run_diagnostic_collection(args.input, args.contexts, args.processes, quiet_ms=args.settle_quiet_ms,
+                                  max_settle_ms=args.settle_max_ms, max_inflight=args.settle_max_inflight,
+                                  routing=args.routing)
+    finally:
+        profiling.finish_from_args(args)
+        export_from_args(args)
\ No newline at end of file
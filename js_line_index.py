@@ -0,0 +1,44 @@
+import re
+from array import array
+
+# JavaScript line terminators (ECMA-262): LF, CR, CRLF, LS (U+2028) and PS (U+2029).
+# LS/PS are matched in their UTF-8 encoding, which is what scripts are served as.
+_LINE_TERMINATOR = re.compile(rb"\r\n|[\r\n]|\xe2\x80[\xa8\xa9]")
+
+
+class LineIndex:
+    """Byte offsets of every line start in a script, built once and kept as a compact array.
+
+    Lines are then read by slicing only the bytes they span, instead of
+    materializing a Python string for every line of a multi-MB bundle.
+    """
+
+    def __init__(self, content):
+        self.content = content
+        # Each entry is (start of line, start of its terminator); 16 bytes per line
+        self.starts = array("Q", [0])
+        self.ends = array("Q")
+        if b"\r" in content or b"\xe2\x80\xa8" in content or b"\xe2\x80\xa9" in content:
+            for match in _LINE_TERMINATOR.finditer(content):
+                self.ends.append(match.start())
+                self.starts.append(match.end())
+        else:
+            # Fast path for the common LF-only script
+            find = content.find
+            pos = find(b"\n")
+            while pos != -1:
+                self.ends.append(pos)
+                self.starts.append(pos + 1)
+                pos = find(b"\n", pos + 1)
+        self.ends.append(len(content))
+        # Like str.splitlines(), a trailing terminator does not open an extra empty line
+        if self.starts[-1] == len(content):
+            self.starts.pop()
+            self.ends.pop()
+
+    def __len__(self):
+        return len(self.starts)
+
+    def line_bytes(self, index):
+        """Raw bytes of the 0-based line `index`, without its terminator."""
+        return self.content[self.starts[index]:self.ends[index]]
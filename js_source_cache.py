@@ -0,0 +1,299 @@
+import hashlib
+import json
+import os
+import threading
+import time
+from bisect import bisect_right
+from collections import OrderedDict
+from urllib.parse import urlparse
+
+import requests
+from requests.adapters import HTTPAdapter
+
+from js_line_index import LineIndex
+from js_symbol_index import SymbolIndex
+from metrics import metrics
+
+DEFAULT_CACHE_DIR = ".js_cache"
+# js_source_requests_total result label of each stats key
+_RESULT_LABELS = {"memory_hits": "memory_hit", "disk_hits": "revalidated", "misses": "download",
+                  "stale_served": "stale"}
+
+
+class JSSource:
+    """A fetched JavaScript source as held by JSSourceCache."""
+
+    def __init__(self, url, status_code, content=b"", encoding=None, etag=None, last_modified=None):
+        self.url = url
+        self.status_code = status_code
+        self.content = content or b""
+        self.encoding = encoding
+        self.etag = etag
+        self.last_modified = last_modified
+        self.content_hash = hashlib.sha256(self.content).hexdigest() if status_code == 200 else None
+        self._text = None
+        self._line_index = None
+        self._symbol_index = None
+
+    @property
+    def text(self):
+        """Decoded source text, decoded once on first use."""
+        if self._text is None:
+            self._text = self.content.decode(self.encoding or "utf-8", errors="replace")
+        return self._text
+
+    @property
+    def line_index(self):
+        """Line-start offset index, built once per cached script on first use."""
+        if self._line_index is None:
+            self._line_index = LineIndex(self.content)
+        return self._line_index
+
+    @property
+    def symbol_index(self):
+        """Function/class boundary index, built once per cached script on first use."""
+        if self._symbol_index is None:
+            self._symbol_index = SymbolIndex(self.content)
+        return self._symbol_index
+
+    def offset_of(self, line_index, column):
+        """Byte offset of a 0-based line and character column."""
+        line_start = self.line_index.starts[line_index]
+        prefix = self.line(line_index)[:max(column or 0, 0)]
+        return line_start + len(prefix.encode(self.encoding or "utf-8", errors="replace"))
+
+    def line_of(self, offset):
+        """0-based line containing byte offset."""
+        return max(0, bisect_right(self.line_index.starts, offset) - 1)
+
+    @property
+    def line_count(self):
+        return len(self.line_index)
+
+    def line(self, index):
+        """Decoded text of the 0-based line `index`."""
+        return self.decode(self.line_index.line_bytes(index))
+
+    def lines(self, start, end):
+        """Decoded text of the 0-based lines [start, end)."""
+        index = self.line_index
+        return [self.decode(index.line_bytes(i)) for i in range(start, min(end, len(index)))]
+
+    def decode(self, data):
+        return data.decode(self.encoding or "utf-8", errors="replace")
+
+
+class JSSourceCache:
+    """Two-tier (in-memory LRU + on-disk) cache for JS files referenced by RUM errors.
+
+    Entries fetched during this run are served from memory without touching the
+    network. Entries found on disk from a previous run are revalidated with
+    If-None-Match / If-Modified-Since, so an unchanged script costs a 304 instead
+    of a full download.
+
+    The cache is safe to share between threads: concurrent lookups of the same
+    URL wait for a single download, and at most max_per_host requests are in
+    flight against any one host.
+    """
+
+    def __init__(self, cache_dir=DEFAULT_CACHE_DIR, max_entries=256, timeout=10, session=None,
+                 pool_size=10, max_per_host=4):
+        self.cache_dir = cache_dir
+        self.max_entries = max_entries
+        self.timeout = timeout
+        self.session = session or requests.Session()
+        self._memory = OrderedDict()
+        self._seeded = {}
+        self._lock = threading.Lock()
+        self._inflight = {}
+        self._host_slots = {}
+        self.configure_pool(pool_size, max_per_host)
+        self.stats = {
+            "memory_hits": 0,
+            "disk_hits": 0,
+            "misses": 0,
+            "stale_served": 0,
+        }
+        if self.cache_dir:
+            os.makedirs(self.cache_dir, exist_ok=True)
+
+    def configure_pool(self, pool_size, max_per_host):
+        """Size the keep-alive connection pool and the per-host in-flight cap."""
+        self.max_per_host = max(1, max_per_host)
+        adapter = HTTPAdapter(pool_connections=pool_size, pool_maxsize=pool_size)
+        self.session.mount("http://", adapter)
+        self.session.mount("https://", adapter)
+        with self._lock:
+            self._host_slots = {}
+
+    def get(self, url):
+        """Return a JSSource for url, fetching or revalidating it only when needed."""
+        while True:
+            with self._lock:
+                source = self._seeded.get(url)
+                if source is not None:
+                    self.stats["memory_hits"] += 1
+                    metrics.inc("js_source_requests_total", result="memory_hit")
+                    return source
+                source = self._memory.get(url)
+                if source is not None:
+                    self._memory.move_to_end(url)
+                    self.stats["memory_hits"] += 1
+                    metrics.inc("js_source_requests_total", result="memory_hit")
+                    return source
+                pending = self._inflight.get(url)
+                if pending is None:
+                    pending = self._inflight[url] = threading.Event()
+                    break
+            # Another thread is already downloading this script; wait for it and retry.
+            pending.wait()
+
+        try:
+            with self._host_slot(url):
+                source = self._fetch(url, self._load_from_disk(url))
+            with self._lock:
+                self._remember(url, source)
+            return source
+        finally:
+            with self._lock:
+                del self._inflight[url]
+            pending.set()
+
+    def put(self, url, content, encoding="utf-8"):
+        """Seed the cache with content obtained elsewhere, e.g. a source map's sourcesContent.
+
+        Seeded entries are kept apart from the LRU and never evicted: their URLs
+        (webpack://...) usually cannot be fetched again.
+        """
+        if isinstance(content, str):
+            content = content.encode(encoding)
+        source = JSSource(url, 200, content, encoding=encoding)
+        with self._lock:
+            current = self._seeded.get(url)
+            if current is not None and current.content_hash == source.content_hash:
+                # Keep the existing entry and its already-built line index
+                return current
+            self._seeded[url] = source
+        return source
+
+    def format_stats(self):
+        lookups = sum(self.stats[k] for k in ("memory_hits", "disk_hits", "misses"))
+        hits = self.stats["memory_hits"] + self.stats["disk_hits"]
+        hit_rate = (hits / lookups * 100) if lookups else 0.0
+        return (
+            f"JS source cache: {lookups} lookups, {hits} hits "
+            f"({self.stats['memory_hits']} memory, {self.stats['disk_hits']} disk), "
+            f"{self.stats['misses']} downloads, {self.stats['stale_served']} stale served, "
+            f"hit rate {hit_rate:.1f}%"
+        )
+
+    def _fetch(self, url, cached):
+        headers = {}
+        if cached is not None:
+            if cached.etag:
+                headers["If-None-Match"] = cached.etag
+            if cached.last_modified:
+                headers["If-Modified-Since"] = cached.last_modified
+
+        started = time.perf_counter()
+        try:
+            response = self.session.get(url, headers=headers, timeout=self.timeout)
+        except requests.RequestException:
+            metrics.observe("js_fetch_seconds", time.perf_counter() - started, status="failed")
+            if cached is None:
+                raise
+            # Network trouble: a previously downloaded copy beats no context at all.
+            self._count("stale_served")
+            return cached
+
+        metrics.observe("js_fetch_seconds", time.perf_counter() - started, status=response.status_code)
+        if response.status_code == 304 and cached is not None:
+            self._count("disk_hits")
+            return cached
+
+        self._count("misses")
+        source = JSSource(
+            url,
+            response.status_code,
+            response.content if response.status_code == 200 else b"",
+            encoding=response.encoding,
+            etag=response.headers.get("ETag"),
+            last_modified=response.headers.get("Last-Modified"),
+        )
+        if response.status_code == 200:
+            self._save_to_disk(source)
+        return source
+
+    def _count(self, key):
+        with self._lock:
+            self.stats[key] += 1
+        metrics.inc("js_source_requests_total", result=_RESULT_LABELS[key])
+
+    def _host_slot(self, url):
+        host = urlparse(url).netloc
+        with self._lock:
+            slot = self._host_slots.get(host)
+            if slot is None:
+                slot = self._host_slots[host] = threading.BoundedSemaphore(self.max_per_host)
+        return slot
+
+    def _remember(self, url, source):
+        self._memory[url] = source
+        self._memory.move_to_end(url)
+        while len(self._memory) > self.max_entries:
+            self._memory.popitem(last=False)
+
+    def _paths(self, url):
+        digest = hashlib.sha256(url.encode("utf-8")).hexdigest()
+        base = os.path.join(self.cache_dir, digest)
+        return base + ".js", base + ".json"
+
+    def _load_from_disk(self, url):
+        if not self.cache_dir:
+            return None
+        body_path, meta_path = self._paths(url)
+        try:
+            with open(meta_path, "r", encoding="utf-8") as f:
+                meta = json.load(f)
+            with open(body_path, "rb") as f:
+                content = f.read()
+        except (OSError, ValueError):
+            return None
+        if meta.get("url") != url:
+            return None
+        source = JSSource(
+            url,
+            200,
+            content,
+            encoding=meta.get("encoding"),
+            etag=meta.get("etag"),
+            last_modified=meta.get("last_modified"),
+        )
+        if source.content_hash != meta.get("content_hash"):
+            return None
+        return source
+
+    def _save_to_disk(self, source):
+        if not self.cache_dir:
+            return
+        body_path, meta_path = self._paths(source.url)
+        meta = {
+            "url": source.url,
+            "etag": source.etag,
+            "last_modified": source.last_modified,
+            "encoding": source.encoding,
+            "content_hash": source.content_hash,
+            "fetched_at": time.time(),
+        }
+        try:
+            _atomic_write(body_path, source.content)
+            _atomic_write(meta_path, json.dumps(meta).encode("utf-8"))
+        except OSError as e:
+            print(f"⚠️ Could not write JS cache entry for {source.url}: {e}")
+
+
+def _atomic_write(path, data):
+    tmp_path = f"{path}.tmp.{os.getpid()}"
+    with open(tmp_path, "wb") as f:
+        f.write(data)
+    os.replace(tmp_path, path)
@@ -0,0 +1,315 @@
+import re
+from array import array
+from bisect import bisect_right
+
+# Scanned on the raw UTF-8 bytes: every JS syntax character is ASCII and never
+# occurs inside a multi-byte sequence, so offsets line up with LineIndex.
+_INTERESTING = re.compile(rb"[{}'\"`/]")
+_TEMPLATE_STOP = re.compile(rb"[`\\]|\$\{")
+_STRING_STOP = {ord("'"): re.compile(rb"['\\\n]"), ord('"'): re.compile(rb'["\\\n]')}
+_REGEX_STOP = re.compile(rb"[/\\\[\n]")
+_CLASS_STOP = re.compile(rb"[\]\\\n]")
+
+_KEYWORDS = {
+    b"if", b"for", b"while", b"switch", b"catch", b"with", b"do", b"else", b"try",
+    b"finally", b"return", b"typeof", b"new", b"delete", b"void", b"in", b"of",
+    b"instanceof", b"case", b"throw", b"yield", b"await",
+}
+# After these keywords a "/" starts a regular expression, not a division
+_REGEX_PREFIX_KEYWORDS = {b"return", b"typeof", b"case", b"do", b"else", b"in", b"of",
+                          b"instanceof", b"new", b"delete", b"void", b"throw", b"yield", b"await"}
+
+_METHOD_MODIFIERS = {b"static", b"async", b"get", b"set"}
+_IDENTIFIER_BYTES = frozenset(b"ABCDEFGHIJKLMNOPQRSTUVWXYZabcdefghijklmnopqrstuvwxyz0123456789_$")
+_DIGIT_BYTES = frozenset(b"0123456789")
+_CLASS_HEADER = re.compile(rb"class\b(?:\s+([A-Za-z_$][\w$]*))?(?:\s+extends\b[^{};]*)?\s*$")
+
+_HEADER_WINDOW = 512
+
+
+class Scope:
+    def __init__(self, kind, name, start, end):
+        self.kind = kind
+        self.name = name
+        self.start = start
+        self.end = end
+
+
+class SymbolIndex:
+    """Function, method, arrow-function and class boundaries of one script.
+
+    Built once per script by a lightweight scanner that skips comments, strings,
+    template literals and regular expressions and classifies every `{` by the
+    code right before it. Scopes are stored sorted by start offset together with
+    the index of their enclosing scope, so the innermost scope around any
+    position is a binary search plus a walk up the parent chain.
+    """
+
+    def __init__(self, content):
+        self.content = content
+        self.scopes = []
+        self.starts = array("Q")
+        self.parents = array("l")
+        self._scan()
+
+    def __len__(self):
+        return len(self.scopes)
+
+    def enclosing(self, offset):
+        """Innermost scope whose text contains byte offset, or None at top level."""
+        i = bisect_right(self.starts, offset) - 1
+        while i >= 0:
+            scope = self.scopes[i]
+            if scope.start <= offset < scope.end:
+                return scope
+            i = self.parents[i]
+        return None
+
+    def _scan(self):
+        content = self.content
+        length = len(content)
+        # One entry per open brace: the scope slot it opened (-1 for plain blocks),
+        # or "template" for the "${" of a template literal interpolation
+        self._stack = stack = []
+        open_scopes = []
+        pos = 0
+        while True:
+            match = _INTERESTING.search(content, pos)
+            if match is None:
+                break
+            i = match.start()
+            char = content[i]
+            pos = i + 1
+            if char == 0x7B:  # {
+                kind, name, start = self._classify(i)
+                slot = -1
+                if kind is not None:
+                    slot = len(self.scopes)
+                    self.scopes.append(Scope(kind, name, start, length))
+                    self.starts.append(start)
+                    self.parents.append(open_scopes[-1] if open_scopes else -1)
+                    open_scopes.append(slot)
+                stack.append(slot)
+            elif char == 0x7D:  # }
+                if not stack:
+                    continue
+                slot = stack.pop()
+                if slot == "template":
+                    # End of an interpolation: back inside the template literal text
+                    pos = self._skip_template(pos)
+                elif slot >= 0:
+                    self.scopes[slot].end = i + 1
+                    open_scopes.pop()
+            elif char == 0x60:  # `
+                pos = self._skip_template(pos)
+            elif char in _STRING_STOP:
+                pos = self._skip_string(pos, _STRING_STOP[char])
+            else:  # /
+                following = content[pos:pos + 1]
+                if following == b"/":
+                    newline = content.find(b"\n", pos)
+                    pos = length if newline == -1 else newline
+                elif following == b"*":
+                    close = content.find(b"*/", pos + 1)
+                    pos = length if close == -1 else close + 2
+                elif self._regex_allowed(i):
+                    pos = self._skip_regex(pos)
+
+        del self._stack
+        # Reorder by start offset (an arrow's header can begin before an earlier-opened scope's end)
+        order = sorted(range(len(self.scopes)), key=lambda k: self.scopes[k].start)
+        if order != list(range(len(order))):
+            remap = {old: new for new, old in enumerate(order)}
+            self.scopes = [self.scopes[k] for k in order]
+            self.parents = array("l", [remap.get(self.parents[k], -1) if self.parents[k] >= 0 else -1 for k in order])
+            self.starts = array("Q", [scope.start for scope in self.scopes])
+
+    def _skip_string(self, pos, stop):
+        content = self.content
+        while True:
+            match = stop.search(content, pos)
+            if match is None:
+                return len(content)
+            pos = match.end()
+            char = content[match.start()]
+            if char == 0x5C:  # backslash escapes the next byte
+                pos += 1
+            else:
+                # Closing quote, or an unterminated string ending at the newline
+                return pos
+
+    def _skip_template(self, pos):
+        """Skip template literal text; on "${" push a template marker and resume scanning code."""
+        content = self.content
+        while True:
+            match = _TEMPLATE_STOP.search(content, pos)
+            if match is None:
+                return len(content)
+            pos = match.end()
+            token = match.group()
+            if token == b"\\":
+                pos += 1
+            elif token == b"`":
+                return pos
+            else:
+                self._stack.append("template")
+                return pos
+
+    def _skip_regex(self, pos):
+        content = self.content
+        while True:
+            match = _REGEX_STOP.search(content, pos)
+            if match is None:
+                return len(content)
+            pos = match.end()
+            char = content[match.start()]
+            if char == 0x5C:
+                pos += 1
+            elif char == 0x5B:  # character class: "/" inside does not end the literal
+                while True:
+                    inner = _CLASS_STOP.search(content, pos)
+                    if inner is None:
+                        return len(content)
+                    pos = inner.end()
+                    if content[inner.start()] == 0x5C:
+                        pos += 1
+                    else:
+                        break
+            else:
+                # Closing "/" (flags are plain identifier bytes), or a newline in a misdetected division
+                return pos
+
+    def _previous_significant(self, i):
+        content = self.content
+        j = i - 1
+        while j >= 0 and content[j] in b" \t\r\n":
+            j -= 1
+        return j
+
+    def _identifier_before(self, end):
+        """(start, name) of the identifier right before end, skipping whitespace, or (None, None)."""
+        content = self.content
+        j = self._previous_significant(end)
+        stop = j + 1
+        while j >= 0 and content[j] in _IDENTIFIER_BYTES:
+            j -= 1
+        start = j + 1
+        if start == stop or content[start] in _DIGIT_BYTES:
+            return None, None
+        return start, content[start:stop]
+
+    def _function_keyword_before(self, end):
+        """Start of a `function` (or `function*`) keyword right before end, else None."""
+        j = self._previous_significant(end)
+        if j >= 0 and self.content[j] == 0x2A:  # *
+            end = j
+        start, word = self._identifier_before(end)
+        return start if word == b"function" else None
+
+    def _assignment_target(self, end):
+        """(start, name) for `name =`, `name:` or `name = async` right before end, or (None, None)."""
+        start, word = self._identifier_before(end)
+        if word == b"async":
+            end = start
+        j = self._previous_significant(end)
+        if j < 0 or self.content[j] not in b"=:":
+            return None, None
+        return self._identifier_before(j)
+
+    def _regex_allowed(self, i):
+        j = self._previous_significant(i)
+        if j < 0:
+            return True
+        char = self.content[j]
+        if char in b"(,=:[!&|?{};+-*%<>~^":
+            return True
+        if char in b")]":
+            return False
+        _, word = self._identifier_before(j + 1)
+        return word in _REGEX_PREFIX_KEYWORDS
+
+    def _classify(self, brace):
+        """Classify the block opened at brace as (kind, name, header_start) or (None, None, None).
+
+        Headers are read backwards from the brace with plain byte scans: this runs
+        for every `{` of the script, and end-anchored regex searches over a window
+        cost one match attempt per byte of it.
+        """
+        content = self.content
+        j = self._previous_significant(brace)
+        if j < 0:
+            return None, None, None
+        char = content[j]
+
+        if char == 0x3E and content[j - 1:j + 1] == b"=>":  # arrow function with a block body
+            k = self._previous_significant(j - 1)
+            if k >= 0 and content[k] == 0x29:
+                k = self._matching_open_paren(k)
+                if k is None:
+                    return None, None, None
+            else:
+                k, word = self._identifier_before(k + 1)
+                if word is None:
+                    return None, None, None
+            target_start, target = self._assignment_target(k)
+            if target is not None:
+                return "arrow", target.decode("utf-8", "replace"), target_start
+            return "arrow", None, k
+
+        if char == 0x29:  # )  function, method, or a control-flow block
+            k = self._matching_open_paren(j)
+            if k is None:
+                return None, None, None
+            start, word = self._identifier_before(k)
+            if word == b"function":
+                function_start, name = start, None
+            else:
+                function_start = self._function_keyword_before(start if word is not None else k)
+                name = word
+            if function_start is not None:
+                start = function_start
+                if name is None:
+                    target_start, name = self._assignment_target(start)
+                    if name is not None:
+                        start = target_start
+                return "function", name.decode("utf-8", "replace") if name else None, start
+            if word is not None and word not in _KEYWORDS:
+                # Method shorthand `name(args) {`: a call expression is never followed by a block
+                name = word.decode("utf-8", "replace")
+                while True:
+                    p = self._previous_significant(start)
+                    if p >= 0 and content[p] == 0x2A:  # generator method
+                        start = p
+                        continue
+                    modifier_start, modifier = self._identifier_before(start)
+                    if modifier not in _METHOD_MODIFIERS:
+                        break
+                    start = modifier_start
+                return "method", name, start
+            return None, None, None
+
+        # Class body: look for the `class` keyword only where it can be
+        window_start = max(0, j + 1 - _HEADER_WINDOW)
+        keyword = content.rfind(b"class", window_start, j + 1)
+        while keyword != -1:
+            if keyword == 0 or content[keyword - 1] not in _IDENTIFIER_BYTES:
+                match = _CLASS_HEADER.match(content, keyword, j + 1)
+                if match:
+                    name = match.group(1).decode("utf-8", "replace") if match.group(1) else None
+                    return "class", name, keyword
+            keyword = content.rfind(b"class", window_start, keyword)
+        return None, None, None
+
+    def _matching_open_paren(self, close):
+        content = self.content
+        depth = 0
+        limit = max(-1, close - 4096)
+        for k in range(close, limit, -1):
+            char = content[k]
+            if char == 0x29:
+                depth += 1
+            elif char == 0x28:
+                depth -= 1
+                if depth == 0:
+                    return k
+        return None
@@ -0,0 +1,160 @@
+import random
+import re
+import threading
+import time
+
+from metrics import get_logger, metrics
+
+log = get_logger("llm")
+
+
+class TokenBucket:
+    """Bucket refilled at per_minute units per minute, holding at most capacity units."""
+
+    def __init__(self, per_minute, capacity=None):
+        self.rate = per_minute / 60.0
+        self.capacity = capacity or per_minute
+        self.level = float(self.capacity)
+        self.updated = time.monotonic()
+
+    def _refill(self, now):
+        self.level = min(self.capacity, self.level + (now - self.updated) * self.rate)
+        self.updated = now
+
+    def wait_time(self, amount, now):
+        """Seconds until amount units are available (requests larger than capacity wait for a full bucket)."""
+        self._refill(now)
+        missing = min(amount, self.capacity) - self.level
+        return max(0.0, missing / self.rate)
+
+    def take(self, amount):
+        self.level -= amount
+
+
+class LLMRateLimiter:
+    """Shared requests-per-minute and tokens-per-minute limits for concurrent LLM workers.
+
+    Workers reserve their estimated requests and tokens before calling the LLM.
+    A 429 from the endpoint pauses every worker, not only the one that hit it.
+    A limit of 0 or None disables that bucket.
+    """
+
+    def __init__(self, requests_per_minute=None, tokens_per_minute=None):
+        self.requests = TokenBucket(requests_per_minute) if requests_per_minute else None
+        self.tokens = TokenBucket(tokens_per_minute) if tokens_per_minute else None
+        self.paused_until = 0.0
+        self._lock = threading.Lock()
+        self.stats = {"acquired": 0, "waited_seconds": 0.0, "rate_limited": 0}
+
+    def acquire(self, requests=1, tokens=0):
+        """Block until requests and tokens fit both buckets, then reserve them."""
+        started = time.monotonic()
+        while True:
+            with self._lock:
+                now = time.monotonic()
+                wait = self.paused_until - now
+                if self.requests:
+                    wait = max(wait, self.requests.wait_time(requests, now))
+                if self.tokens:
+                    wait = max(wait, self.tokens.wait_time(tokens, now))
+                if wait <= 0:
+                    if self.requests:
+                        self.requests.take(requests)
+                    if self.tokens:
+                        self.tokens.take(tokens)
+                    self.stats["acquired"] += 1
+                    self.stats["waited_seconds"] += now - started
+                    metrics.observe("llm_rate_limit_wait_seconds", now - started)
+                    return
+            time.sleep(wait)
+
+    def pause(self, seconds):
+        with self._lock:
+            self.paused_until = max(self.paused_until, time.monotonic() + seconds)
+            self.stats["rate_limited"] += 1
+
+    def format_stats(self):
+        return (
+            f"Rate limiter: {self.stats['acquired']} calls, {self.stats['rate_limited']} rate-limited, "
+            f"{self.stats['waited_seconds']:.1f}s spent waiting"
+        )
+
+
+# "Error code: 429", "status 429", "HTTP/1.1 429", "429 Too Many Requests", or the rate-limit wording
+_RATE_LIMIT_MESSAGE = re.compile(
+    r"\b(?:error|status|code|http(?:/[\d.]+)?)\b[\s:=_-]*(?:code\b[\s:=]*)?429\b"
+    r"|too many requests|rate[ _-]?limit"
+)
+
+
+def _exception_chain(exception):
+    seen = set()
+    while exception is not None and id(exception) not in seen:
+        seen.add(id(exception))
+        yield exception
+        exception = exception.__cause__ or exception.__context__
+
+
+def is_rate_limit_error(exception):
+    """True if exception (or one it was raised from) is an HTTP 429 / rate-limit error.
+
+    The status code and exception type decide first, and an error with a
+    status code is judged by it alone. Only errors without one fall back to
+    their message, where 429 must appear as a status ("Error code: 429",
+    "HTTP 429") so token counts, request ids or ports containing it do not
+    count.
+    """
+    chain = list(_exception_chain(exception))
+    for e in chain:
+        if getattr(e, "status_code", None) == 429 or type(e).__name__ == "RateLimitError":
+            return True
+    for e in chain:
+        if getattr(e, "status_code", None) is not None:
+            continue
+        if _RATE_LIMIT_MESSAGE.search(str(e).lower()):
+            return True
+    return False
+
+
+def retry_after(exception):
+    """Seconds from a Retry-After header on the error's response, or None."""
+    for e in _exception_chain(exception):
+        response = getattr(e, "response", None)
+        headers = getattr(response, "headers", None)
+        if headers is None:
+            continue
+        try:
+            return float(headers.get("retry-after"))
+        except (TypeError, ValueError):
+            continue
+    return None
+
+
+def backoff_delay(attempt, base=1.0, cap=60.0):
+    """Exponential backoff with jitter for the given 0-based retry attempt."""
+    return min(cap, base * 2 ** attempt) * random.uniform(0.5, 1.0)
+
+
+def call_with_backoff(limiter, fn, requests=1, tokens=0, max_retries=5, kind="llm"):
+    """Call fn() once limiter admits it, retrying with backoff when it fails with a 429.
+
+    The latency of every attempt is observed in llm_call_seconds, labelled
+    with kind (e.g. crew, batch, single-call) and the attempt's outcome.
+    """
+    for attempt in range(max_retries + 1):
+        limiter.acquire(requests, tokens)
+        started = time.perf_counter()
+        try:
+            result = fn()
+        except Exception as e:
+            rate_limited = is_rate_limit_error(e)
+            metrics.observe("llm_call_seconds", time.perf_counter() - started, kind=kind,
+                            outcome="rate_limited" if rate_limited else "error")
+            if not rate_limited or attempt == max_retries:
+                raise
+            delay = retry_after(e) or backoff_delay(attempt)
+            log.warning(f"⏳ Rate limited by the LLM endpoint, backing off {delay:.1f}s (retry {attempt + 1}/{max_retries})")
+            limiter.pause(delay)
+            continue
+        metrics.observe("llm_call_seconds", time.perf_counter() - started, kind=kind, outcome="ok")
+        return result
@@ -0,0 +1,99 @@
+import hashlib
+import json
+import sqlite3
+import threading
+import time
+
+CACHE_DB = ".llm_cache.sqlite3"
+DEFAULT_TTL_DAYS = 14
+DEFAULT_MAX_MB = 100
+
+
+def response_cache_key(analyze_prompt, fix_prompt, model, temperature, code_content_hash=None):
+    """Content address of one analysis: both rendered prompts, the model settings and the script version."""
+    payload = json.dumps([analyze_prompt, fix_prompt, model, temperature, code_content_hash or ""])
+    return hashlib.sha256(payload.encode("utf-8")).hexdigest()
+
+
+class LLMResponseCache:
+    """Persistent cache of agent responses, keyed by response_cache_key().
+
+    Entries live in one SQLite file and expire ttl_seconds after they were
+    written. When the stored responses exceed max_bytes, the least recently
+    used entries are evicted. Safe to share between worker threads.
+    """
+
+    def __init__(self, path=CACHE_DB, ttl_seconds=DEFAULT_TTL_DAYS * 86400, max_bytes=DEFAULT_MAX_MB * 1024 * 1024):
+        self.path = path
+        self.ttl_seconds = ttl_seconds
+        self.max_bytes = max_bytes
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(path, check_same_thread=False, isolation_level=None)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute(
+            "CREATE TABLE IF NOT EXISTS responses ("
+            " key TEXT PRIMARY KEY, agent1_response TEXT, agent2_response TEXT,"
+            " created REAL, last_used REAL, size INTEGER)"
+        )
+        self._conn.execute("CREATE INDEX IF NOT EXISTS responses_last_used ON responses (last_used)")
+        self.stats = {"hits": 0, "misses": 0, "stored": 0, "expired": 0, "evicted": 0}
+        with self._lock:
+            cursor = self._conn.execute("DELETE FROM responses WHERE created < ?", (time.time() - ttl_seconds,))
+            self.stats["expired"] += cursor.rowcount
+            self._total_bytes = self._conn.execute("SELECT COALESCE(SUM(size), 0) FROM responses").fetchone()[0]
+
+    def get(self, key):
+        """(agent1_response, agent2_response) for key, or None when missing or expired."""
+        now = time.time()
+        with self._lock:
+            row = self._conn.execute(
+                "SELECT agent1_response, agent2_response, created, size FROM responses WHERE key = ?", (key,)
+            ).fetchone()
+            if row is None:
+                self.stats["misses"] += 1
+                return None
+            agent1_response, agent2_response, created, size = row
+            if now - created > self.ttl_seconds:
+                self._conn.execute("DELETE FROM responses WHERE key = ?", (key,))
+                self._total_bytes -= size
+                self.stats["expired"] += 1
+                self.stats["misses"] += 1
+                return None
+            self._conn.execute("UPDATE responses SET last_used = ? WHERE key = ?", (now, key))
+            self.stats["hits"] += 1
+            return agent1_response, agent2_response
+
+    def put(self, key, agent1_response, agent2_response):
+        now = time.time()
+        size = len(agent1_response.encode("utf-8")) + len(agent2_response.encode("utf-8"))
+        with self._lock:
+            previous = self._conn.execute("SELECT size FROM responses WHERE key = ?", (key,)).fetchone()
+            self._conn.execute(
+                "INSERT OR REPLACE INTO responses VALUES (?, ?, ?, ?, ?, ?)",
+                (key, agent1_response, agent2_response, now, now, size),
+            )
+            self._total_bytes += size - (previous[0] if previous else 0)
+            self.stats["stored"] += 1
+            if self._total_bytes > self.max_bytes:
+                self._evict()
+
+    def _evict(self):
+        # Least recently used first, until the cache is back under max_bytes
+        doomed = []
+        for key, size in self._conn.execute("SELECT key, size FROM responses ORDER BY last_used"):
+            if self._total_bytes <= self.max_bytes:
+                break
+            doomed.append((key,))
+            self._total_bytes -= size
+        self._conn.executemany("DELETE FROM responses WHERE key = ?", doomed)
+        self.stats["evicted"] += len(doomed)
+
+    def close(self):
+        with self._lock:
+            self._conn.close()
+
+    def format_stats(self):
+        return (
+            f"LLM response cache: {self.stats['hits']} hits, {self.stats['misses']} misses, "
+            f"{self.stats['stored']} stored, {self.stats['expired']} expired, {self.stats['evicted']} evicted"
+        )
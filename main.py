@@ -1,195 +1,75 @@
+import argparse
+import shlex
+from datetime import date, timedelta
+from pipeline import Pipeline
+from context_budget import DEFAULT_CONTEXT_TOKEN_BUDGET
+from bundle_fetcher import DEFAULT_BUNDLE_CACHE_DIR
+from run_state import RunState, RUN_STATE
+from metrics import add_arguments as add_metrics_arguments, configure_from_args, export_from_args
+import profiling
+
+def parse_args(argv=None):
+    parser = argparse.ArgumentParser(description="Fetch RUM JavaScript errors, enrich them with code context and analyze them with CrewAI.")
+    parser.add_argument("url", nargs="?", help="bundles.aem.page RUM bundle URL (a default sample URL is used if omitted)")
+    parser.add_argument("--concurrency", type=int, default=1,
+                        help="Number of errors enriched in parallel; 1 keeps the sequential path (default: 1)")
+    parser.add_argument("--per-host", type=int, default=4,
+                        help="Maximum in-flight JS downloads per host during enrichment (default: 4)")
+    parser.add_argument("--stream", action="store_true",
+                        help="Stream the bundle and keep only sessions with errors instead of loading the whole document")
+    parser.add_argument("--bundle-file",
+                        help="Stream RUM data from a local bundle file (.json or .json.gz) instead of fetching a URL")
+    parser.add_argument("--context-tokens", type=int, default=DEFAULT_CONTEXT_TOKEN_BUDGET,
+                        help=f"Token budget for the code context of each error (default: {DEFAULT_CONTEXT_TOKEN_BUDGET})")
+    parser.add_argument("--skip-minified", action="store_true",
+                        help="Drop errors from minified scripts instead of resolving them through source maps")
+    parser.add_argument("--state", default=RUN_STATE,
+                        help=f"Fingerprint state carried between runs; only new or changed errors are enriched and analyzed (default: {RUN_STATE})")
+    parser.add_argument("--full", action="store_true",
+                        help="Ignore the saved state: re-enrich and re-analyze every error, then record it again")
+    parser.add_argument("--no-intermediate-files", action="store_true",
+                        help="Stream errors straight into analysis without writing rum_errors_by_url*.json and the other per-stage files")
+    parser.add_argument("--analysis-args", type=shlex.split, default=[],
+                        help='Options for the analysis stage, as accepted by test_iterate_single_error.py (e.g. "--workers 8 --batch")')
+    bulk = parser.add_argument_group("bulk mode", "Fetch daily bundles for several domains over a date range and parse them as one run")
+    bulk.add_argument("--domains", help='JSON file with [{"domain": ..., "domainkey": ...}, ...]')
+    bulk.add_argument("--start", type=date.fromisoformat, help="First day (YYYY-MM-DD)")
+    bulk.add_argument("--end", type=date.fromisoformat, help="Last day (YYYY-MM-DD, default: --start, or today with --days)")
+    bulk.add_argument("--days", type=int, help="Rolling window of N days ending at --end")
+    bulk.add_argument("--download-workers", type=int, default=8, help="Parallel bundle downloads (default: 8)")
+    bulk.add_argument("--per-domain", type=int, default=2, help="Maximum in-flight downloads per domain (default: 2)")
+    bulk.add_argument("--bundle-cache", default=DEFAULT_BUNDLE_CACHE_DIR, help=f"Compressed bundle cache directory (default: {DEFAULT_BUNDLE_CACHE_DIR})")
+    bulk.add_argument("--refresh", action="store_true", help="Re-download bundles that are already cached")
+    add_metrics_arguments(parser)
+    profiling.add_arguments(parser)
+    args = parser.parse_args(argv)
+    for option in ("concurrency", "per_host", "download_workers", "per_domain"):
+        if getattr(args, option) < 1:
+            parser.error(f"--{option.replace('_', '-')} must be at least 1")
+    if args.domains:
+        if args.days:
+            args.end = args.end or date.today()
+            args.start = args.end - timedelta(days=args.days - 1)
+        elif not args.start:
+            parser.error("--domains needs --start or --days")
+        args.end = args.end or args.start
+        if args.end < args.start:
+            parser.error("--end must not be before --start")
+    return args
 
-import json
-import requests
-import re
-from urllib.parse import urlparse
-from datetime import datetime
-import os
-import sys
-
-# Define patterns that indicate malicious content
-MALICIOUS_PATTERNS = [
-    r"sleep\((\d+|\d+\*\d+)\)",
-    r"waitfor\s+delay",
-    r"select\s+\d+\s+from\s+pg_sleep",
-    r"xor\s*\(",
-    r"['\"%27%22][^ ]*['\"%27%22]",
-    r"concat\(",
-    r"(require|socket|gethostbyname)",
-    r"(win\.ini|etc/passwd)",
-    r"<script>|esi:include",
-    r"dbms_pipe\.receive_message",
-]
-
-# Compile regex patterns
-compiled_patterns = [re.compile(p, re.IGNORECASE) for p in MALICIOUS_PATTERNS]
-
-def is_safe_url(url: str) -> bool:
-    """Filters out URLs that match known malicious patterns or are not proper HTTP/HTTPS URLs."""
-    try:
-        parsed = urlparse(url)
-        if parsed.scheme not in ['http', 'https']:
-            return False
-    except:
-        return False
-
-    # Check for known malicious patterns
-    for pattern in compiled_patterns:
-        if pattern.search(url):
-            return False
-
-    return True
-
-def fetch_rum_data(url):
-    """Fetch RUM data from Shred-It."""
-    try:
-        response = requests.get(url)
-        response.raise_for_status()
-        return response.json()
-    except Exception as e:
-        print(f"Error fetching RUM data: {str(e)}")
-        return None
-
-def get_error_part_in_code(code_link, line, column, context_radius=20):
-    if not code_link or line is None or column is None:
-        return None
-    try:
-        response = requests.get(code_link, timeout=10)
-        if response.status_code != 200:
-            return f"⚠️ Failed to fetch JS file: HTTP {response.status_code}"
-        js_lines = response.text.splitlines()
-        # Convert to 0-based index
-        line_index = line - 1
-        if line_index < 0 or line_index >= len(js_lines):
-            return "Line number out of bounds!"
-        target_line = js_lines[line_index]
-        line_length = len(target_line)
-        if column < 0 or column >= line_length:
-            return "Column number out of bounds!"
-        start = max(0, column - context_radius)
-        end = min(line_length, column + context_radius + 1)
-        snippet = target_line[start:end]
-        return snippet
-    except Exception as e:
-        return f"❌ Exception: {str(e)}"
-
-def get_code_context_and_max_tokens(code_link, line, context_radius=30):
-    """Fetch 30 lines before and after the error line, return context and max words in any line."""
-    if not code_link or line is None:
-        return None, None
-    try:
-        response = requests.get(code_link, timeout=10)
-        if response.status_code != 200:
-            return f"⚠️ Failed to fetch JS file: HTTP {response.status_code}", None
-        js_lines = response.text.splitlines()
-        line_index = line - 1
-        start = max(0, line_index - context_radius)
-        end = min(len(js_lines), line_index + context_radius + 1)
-        context_lines = js_lines[start:end]
-        context_code = "\n".join(context_lines)
-        max_tokens = max((len(l.split()) for l in context_lines), default=0)
-        return context_code, max_tokens
-    except Exception as e:
-        return f"❌ Exception: {str(e)}", None
-
-def parse_rum_js_errors(rum_data):
-    """Parse RUM data to extract JavaScript errors."""
-    if not rum_data or 'rumBundles' not in rum_data:
-        return {}, {}, {}, {}, {}
-
-    rum_errors_by_url = {}
-    minified_errors = {}
-    embed_errors = {}
-    network_errors = {}
-    csp_violation_errors = {}
-
-    for session in rum_data['rumBundles']:
-        session_url = session.get("url")
-        if not session_url:
-            continue
-
-        for event in session.get("events", []):
-            if event.get("checkpoint") == "error":
-                # Filter out malicious URLs at this stage
-                if not is_safe_url(session_url):
-                    print(f"Skipping malicious URL: {session_url}")
-                    continue
-
-                error_source = event.get("source", "")
-                # Skip errors from minified files
-                if 'min' in error_source.lower():
-                    continue
-
-                if session_url not in rum_errors_by_url:
-                    rum_errors_by_url[session_url] = []
-
-                error_description = event.get("target", None)
-                code_link = None
-                line = None
-                column = None
-                match = re.search(r'(https?://[^\s:]+\.js)(?::(\d+))?(?::(\d+))?', error_source)
-                if match:
-                    code_link = match.group(1)
-                    if match.group(2):
-                        line = int(match.group(2))
-                    if match.group(3):
-                        column = int(match.group(3))
-                error_part_in_code = get_error_part_in_code(code_link, line, column)
-                context_code, max_tokens = get_code_context_and_max_tokens(code_link, line)
-                error_info = {
-                    "error_source": error_source,
-                    "user_agent": session.get("userAgent"),
-                    "code_link": code_link,
-                    "line": line,
-                    "column": column,
-                    "error_description": error_description,
-                    "error_part_in_code": error_part_in_code,
-                    "context_code": context_code,
-                    "max_tokens_length_in_code_context": max_tokens
-                }
-                rum_errors_by_url[session_url].append(error_info)
-
-    return rum_errors_by_url, minified_errors, embed_errors, network_errors, csp_violation_errors
-
-def split_errors_by_line_column(rum_errors_by_url):
-    errors_with_line_col = {}
-    errors_without_line_col = {}
-    for url, errors in rum_errors_by_url.items():
-        with_line_col = []
-        without_line_col = []
-        for err in errors:
-            if err.get("line") is not None and err.get("column") is not None:
-                with_line_col.append(err)
-            else:
-                without_line_col.append(err)
-        if with_line_col:
-            errors_with_line_col[url] = with_line_col
-        if without_line_col:
-            errors_without_line_col[url] = without_line_col
-    return errors_with_line_col, errors_without_line_col
-
-def keep_unique_error_descriptions(rum_errors_by_url):
-    unique_by_desc = {}
-    for url, errors in rum_errors_by_url.items():
-        seen = set()
-        unique_errors = []
-        for err in errors:
-            desc = err.get("error_description")
-            desc_norm = desc.strip().lower() if isinstance(desc, str) else desc
-            if desc_norm not in seen:
-                seen.add(desc_norm)
-                unique_errors.append(err)
-        if unique_errors:
-            unique_by_desc[url] = unique_errors
-    return unique_by_desc
 
 def main():
     # browser_collector = BrowserErrorCollector()
     # error_agents = ErrorAnalysisAgents()
+    args = parse_args()
+    configure_from_args(args)
+    profiling.start_from_args(args)
     try:
         print("main.py started", flush=True)
-        if len(sys.argv) > 1:
-            url = sys.argv[1]
+        if args.domains:
+            url = None
+        elif args.url:
+            url = args.url
             if url.startswith('@'):
                 print("Stripping leading '@' from URL", flush=True)
                 url = url[1:]
@@ -197,74 +77,39 @@ def main():
         else:
             url = "https://bundles.aem.page/bundles/www.wilson.com/2025/04/10?domainkey=B6A7571C-1066-48BD-911A-A22B5941DAD2-8E11F549&checkpoint=click"
             print("No URL provided, using default.", flush=True)
-        print(f"Fetching RUM data from: {url}", flush=True)
-        rum_data = fetch_rum_data(url)
+
+        pipeline = Pipeline(
+            concurrency=args.concurrency, per_host=args.per_host, token_budget=args.context_tokens,
+            deminify=not args.skip_minified, run_state=RunState(args.state, fresh=args.full),
+            analysis_argv=args.analysis_args,
+            write_intermediate=not args.no_intermediate_files,
+        )
+        if args.domains:
+            print(f"Bulk mode: {args.domains} from {args.start} to {args.end}", flush=True)
+            sessions = pipeline.fetch(domains=args.domains, start=args.start, end=args.end,
+                                      bundle_cache=args.bundle_cache, download_workers=args.download_workers,
+                                      per_domain=args.per_domain, refresh=args.refresh)
+        elif args.bundle_file:
+            print(f"Streaming RUM data from file: {args.bundle_file}", flush=True)
+            sessions = pipeline.fetch(bundle_file=args.bundle_file)
+        elif args.stream:
+            print(f"Streaming RUM data from: {url}", flush=True)
+            sessions = pipeline.fetch(url, stream=True)
+        else:
+            print(f"Fetching RUM data from: {url}", flush=True)
+            sessions = pipeline.fetch(url)
         print("Fetched RUM data", flush=True)
 
-        if not rum_data:
+        if not sessions:
             print("Failed to fetch RUM data")
             return
-        
-        rum_errors_by_url, minified_errors, embed_errors, network_errors, csp_violation_errors = parse_rum_js_errors(rum_data)
-
-        # Split errors by presence of line/column
-        rum_errors_by_url, errors_without_line_col = split_errors_by_line_column(rum_errors_by_url)
 
-        # Merge embed errors with errors without line/column
-        for url, embed_error_list in embed_errors.items():
-            if url in errors_without_line_col:
-                errors_without_line_col[url].extend(embed_error_list)
-            else:
-                errors_without_line_col[url] = embed_error_list
-
-        # Print total count of errors
-        total_errors = sum(len(errors) for errors in rum_errors_by_url.values())
-        total_embed_errors = sum(len(errors) for errors in embed_errors.values())
-        total_network_errors = sum(len(errors) for errors in network_errors.values())
-        total_csp_errors = sum(len(errors) for errors in csp_violation_errors.values())
-        print(f"Found {total_errors} JavaScript error events from {len(rum_errors_by_url)} unique URLs (after filtering malicious ones).")
-        print(f"Found {total_embed_errors} embed error events from {len(embed_errors)} unique URLs.")
-        print(f"Found {total_network_errors} network error events from {len(network_errors)} unique URLs.")
-        print(f"Found {total_csp_errors} CSP violation error events from {len(csp_violation_errors)} unique URLs.")
-
-        # Save RUM errors to JSON file
-        with open('rum_errors_by_url.json', 'w') as f:
-            json.dump(rum_errors_by_url, f, indent=2)
-        print("RUM errors saved to rum_errors_by_url.json")
-
-        # Save errors without line/column to a separate file
-        with open('errors_without_line_column.json', 'w') as f:
-            json.dump(errors_without_line_col, f, indent=2)
-        print("Errors without line/column saved to errors_without_line_column.json")
-
-        # Save network errors separately
-        if network_errors:
-            with open('network_errors.json', 'w') as f:
-                json.dump(network_errors, f, indent=2)
-            print("Network errors saved to network_errors.json")
-
-        # Save CSP violation errors separately
-        if csp_violation_errors:
-            with open('csp_violation_errors.json', 'w') as f:
-                json.dump(csp_violation_errors, f, indent=2)
-            print("CSP violation errors saved to csp_violation_errors.json")
-
-        # Save minified errors separately
-        if minified_errors:
-            with open('minified_errors.json', 'w') as f:
-                json.dump(minified_errors, f, indent=2)
-            print("Minified errors saved to minified_errors.json")
-
-        # Save unique error_description per URL
-        rum_errors_by_url_unique_description = keep_unique_error_descriptions(rum_errors_by_url)
-        with open('rum_errors_by_url_unique_description.json', 'w') as f:
-            json.dump(rum_errors_by_url_unique_description, f, indent=2)
-        print("RUM errors with unique error_description per URL saved to rum_errors_by_url_unique_description.json")
-
-        # Call CrewAI processing script
-        print("\nStarting CrewAI error analysis and processing...")
-        os.system("python3 test_iterate_single_error.py")
-        print("CrewAI processing completed!")
+        # Parse, enrich, deduplicate and analyze in one pass; CrewAI runs in this process
+        print("\nStarting error parsing, enrichment and CrewAI analysis...")
+        summary = pipeline.run(sessions)
+        print(f"Pipeline completed: {summary['fingerprints']} fingerprints, {summary['analyzed']} errors analyzed "
+              f"({summary['failed']} failed)")
+        export_from_args(args)
 
         # Collect error stacks using Playwright
         # print("\nCollecting error stacks using Playwright...")
@@ -273,12 +118,6 @@ def main():
         # total_stacks = sum(len(stacks) for stacks in error_stacks.values())
         # print(f"\nCollected {total_stacks} error stacks across {len(error_stacks)} URLs")
 
-        # Deminify errors using source maps
-        # print("\nDeminifying errors using source maps...")
-        # from deminify_errors import run_deminification
-        # run_deminification()
-        # print("Deminification complete. See deminified_errors.json.")
-
         # CrewAI error analysis and code fix
         # print("\nStarting CrewAI error analysis...")
         # error_agents.process_errors_in_batches("rum_errors_by_url.json", batch_size=2)
@@ -305,6 +144,9 @@ def main():
 
     except Exception as e:
         print(f"An unexpected error occurred: {str(e)}")
+    finally:
+        # Also written when the run fails, which is when the profile is most needed
+        profiling.finish_from_args(args)
 
 if __name__ == "__main__":
     main()
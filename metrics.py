@@ -0,0 +1,338 @@
+import json
+import logging
+import os
+import sys
+import threading
+import time
+from contextlib import contextmanager
+
+METRIC_PREFIX = "jserrors"
+# Histogram upper bounds in seconds: from in-memory cache hits to slow LLM calls and page loads
+DEFAULT_BUCKETS = (0.001, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30, 60, 120)
+LOGGER_NAME = "jserrors"
+
+
+class Histogram:
+    """Bucketed observations with their count, sum, min and max."""
+
+    def __init__(self, buckets=DEFAULT_BUCKETS):
+        self.buckets = tuple(buckets)
+        self.counts = [0] * (len(self.buckets) + 1)  # the last slot is +Inf
+        self.count = 0
+        self.sum = 0.0
+        self.min = None
+        self.max = None
+
+    def observe(self, value):
+        index = next((i for i, bound in enumerate(self.buckets) if value <= bound), len(self.buckets))
+        self.counts[index] += 1
+        self.count += 1
+        self.sum += value
+        self.min = value if self.min is None else min(self.min, value)
+        self.max = value if self.max is None else max(self.max, value)
+
+    def quantile(self, q):
+        """Upper bound of the bucket holding the q-quantile, capped at the largest observation."""
+        if not self.count:
+            return None
+        rank = q * self.count
+        seen = 0
+        for bound, count in zip(self.buckets, self.counts):
+            seen += count
+            if seen >= rank:
+                return min(bound, self.max)
+        return self.max
+
+    def merge(self, other):
+        """Add the observations of another histogram with the same buckets."""
+        self.counts = [a + b for a, b in zip(self.counts, other.counts)]
+        self.count += other.count
+        self.sum += other.sum
+        for value in (other.min, other.max):
+            if value is not None:
+                self.min = value if self.min is None else min(self.min, value)
+                self.max = value if self.max is None else max(self.max, value)
+
+    def summary(self):
+        return {
+            "count": self.count,
+            "sum": round(self.sum, 6),
+            "mean": round(self.sum / self.count, 6) if self.count else None,
+            "min": self.min,
+            "max": self.max,
+            "p50": self.quantile(0.5),
+            "p95": self.quantile(0.95),
+        }
+
+
+class StageTimer:
+    """Iterator wrapper that measures the time a stage spends producing its items.
+
+    With upstream (the StageTimer of the stage it reads from) the upstream time
+    is subtracted, so each stage of a generator chain reports only its own
+    work. The totals are added to stage_seconds_total and stage_items_total
+    once the stage is exhausted.
+    """
+
+    def __init__(self, metrics, stage, iterable, upstream=None):
+        self.metrics = metrics
+        self.stage = stage
+        self.iterator = iter(iterable)
+        self.upstream = upstream
+        self.seconds = 0.0
+        self.items = 0
+        self.recorded = False
+
+    def __iter__(self):
+        return self
+
+    def __next__(self):
+        started = time.perf_counter()
+        try:
+            item = next(self.iterator)
+        except StopIteration:
+            self.seconds += time.perf_counter() - started
+            self.record()
+            raise
+        self.seconds += time.perf_counter() - started
+        self.items += 1
+        return item
+
+    @property
+    def own_seconds(self):
+        return max(0.0, self.seconds - (self.upstream.seconds if self.upstream else 0.0))
+
+    def record(self):
+        if self.recorded:
+            return
+        self.recorded = True
+        self.metrics.inc("stage_seconds_total", self.own_seconds, stage=self.stage)
+        self.metrics.inc("stage_items_total", self.items, stage=self.stage)
+
+
+class Metrics:
+    """Thread-safe counters, gauges and histograms for one run.
+
+    Names are given without the jserrors_ prefix, which is added on export;
+    labels are keyword arguments. write_textfile writes the Prometheus text
+    format (for node_exporter's textfile collector) and write_summary a JSON
+    run summary with histogram percentiles.
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.started = time.time()
+        self.counters = {}
+        self.gauges = {}
+        self.histograms = {}
+
+    @staticmethod
+    def _key(name, labels):
+        return name, tuple(sorted((key, str(value)) for key, value in labels.items()))
+
+    def inc(self, name, amount=1, **labels):
+        key = self._key(name, labels)
+        with self._lock:
+            self.counters[key] = self.counters.get(key, 0) + amount
+
+    def set(self, name, value, **labels):
+        with self._lock:
+            self.gauges[self._key(name, labels)] = value
+
+    def observe(self, name, value, **labels):
+        key = self._key(name, labels)
+        with self._lock:
+            histogram = self.histograms.get(key)
+            if histogram is None:
+                histogram = self.histograms[key] = Histogram()
+            histogram.observe(value)
+
+    @contextmanager
+    def timer(self, name, **labels):
+        """Observe the duration of the with block in the name histogram, failed or not."""
+        started = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.observe(name, time.perf_counter() - started, **labels)
+
+    def track_stage(self, stage, iterable, upstream=None):
+        return StageTimer(self, stage, iterable, upstream)
+
+    def value(self, name, **labels):
+        """Current value of a counter (0 if never incremented)."""
+        with self._lock:
+            return self.counters.get(self._key(name, labels), 0)
+
+    def format_stages(self):
+        """One line with each stage's own time and item count, in the order the stages were first recorded."""
+        with self._lock:
+            stages = [dict(labels)["stage"] for name, labels in self.counters
+                      if name == "stage_seconds_total" and labels]
+            parts = []
+            for stage in stages:
+                seconds = self.counters[self._key("stage_seconds_total", {"stage": stage})]
+                items = self.counters.get(self._key("stage_items_total", {"stage": stage}))
+                parts.append(f"{stage} {seconds:.2f}s" + (f" ({items} items)" if items is not None else ""))
+        return f"Stage time: {', '.join(parts)}" if parts else "Stage time: no stages recorded"
+
+    def reset(self):
+        with self._lock:
+            self.started = time.time()
+            self.counters = {}
+            self.gauges = {}
+            self.histograms = {}
+
+    def state(self):
+        """Copies of the counters, gauges and histograms, to merge() into another process's registry."""
+        with self._lock:
+            return dict(self.counters), dict(self.gauges), dict(self.histograms)
+
+    def merge(self, state):
+        """Add a state() from a worker process: counters and histograms add up, gauges are replaced."""
+        counters, gauges, histograms = state
+        with self._lock:
+            for key, value in counters.items():
+                self.counters[key] = self.counters.get(key, 0) + value
+            self.gauges.update(gauges)
+            for key, histogram in histograms.items():
+                if key not in self.histograms:
+                    self.histograms[key] = Histogram(histogram.buckets)
+                self.histograms[key].merge(histogram)
+
+    def snapshot(self):
+        """The run summary as a JSON-serializable dict."""
+        with self._lock:
+            return {
+                "started_at": time.strftime("%Y-%m-%dT%H:%M:%S", time.localtime(self.started)),
+                "duration_seconds": round(time.time() - self.started, 3),
+                "counters": [{"name": name, "labels": dict(labels), "value": value}
+                             for (name, labels), value in sorted(self.counters.items())],
+                "gauges": [{"name": name, "labels": dict(labels), "value": value}
+                           for (name, labels), value in sorted(self.gauges.items())],
+                "histograms": [{"name": name, "labels": dict(labels), **histogram.summary()}
+                               for (name, labels), histogram in sorted(self.histograms.items())],
+            }
+
+    def prometheus_text(self):
+        lines = []
+        with self._lock:
+            for kind, series in (("counter", self.counters), ("gauge", self.gauges)):
+                for name in sorted({name for name, _ in series}):
+                    lines.append(f"# TYPE {METRIC_PREFIX}_{name} {kind}")
+                    for (series_name, labels), value in sorted(series.items()):
+                        if series_name == name:
+                            lines.append(f"{METRIC_PREFIX}_{name}{_labels(labels)} {_number(value)}")
+            for name in sorted({name for name, _ in self.histograms}):
+                lines.append(f"# TYPE {METRIC_PREFIX}_{name} histogram")
+                for (series_name, labels), histogram in sorted(self.histograms.items()):
+                    if series_name != name:
+                        continue
+                    cumulative = 0
+                    for bound, count in zip(histogram.buckets + ("+Inf",), histogram.counts):
+                        cumulative += count
+                        lines.append(f"{METRIC_PREFIX}_{name}_bucket{_labels(labels + (('le', str(bound)),))} {cumulative}")
+                    lines.append(f"{METRIC_PREFIX}_{name}_sum{_labels(labels)} {_number(histogram.sum)}")
+                    lines.append(f"{METRIC_PREFIX}_{name}_count{_labels(labels)} {histogram.count}")
+        return "\n".join(lines) + "\n"
+
+    def write_textfile(self, path):
+        """Write the Prometheus text format atomically, as the textfile collector requires."""
+        self.set("run_duration_seconds", round(time.time() - self.started, 3))
+        self.set("last_run_timestamp_seconds", int(time.time()))
+        _atomic_write(path, self.prometheus_text())
+
+    def write_summary(self, path):
+        _atomic_write(path, json.dumps(self.snapshot(), indent=2))
+
+
+def _labels(labels):
+    if not labels:
+        return ""
+    escaped = (value.replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n") for _, value in labels)
+    return "{" + ",".join(f'{key}="{value}"' for (key, _), value in zip(labels, escaped)) + "}"
+
+
+def _number(value):
+    return repr(float(value)) if isinstance(value, float) else str(value)
+
+
+def _atomic_write(path, text):
+    tmp_path = f"{path}.tmp.{os.getpid()}"
+    with open(tmp_path, "w", encoding="utf-8") as f:
+        f.write(text)
+    os.replace(tmp_path, path)
+
+
+# Registry shared by every module of the process
+metrics = Metrics()
+
+
+class SampleFilter(logging.Filter):
+    """Passes only every `every`th record per sample key (logger.info(..., extra={"sample": key})).
+
+    Records without a sample key, and warnings and errors, always pass.
+    """
+
+    def __init__(self, every=1):
+        super().__init__()
+        self.every = max(1, every)
+        self.seen = {}
+        self._lock = threading.Lock()
+
+    def filter(self, record):
+        key = getattr(record, "sample", None)
+        if key is None or self.every == 1 or record.levelno >= logging.WARNING:
+            return True
+        with self._lock:
+            seen = self.seen.get(key, 0)
+            self.seen[key] = seen + 1
+        return seen % self.every == 0
+
+
+def get_logger(name):
+    return logging.getLogger(f"{LOGGER_NAME}.{name}")
+
+
+def configure_logging(level="INFO", sample_every=1):
+    """Send the per-item log records to stdout, formatted like the scripts' own prints.
+
+    Until this is called only warnings and errors are shown, so library use
+    (benchmarks, notebooks) stays quiet.
+    """
+    handler = logging.StreamHandler(sys.stdout)
+    handler.setFormatter(logging.Formatter("%(message)s"))
+    handler.addFilter(SampleFilter(sample_every))
+    logger = logging.getLogger(LOGGER_NAME)
+    logger.handlers = [handler]
+    logger.setLevel(level.upper() if isinstance(level, str) else level)
+    logger.propagate = False
+
+
+def add_arguments(parser):
+    """Add the logging and metrics export options shared by the entry points."""
+    group = parser.add_argument_group("logging and metrics")
+    group.add_argument("--log-level", default="INFO", choices=("DEBUG", "INFO", "WARNING", "ERROR"),
+                       help="Per-item log level; DEBUG adds each error's details (default: INFO)")
+    group.add_argument("--log-sample", type=int, default=1,
+                       help="Show only every Nth per-item message of each kind; warnings are never sampled (default: 1)")
+    group.add_argument("--metrics-textfile",
+                       help="Write counters, timers and histograms in Prometheus text format to this file")
+    group.add_argument("--metrics-summary", help="Write a JSON run summary of the metrics to this file")
+    return group
+
+
+def configure_from_args(args):
+    configure_logging(args.log_level, args.log_sample)
+
+
+def export_from_args(args):
+    """Write the metrics files requested on the command line."""
+    for path, write in ((args.metrics_textfile, metrics.write_textfile), (args.metrics_summary, metrics.write_summary)):
+        if not path:
+            continue
+        try:
+            write(path)
+            print(f"📈 Metrics written to {path}")
+        except OSError as e:
+            print(f"⚠️ Could not write metrics to {path}: {e}")
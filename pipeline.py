@@ -0,0 +1,624 @@
+import json
+import re
+import threading
+import time
+from collections import deque
+from concurrent.futures import Future, ThreadPoolExecutor
+from functools import partial
+from urllib.parse import urlparse
+
+import requests
+
+from js_source_cache import JSSourceCache
+from rum_stream import iter_error_sessions_from_file, iter_error_sessions_from_url
+from source_map import SourceMapResolver
+from context_budget import DEFAULT_CONTEXT_TOKEN_BUDGET, build_scope_context
+from error_fingerprint import add_occurrence, error_fingerprint
+from bundle_fetcher import fetch_bundles, iter_error_sessions_from_bundles, load_domains, DEFAULT_BUNDLE_CACHE_DIR
+from metrics import get_logger, metrics
+import profiling
+
+log = get_logger("pipeline")
+
+# Errors analyzed per window when errors stream into the analysis stage
+DEFAULT_ANALYSIS_WINDOW = 32
+
+
+# Define patterns that indicate malicious content
+MALICIOUS_PATTERNS = [
+    r"sleep\((\d+|\d+\*\d+)\)",
+    r"waitfor\s+delay",
+    r"select\s+\d+\s+from\s+pg_sleep",
+    r"xor\s*\(",
+    r"['\"%27%22][^ ]*['\"%27%22]",
+    r"concat\(",
+    r"(require|socket|gethostbyname)",
+    r"(win\.ini|etc/passwd)",
+    r"<script>|esi:include",
+    r"dbms_pipe\.receive_message",
+]
+
+# Compile regex patterns
+compiled_patterns = [re.compile(p, re.IGNORECASE) for p in MALICIOUS_PATTERNS]
+
+# Shared cache for JS sources referenced by errors, so each script is downloaded once
+js_source_cache = JSSourceCache()
+
+# Parsed source maps, shared by every error raised from the same minified script
+source_map_resolver = SourceMapResolver(js_source_cache)
+
+def is_safe_url(url: str) -> bool:
+    """Filters out URLs that match known malicious patterns or are not proper HTTP/HTTPS URLs."""
+    try:
+        parsed = urlparse(url)
+        if parsed.scheme not in ['http', 'https']:
+            return False
+    except:
+        return False
+
+    # Check for known malicious patterns
+    for pattern in compiled_patterns:
+        if pattern.search(url):
+            return False
+
+    return True
+
+def fetch_rum_data(url):
+    """Fetch RUM data from Shred-It."""
+    try:
+        with metrics.timer("bundle_fetch_seconds", source="url"):
+            response = requests.get(url)
+            response.raise_for_status()
+            rum_data = response.json()
+        metrics.inc("bundle_fetch_total", source="url", outcome="fetched")
+        return rum_data
+    except Exception as e:
+        metrics.inc("bundle_fetch_total", source="url", outcome="failed")
+        print(f"Error fetching RUM data: {str(e)}")
+        return None
+
+def stream_rum_data(url):
+    """Stream RUM data from Shred-It, yielding only sessions that contain errors."""
+    try:
+        return iter_error_sessions_from_url(url)
+    except Exception as e:
+        print(f"Error fetching RUM data: {str(e)}")
+        return None
+
+def get_error_part_in_code(code_link, line, column, context_radius=20):
+    if not code_link or line is None or column is None:
+        return None
+    try:
+        source = js_source_cache.get(code_link)
+        if source.status_code != 200:
+            return f"⚠️ Failed to fetch JS file: HTTP {source.status_code}"
+        # RUM lines and columns are 1-based, as in V8 stack traces; convert to 0-based indexes
+        line_index = line - 1
+        column_index = column - 1
+        if line_index < 0 or line_index >= source.line_count:
+            return "Line number out of bounds!"
+        target_line = source.line(line_index)
+        line_length = len(target_line)
+        if column_index < 0 or column_index >= line_length:
+            return "Column number out of bounds!"
+        start = max(0, column_index - context_radius)
+        end = min(line_length, column_index + context_radius + 1)
+        snippet = target_line[start:end]
+        return snippet
+    except Exception as e:
+        return f"❌ Exception: {str(e)}"
+
+def get_code_context_and_max_tokens(code_link, line, context_radius=30):
+    """Fetch 30 lines before and after the error line, return context and max words in any line."""
+    if not code_link or line is None:
+        return None, None
+    try:
+        source = js_source_cache.get(code_link)
+        if source.status_code != 200:
+            return f"⚠️ Failed to fetch JS file: HTTP {source.status_code}", None
+        line_index = line - 1
+        start = max(0, line_index - context_radius)
+        end = min(source.line_count, line_index + context_radius + 1)
+        context_lines = source.lines(start, end)
+        context_code = "\n".join(context_lines)
+        max_tokens = max((len(l.split()) for l in context_lines), default=0)
+        return context_code, max_tokens
+    except Exception as e:
+        return f"❌ Exception: {str(e)}", None
+
+def get_code_context_within_budget(code_link, line, column, token_budget=DEFAULT_CONTEXT_TOKEN_BUDGET):
+    """Smallest enclosing function/method of the error if it fits token_budget, else the largest
+    window around the error line that does, with long lines cropped around the column."""
+    if not code_link or line is None:
+        return {"context_code": None}
+    try:
+        source = js_source_cache.get(code_link)
+        if source.status_code != 200:
+            return {"context_code": f"⚠️ Failed to fetch JS file: HTTP {source.status_code}"}
+        # 1-based line and column (as reported by RUM) to the 0-based indexes build_scope_context expects
+        column_index = max(column - 1, 0) if column is not None else None
+        context = build_scope_context(source, line - 1, column_index, token_budget)
+        context["code_content_hash"] = source.content_hash
+        return context
+    except Exception as e:
+        return {"context_code": f"❌ Exception: {str(e)}"}
+
+@profiling.profiled("enrich")
+def enrich_error(error_info, token_budget=DEFAULT_CONTEXT_TOKEN_BUDGET):
+    """Fill in the code snippet and context fields of a parsed error."""
+    code_link = error_info["code_link"]
+    line = error_info["line"]
+    column = error_info["column"]
+    with metrics.timer("snippet_extraction_seconds", part="snippet"):
+        error_info["error_part_in_code"] = get_error_part_in_code(code_link, line, column)
+    with metrics.timer("snippet_extraction_seconds", part="context"):
+        context = get_code_context_within_budget(code_link, line, column, token_budget)
+    error_info["context_code"] = context["context_code"]
+    error_info["max_tokens_length_in_code_context"] = context.get("max_tokens")
+    error_info["context_tokens"] = context.get("context_tokens")
+    error_info["context_start_line"] = context.get("context_start_line")
+    error_info["context_end_line"] = context.get("context_end_line")
+    error_info["context_scope"] = context.get("context_scope")
+    error_info["code_content_hash"] = context.get("code_content_hash")
+    return error_info
+
+ENRICHED_FIELDS = ("error_part_in_code", "context_code", "max_tokens_length_in_code_context",
+                   "context_tokens", "context_start_line", "context_end_line", "context_scope",
+                   "code_content_hash")
+
+def enrich_errors(errors, concurrency=1, token_budget=DEFAULT_CONTEXT_TOKEN_BUDGET):
+    """Enrich errors in place, sequentially or on a thread pool of `concurrency` workers."""
+    if concurrency <= 1:
+        for error_info in errors:
+            enrich_error(error_info, token_budget)
+        return errors
+    with ThreadPoolExecutor(max_workers=concurrency) as executor:
+        # Consume the iterator so worker exceptions surface here
+        for _ in executor.map(partial(enrich_error, token_budget=token_budget), errors):
+            pass
+    return errors
+
+def script_content_hash(code_link):
+    """Current content hash of a script (a conditional request when it is cached on disk), or None."""
+    if not code_link:
+        return None
+    try:
+        return js_source_cache.get(code_link).content_hash
+    except Exception:
+        return None
+
+def _task_result(task):
+    return task.result() if isinstance(task, Future) else task
+
+def parse_stage(sessions, deminify=True, error_fingerprints=None):
+    """Yield ("error", page_url, error_info) for every JavaScript error event in sessions.
+
+    Errors from minified scripts are mapped back to their original location
+    through the script's source map (deminify=True); those without a usable map
+    are yielded as ("minified", page_url, record) instead. When
+    error_fingerprints is given, every occurrence is added to its per-fingerprint
+    aggregates there.
+    """
+    for session in sessions:
+        metrics.inc("rum_sessions_total")
+        session_url = session.get("url")
+        if not session_url:
+            continue
+
+        for event in session.get("events", []):
+            if event.get("checkpoint") == "error":
+                # Filter out malicious URLs at this stage
+                if not is_safe_url(session_url):
+                    metrics.inc("rum_error_events_total", kind="unsafe_url")
+                    log.info(f"Skipping malicious URL: {session_url}", extra={"sample": "unsafe_url"})
+                    continue
+
+                error_source = event.get("source", "")
+                is_minified = 'min' in error_source.lower()
+                # Minified files are only useful once mapped back to their original source
+                if is_minified and not deminify:
+                    metrics.inc("rum_error_events_total", kind="minified_skipped")
+                    continue
+
+                error_description = event.get("target", None)
+                code_link = None
+                line = None
+                column = None
+                match = re.search(r'(https?://[^\s:]+\.js)(?::(\d+))?(?::(\d+))?', error_source)
+                if match:
+                    code_link = match.group(1)
+                    if match.group(2):
+                        line = int(match.group(2))
+                    if match.group(3):
+                        column = int(match.group(3))
+
+                original = None
+                if is_minified:
+                    original = source_map_resolver.resolve(code_link, line, column)
+                    if original is None:
+                        metrics.inc("rum_error_events_total", kind="minified")
+                        yield "minified", session_url, {
+                            "error_source": error_source,
+                            "user_agent": session.get("userAgent"),
+                            "code_link": code_link,
+                            "line": line,
+                            "column": column,
+                            "error_description": error_description
+                        }
+                        continue
+
+                error_info = {
+                    "error_source": error_source,
+                    "user_agent": session.get("userAgent"),
+                    "code_link": code_link,
+                    "line": line,
+                    "column": column,
+                    "error_description": error_description,
+                    "fingerprint": error_fingerprint(error_description, code_link, line, column),
+                    "error_part_in_code": None,
+                    "context_code": None,
+                    "max_tokens_length_in_code_context": None,
+                    "context_tokens": None,
+                    "context_start_line": None,
+                    "context_end_line": None,
+                    "context_scope": None,
+                    "code_content_hash": None
+                }
+                if original is not None:
+                    # Report and enrich the original location; keep where the browser saw it
+                    error_info["minified_location"] = {"code_link": code_link, "line": line, "column": column}
+                    error_info["original_name"] = original["name"]
+                    error_info["code_link"] = code_link = original["source"]
+                    error_info["line"] = line = original["line"]
+                    error_info["column"] = column = original["column"]
+                    error_info["fingerprint"] = error_fingerprint(error_description, code_link, line, column)
+                if error_fingerprints is not None:
+                    add_occurrence(error_fingerprints, error_info, session_url)
+                metrics.inc("rum_error_events_total", kind="deminified" if original is not None else "error")
+                yield "error", session_url, error_info
+
+def enrich_stage(records, concurrency=1, token_budget=DEFAULT_CONTEXT_TOKEN_BUDGET, run_state=None):
+    """Enrich the errors among parse_stage records, yielding every record in its original order.
+
+    Only the first occurrence of each fingerprint is enriched; later ones get
+    a copy of its fields. With concurrency > 1 enrichment runs on a thread pool
+    that reads at most concurrency * 4 records ahead of the consumer. With a
+    run_state (run_state.RunState), fingerprints whose script content is
+    unchanged since an earlier run reuse that run's enrichment instead, and
+    newly enriched ones are recorded in it.
+    """
+    counts = {"enriched": 0, "reused": 0}
+    counts_lock = threading.Lock()
+    content_hashes = {}
+
+    def enrich_representative(error_info):
+        if run_state is not None:
+            code_link = error_info["code_link"]
+            if code_link not in content_hashes:
+                content_hashes[code_link] = script_content_hash(code_link)
+            if run_state.restore_enrichment(error_info, content_hashes[code_link], ENRICHED_FIELDS):
+                with counts_lock:
+                    counts["reused"] += 1
+                metrics.inc("enrichment_total", result="reused")
+                return error_info
+        enrich_error(error_info, token_budget)
+        if run_state is not None:
+            run_state.record_enrichment(error_info, ENRICHED_FIELDS)
+        with counts_lock:
+            counts["enriched"] += 1
+        metrics.inc("enrichment_total", result="enriched")
+        return error_info
+
+    def finish(entry):
+        kind, url, record, task = entry
+        if task is not None:
+            enriched = _task_result(task)
+            if enriched is not record:
+                for field in ENRICHED_FIELDS:
+                    record[field] = enriched[field]
+        return kind, url, record
+
+    executor = ThreadPoolExecutor(max_workers=concurrency) if concurrency > 1 else None
+    lookahead = concurrency * 4 if executor else 0
+    representatives = {}
+    window = deque()
+    try:
+        for kind, url, record in records:
+            task = None
+            if kind == "error":
+                task = representatives.get(record["fingerprint"])
+                if task is None:
+                    task = (executor.submit(enrich_representative, record) if executor
+                            else enrich_representative(record))
+                    representatives[record["fingerprint"]] = task
+            window.append((kind, url, record, task))
+            while len(window) > lookahead:
+                yield finish(window.popleft())
+        while window:
+            yield finish(window.popleft())
+    finally:
+        if executor:
+            executor.shutdown(wait=True, cancel_futures=True)
+    if run_state is not None:
+        total = counts["enriched"] + counts["reused"]
+        print(f"♻️ Reused enrichment of {counts['reused']}/{total} fingerprints from {run_state.path} "
+              f"(script unchanged)", flush=True)
+
+def dedup_stage(records):
+    """Yield (page_url, idx, error_info) for errors with a line and column, one per description per page.
+
+    idx counts the errors kept for each page, as in the lists written to
+    rum_errors_by_url_unique_description.json, so analysis result keys are the
+    same whether errors come from that file or from this stage.
+    """
+    seen = {}
+    for kind, url, error_info in records:
+        if kind != "error" or error_info.get("line") is None or error_info.get("column") is None:
+            continue
+        desc = error_info.get("error_description")
+        desc_norm = desc.strip().lower() if isinstance(desc, str) else desc
+        page_seen = seen.setdefault(url, set())
+        if desc_norm in page_seen:
+            continue
+        page_seen.add(desc_norm)
+        yield url, len(page_seen) - 1, error_info
+
+class RecordCollector:
+    """Groups records passing through a stage by page URL, for the JSON files main.py can write."""
+
+    def __init__(self):
+        self.rum_errors_by_url = {}
+        self.minified_errors = {}
+
+    def tap(self, records):
+        for kind, url, record in records:
+            bucket = self.rum_errors_by_url if kind == "error" else self.minified_errors
+            bucket.setdefault(url, []).append(record)
+            yield kind, url, record
+
+def parse_rum_js_errors(rum_data, concurrency=1, deminify=True, token_budget=DEFAULT_CONTEXT_TOKEN_BUDGET,
+                        run_state=None):
+    """Parse RUM data to extract JavaScript errors.
+
+    rum_data is either a fetched bundle ({"rumBundles": [...]}) or any iterable
+    of sessions, such as the streaming readers in rum_stream.
+
+    Errors are collected and fingerprinted first (normalized description, code
+    link, line, column) and only one representative per fingerprint is enriched;
+    its snippet and context are then copied to every other occurrence. Enrichment
+    can run on a thread pool (concurrency > 1) while the output keeps the
+    sequential order. Each context window is sized to fit token_budget tokens.
+
+    Errors raised from minified scripts are mapped back to their original
+    file/line/column through the script's source map (deminify=True) and then
+    handled like any other error; those without a usable map are returned in
+    minified_errors instead of being dropped.
+
+    The last return value maps each fingerprint to its aggregates: occurrence
+    count, affected URLs and user agents (each with counts).
+
+    With a run_state (run_state.RunState), fingerprints whose script content is
+    unchanged since an earlier run reuse that run's enrichment instead of being
+    enriched again; newly enriched ones are recorded in it.
+
+    This collects parse_stage and enrich_stage into dictionaries; Pipeline
+    streams the same stages instead.
+    """
+    sessions = rum_data.get('rumBundles') if isinstance(rum_data, dict) else rum_data
+    if not rum_data or sessions is None:
+        return {}, {}, {}, {}, {}, {}
+
+    error_fingerprints = {}
+    collector = RecordCollector()
+    fetched = metrics.track_stage("fetch", profiling.track("fetch", sessions))
+    parsed = metrics.track_stage("parse", profiling.track("parse", parse_stage(fetched, deminify, error_fingerprints)),
+                                 fetched)
+    records = metrics.track_stage("enrich", enrich_stage(parsed, concurrency, token_budget, run_state), parsed)
+    for _ in collector.tap(records):
+        pass
+    return collector.rum_errors_by_url, collector.minified_errors, {}, {}, {}, error_fingerprints
+
+def split_errors_by_line_column(rum_errors_by_url):
+    errors_with_line_col = {}
+    errors_without_line_col = {}
+    for url, errors in rum_errors_by_url.items():
+        with_line_col = []
+        without_line_col = []
+        for err in errors:
+            if err.get("line") is not None and err.get("column") is not None:
+                with_line_col.append(err)
+            else:
+                without_line_col.append(err)
+        if with_line_col:
+            errors_with_line_col[url] = with_line_col
+        if without_line_col:
+            errors_without_line_col[url] = without_line_col
+    return errors_with_line_col, errors_without_line_col
+
+def keep_unique_error_descriptions(rum_errors_by_url):
+    unique_by_desc = {}
+    for url, errors in rum_errors_by_url.items():
+        seen = set()
+        unique_errors = []
+        for err in errors:
+            desc = err.get("error_description")
+            desc_norm = desc.strip().lower() if isinstance(desc, str) else desc
+            if desc_norm not in seen:
+                seen.add(desc_norm)
+                unique_errors.append(err)
+        if unique_errors:
+            unique_by_desc[url] = unique_errors
+    return unique_by_desc
+
+def write_json_if_changed(path, data):
+    """Write data as indented JSON unless path already holds exactly that; returns True if written."""
+    content = json.dumps(data, indent=2)
+    try:
+        with open(path, 'r') as f:
+            if f.read() == content:
+                return False
+    except OSError:
+        pass
+    with open(path, 'w') as f:
+        f.write(content)
+    return True
+
+def fetch_bulk_rum_data(domains_file, start, end, bundle_cache=DEFAULT_BUNDLE_CACHE_DIR, download_workers=8,
+                        per_domain=2, refresh=False):
+    """Fetch every daily bundle for the configured domains and stream them as one merged run."""
+    domains = load_domains(domains_file)
+    paths = fetch_bundles(domains, start, end, cache_dir=bundle_cache,
+                          max_workers=download_workers, max_per_domain=per_domain,
+                          refresh=refresh)
+    print(f"{len(paths)} bundles available for {len(domains)} domains from {start} to {end}", flush=True)
+    return iter_error_sessions_from_bundles(paths) if paths else None
+
+def write_intermediate_files(rum_errors_by_url, minified_errors, error_fingerprints):
+    """Write the per-stage JSON files main.py has always produced; unchanged files are left untouched."""
+    rum_errors_by_url, errors_without_line_col = split_errors_by_line_column(rum_errors_by_url)
+
+    total_errors = sum(len(errors) for errors in rum_errors_by_url.values())
+    print(f"Found {total_errors} JavaScript error events from {len(rum_errors_by_url)} unique URLs (after filtering malicious ones).")
+    print(f"Found {sum(len(errors) for errors in minified_errors.values())} minified error events without a usable source map.")
+    print(f"Found {len(error_fingerprints)} unique error fingerprints across all URLs.")
+
+    # Save RUM errors to JSON file
+    if write_json_if_changed('rum_errors_by_url.json', rum_errors_by_url):
+        print("RUM errors saved to rum_errors_by_url.json")
+
+    # Save per-fingerprint aggregates (occurrences, affected URLs, user agents)
+    if write_json_if_changed('error_fingerprints.json', error_fingerprints):
+        print("Error fingerprints saved to error_fingerprints.json")
+
+    # Save errors without line/column to a separate file
+    if write_json_if_changed('errors_without_line_column.json', errors_without_line_col):
+        print("Errors without line/column saved to errors_without_line_column.json")
+
+    # Save minified errors separately
+    if minified_errors:
+        if write_json_if_changed('minified_errors.json', minified_errors):
+            print("Minified errors saved to minified_errors.json")
+
+    # Save unique error_description per URL
+    rum_errors_by_url_unique_description = keep_unique_error_descriptions(rum_errors_by_url)
+    if write_json_if_changed('rum_errors_by_url_unique_description.json', rum_errors_by_url_unique_description):
+        print("RUM errors with unique error_description per URL saved to rum_errors_by_url_unique_description.json")
+
+class Pipeline:
+    """fetch → parse → enrich → dedup → analyze → persist, with records passed in memory.
+
+    Every stage is a generator over the previous stage's output, so records
+    are pulled through one at a time. Enrichment reads at most a few records
+    per worker ahead, and analysis at most analysis_window errors ahead, so
+    memory stays bounded by the windows rather than the bundle size. The JSON
+    files of earlier versions are only written with write_intermediate=True,
+    which keeps every record until the end.
+
+    Analysis uses test_iterate_single_error.ErrorAnalysisRun with the options
+    of that script's command line (analysis_argv). It is imported and built
+    only once an error actually needs analysis, so a run with nothing new
+    never loads the agent stack.
+
+        pipeline = Pipeline(concurrency=8, run_state=RunState())
+        summary = pipeline.run(pipeline.fetch(bundle_file="bundle.json.gz"))
+    """
+
+    def __init__(self, concurrency=1, per_host=4, token_budget=DEFAULT_CONTEXT_TOKEN_BUDGET, deminify=True,
+                 run_state=None, analysis_argv=(), analysis_window=DEFAULT_ANALYSIS_WINDOW, write_intermediate=False):
+        self.concurrency = concurrency
+        self.per_host = per_host
+        self.token_budget = token_budget
+        self.deminify = deminify
+        self.run_state = run_state
+        self.analysis_argv = list(analysis_argv)
+        self.analysis_window = analysis_window
+        self.write_intermediate = write_intermediate
+        self.error_fingerprints = {}
+        self.collector = RecordCollector() if write_intermediate else None
+        self.analysis = None
+
+    def fetch(self, url=None, bundle_file=None, stream=False, domains=None, start=None, end=None, **bulk_options):
+        """Sessions from a bundle URL (fetched whole, or streamed with stream=True), a local bundle file,
+        or every daily bundle of a domains file between start and end; None if nothing could be fetched."""
+        if domains:
+            return fetch_bulk_rum_data(domains, start, end, **bulk_options)
+        if bundle_file:
+            return iter_error_sessions_from_file(bundle_file)
+        if stream:
+            return stream_rum_data(url)
+        rum_data = fetch_rum_data(url)
+        return rum_data.get('rumBundles') if isinstance(rum_data, dict) else rum_data
+
+    def parse(self, sessions):
+        return parse_stage(sessions, self.deminify, self.error_fingerprints)
+
+    def enrich(self, records):
+        js_source_cache.configure_pool(pool_size=max(self.concurrency, 1), max_per_host=self.per_host)
+        records = enrich_stage(records, self.concurrency, self.token_budget, self.run_state)
+        return self.collector.tap(records) if self.collector else records
+
+    def dedup(self, records):
+        return dedup_stage(records)
+
+    def _start_analysis(self):
+        import test_iterate_single_error as iterate
+        args = iterate.parse_args(self.analysis_argv)
+        self.analysis = iterate.ErrorAnalysisRun(args, run_state=self.run_state)
+        return self.analysis
+
+    def analyze(self, items):
+        """Yield (error_key, ok) for every (page_url, idx, error_info) item that needed analysis, window by window.
+
+        Items are selected as they arrive; those that need no analysis only leave their result key
+        behind. The agent stack is loaded by the first window that has something to analyze.
+        """
+        analysis = self.analysis
+        pending = []
+        for url, idx, error_info in items:
+            if analysis is None:
+                analysis = self._start_analysis()
+            selected = analysis.select(url, idx, error_info)
+            if selected:
+                pending.append(selected)
+            if len(pending) >= self.analysis_window:
+                yield from zip((selected[2] for selected in pending), analysis.analyze(pending))
+                pending = []
+        if pending:
+            yield from zip((selected[2] for selected in pending), analysis.analyze(pending))
+
+    def persist(self, outcomes):
+        """Drain the analysis outcomes, then write results, run state and any intermediate files; returns a summary."""
+        analyzed = failed = 0
+        for _, ok in outcomes:
+            analyzed += 1
+            failed += not ok
+        started = time.perf_counter()
+        if self.collector:
+            write_intermediate_files(self.collector.rum_errors_by_url, self.collector.minified_errors,
+                                     self.error_fingerprints)
+        if self.analysis:
+            # Also saves the run state, after the analyses it records
+            self.analysis.finish()
+            if self.run_state is not None and not self.analysis.pending_count:
+                print("\n✅ No new or changed errors since the last analysis; no LLM calls were made.")
+        elif self.run_state is not None:
+            self.run_state.save()
+            print("\n✅ No new or changed errors since the last analysis; skipping CrewAI processing.")
+        metrics.inc("stage_seconds_total", time.perf_counter() - started, stage="persist")
+        print(js_source_cache.format_stats(), flush=True)
+        print(source_map_resolver.format_stats(), flush=True)
+        print(metrics.format_stages(), flush=True)
+        return {"fingerprints": len(self.error_fingerprints), "analyzed": analyzed, "failed": failed}
+
+    def run(self, sessions):
+        """Run every stage after fetch over sessions; returns persist()'s summary.
+
+        Each stage's own time and item count go to the stage_seconds_total and
+        stage_items_total metrics ("fetch" is the time spent reading sessions).
+        """
+        fetched = metrics.track_stage("fetch", profiling.track("fetch", sessions))
+        parsed = metrics.track_stage("parse", profiling.track("parse", self.parse(fetched)), fetched)
+        enriched = metrics.track_stage("enrich", self.enrich(parsed), parsed)
+        deduped = metrics.track_stage("dedup", self.dedup(enriched), enriched)
+        analyzed = metrics.track_stage("analyze", self.analyze(deduped), deduped)
+        return self.persist(analyzed)
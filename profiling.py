@@ -0,0 +1,408 @@
+import cProfile
+import functools
+import json
+import os
+import pstats
+import sys
+import threading
+import time
+import tracemalloc
+
+DEFAULT_PROFILE_DIR = "profile"
+DEFAULT_TOP = 25
+# Deep enough to reach from an allocation inside crewai/litellm back up to the stage that made it
+TRACEMALLOC_FRAMES = 64
+# A new peak snapshot is taken when traced memory has grown by this factor since the last one
+PEAK_SNAPSHOT_GROWTH = 1.25
+PEAK_SNAPSHOT_MIN_BYTES = 8 << 20
+
+
+class StageProfiler:
+    """cProfile and tracemalloc scoped to named pipeline stages.
+
+    Code runs inside a stage through stage() (a with block), the profiled()
+    decorator or track() (each item pulled from a generator stage). Every
+    thread keeps a stack of the stages it is in; only the innermost one is
+    profiled, so a stage's CPU profile and time exclude the stages nested in
+    it, such as fetch inside parse when the pipeline streams records. Memory
+    growth is the change in traced memory over the stage, likewise excluding
+    nested stages; with several threads it includes their allocations too.
+
+    tracemalloc records allocations with deep tracebacks. A snapshot is taken
+    whenever traced memory reaches a new high (by PEAK_SNAPSHOT_GROWTH), and
+    its allocations are attributed to the innermost stage code on their
+    traceback, so the report shows what each stage was holding at the peak.
+
+    Worker processes profile themselves (start_worker()) and return state(),
+    which the parent merge()s: their stage times, calls, memory growth and CPU
+    profiles are added to the parent's, while allocation sites cover only the
+    parent process.
+
+    write_report() writes <stage>.prof (pstats, e.g. for snakeviz),
+    <stage>.txt and profile_report.json, which holds every stage's time,
+    calls, memory growth, top functions and top allocation sites.
+    """
+
+    def __init__(self, output_dir=DEFAULT_PROFILE_DIR, top=DEFAULT_TOP, frames=TRACEMALLOC_FRAMES):
+        self.output_dir = output_dir
+        self.top = top
+        self.frames = frames
+        self.stages = {}
+        self._profiles = {}
+        # pstats dicts of worker processes, by stage, from merge()
+        self._worker_profiles = {}
+        self._code_ranges = {}
+        self._local = threading.local()
+        self._lock = threading.Lock()
+        self._snapshot_lock = threading.Lock()
+        self.peak_snapshot = None
+        self.peak_snapshot_bytes = 0
+        self.started = None
+
+    def start(self):
+        self.started = time.time()
+        if not tracemalloc.is_tracing():
+            tracemalloc.start(self.frames)
+
+    def _stats(self, name):
+        stats = self.stages.get(name)
+        if stats is None:
+            stats = self.stages[name] = {"calls": 0, "seconds": 0.0, "cpu_unprofiled_calls": 0,
+                                         "memory_growth_bytes": 0, "max_traced_bytes": 0}
+        return stats
+
+    def register_code(self, name, code):
+        """Attribute allocations made under code (a function's code object) to stage name."""
+        if code is None or code in self._code_ranges:
+            return
+        lines = [line for _, _, line in code.co_lines() if line is not None] or [code.co_firstlineno]
+        with self._lock:
+            self._code_ranges[code] = (code.co_filename, min(lines), max(lines), name)
+
+    def _profile(self, name):
+        key = (name, threading.get_ident())
+        with self._lock:
+            profile = self._profiles.get(key)
+            if profile is None:
+                profile = self._profiles[key] = cProfile.Profile()
+        return profile
+
+    def _stack(self):
+        stack = getattr(self._local, "stack", None)
+        if stack is None:
+            stack = self._local.stack = []
+        return stack
+
+    def enter(self, name):
+        stack = self._stack()
+        if stack and stack[-1]["profile"] is not None:
+            stack[-1]["profile"].disable()
+        profile = self._profile(name)
+        try:
+            profile.enable()
+        except ValueError:
+            # Python 3.12+ allows one active profiler per process; another thread holds it
+            profile = None
+        stack.append({"name": name, "profile": profile, "started": time.perf_counter(), "nested": 0.0,
+                      "traced": tracemalloc.get_traced_memory()[0], "nested_growth": 0})
+
+    def exit(self):
+        stack = self._stack()
+        entry = stack.pop()
+        if entry["profile"] is not None:
+            entry["profile"].disable()
+        elapsed = time.perf_counter() - entry["started"]
+        traced = tracemalloc.get_traced_memory()[0]
+        growth = traced - entry["traced"]
+        with self._lock:
+            stats = self._stats(entry["name"])
+            stats["calls"] += 1
+            stats["seconds"] += elapsed - entry["nested"]
+            stats["cpu_unprofiled_calls"] += entry["profile"] is None
+            stats["memory_growth_bytes"] += growth - entry["nested_growth"]
+            stats["max_traced_bytes"] = max(stats["max_traced_bytes"], traced)
+        if stack:
+            stack[-1]["nested"] += elapsed
+            stack[-1]["nested_growth"] += growth
+            if stack[-1]["profile"] is not None:
+                stack[-1]["profile"].enable()
+        self._maybe_snapshot(traced)
+
+    def _maybe_snapshot(self, traced):
+        if traced < max(PEAK_SNAPSHOT_MIN_BYTES, self.peak_snapshot_bytes * PEAK_SNAPSHOT_GROWTH):
+            return
+        if not self._snapshot_lock.acquire(blocking=False):
+            return
+        try:
+            self.peak_snapshot = tracemalloc.take_snapshot()
+            self.peak_snapshot_bytes = traced
+        finally:
+            self._snapshot_lock.release()
+
+    def _stage_of(self, traceback, ranges):
+        for frame in reversed(traceback):
+            for first, last, name in ranges.get(frame.filename, ()):
+                if first <= frame.lineno <= last:
+                    return name
+        return None
+
+    def allocation_sites(self, snapshot):
+        """{stage or None: [(size, count, "file:line")]} for the snapshot, largest first."""
+        ranges = {}
+        for filename, first, last, name in self._code_ranges.values():
+            ranges.setdefault(filename, []).append((first, last, name))
+        sites = {}
+        for trace in snapshot.traces:
+            traceback = list(trace.traceback)
+            if not traceback:
+                continue
+            stage = self._stage_of(traceback, ranges)
+            site = f"{traceback[-1].filename}:{traceback[-1].lineno}"
+            by_site = sites.setdefault(stage, {})
+            size, count = by_site.get(site, (0, 0))
+            by_site[site] = (size + trace.size, count + 1)
+        return {stage: sorted(((size, count, site) for site, (size, count) in by_site.items()), reverse=True)
+                for stage, by_site in sites.items()}
+
+    def _merged_stats(self, name):
+        merged = None
+        for (stage, _), profile in self._profiles.items():
+            if stage != name:
+                continue
+            try:
+                stats = pstats.Stats(profile)
+            except TypeError:
+                # A profile that never recorded a call
+                continue
+            if merged is None:
+                merged = stats
+            else:
+                merged.add(stats)
+        for worker_stats in self._worker_profiles.get(name, []):
+            stats = pstats.Stats()
+            stats.stats = worker_stats
+            stats.get_top_level_stats()
+            if merged is None:
+                merged = stats
+            else:
+                merged.add(stats)
+        return merged
+
+    def state(self):
+        """Stage stats and CPU profiles, as picklable dicts, to merge() into another process's profiler."""
+        with self._lock:
+            stages = {name: dict(stats) for name, stats in self.stages.items()}
+            names = {name for name, _ in self._profiles}
+        cpu = {}
+        for name in names:
+            merged = self._merged_stats(name)
+            if merged is not None:
+                cpu[name] = merged.stats
+        return {"stages": stages, "cpu": cpu}
+
+    def merge(self, state):
+        """Add a state() from a worker process."""
+        with self._lock:
+            for name, worker in state["stages"].items():
+                stats = self._stats(name)
+                for key in ("calls", "seconds", "cpu_unprofiled_calls", "memory_growth_bytes"):
+                    stats[key] += worker[key]
+                stats["max_traced_bytes"] = max(stats["max_traced_bytes"], worker["max_traced_bytes"])
+            for name, cpu in state["cpu"].items():
+                self._worker_profiles.setdefault(name, []).append(cpu)
+
+    def _top_functions(self, stats):
+        rows = sorted(stats.stats.items(), key=lambda item: -item[1][3])[:self.top]
+        return [{"function": f"{filename}:{line}({function})", "calls": calls, "own_seconds": round(own, 6),
+                 "cumulative_seconds": round(cumulative, 6)}
+                for (filename, line, function), (_, calls, own, cumulative, _) in rows]
+
+    def write_report(self):
+        """Write the per-stage .prof/.txt files and profile_report.json; returns the report's path."""
+        os.makedirs(self.output_dir, exist_ok=True)
+        final_snapshot = tracemalloc.take_snapshot() if tracemalloc.is_tracing() else None
+        current, peak = tracemalloc.get_traced_memory() if tracemalloc.is_tracing() else (0, 0)
+        snapshot = self.peak_snapshot or final_snapshot
+        sites = self.allocation_sites(snapshot) if snapshot else {}
+
+        def site_rows(rows):
+            return [{"site": site, "size_mb": round(size / (1 << 20), 3), "allocations": count}
+                    for size, count, site in rows[:self.top]]
+
+        report = {
+            "started_at": time.strftime("%Y-%m-%dT%H:%M:%S", time.localtime(self.started or time.time())),
+            "duration_seconds": round(time.time() - self.started, 3) if self.started else None,
+            "python": sys.version.split()[0],
+            "argv": sys.argv,
+            "traced_peak_mb": round(peak / (1 << 20), 2),
+            "traced_current_mb": round(current / (1 << 20), 2),
+            "allocation_snapshot": "peak" if self.peak_snapshot else "end of run",
+            "allocation_snapshot_mb": round(sum(t.size for t in snapshot.traces) / (1 << 20), 2) if snapshot else None,
+            "stages": {},
+            "top_allocations": site_rows(sorted((row for rows in sites.values() for row in rows), reverse=True)),
+            "unattributed_allocations": site_rows(sites.get(None, [])),
+        }
+        for name in sorted(self.stages):
+            stats = dict(self.stages[name])
+            entry = {
+                "calls": stats["calls"],
+                "seconds": round(stats["seconds"], 4),
+                "cpu_unprofiled_calls": stats["cpu_unprofiled_calls"],
+                "memory_growth_mb": round(stats["memory_growth_bytes"] / (1 << 20), 3),
+                "max_traced_mb": round(stats["max_traced_bytes"] / (1 << 20), 2),
+                "top_functions": [],
+                "top_allocations": site_rows(sites.get(name, [])),
+            }
+            merged = self._merged_stats(name)
+            if merged is not None:
+                prof_path = os.path.join(self.output_dir, f"{name}.prof")
+                merged.dump_stats(prof_path)
+                with open(os.path.join(self.output_dir, f"{name}.txt"), "w", encoding="utf-8") as f:
+                    merged.stream = f
+                    merged.sort_stats("cumulative").print_stats(self.top)
+                entry["profile_file"] = prof_path
+                entry["top_functions"] = self._top_functions(merged)
+            report["stages"][name] = entry
+
+        path = os.path.join(self.output_dir, "profile_report.json")
+        with open(path, "w", encoding="utf-8") as f:
+            json.dump(report, f, indent=2)
+        return path
+
+    def format_summary(self):
+        lines = ["Profile by stage (own time, calls, traced memory growth):"]
+        for name, stats in sorted(self.stages.items(), key=lambda item: -item[1]["seconds"]):
+            lines.append(f"   - {name}: {stats['seconds']:.2f}s over {stats['calls']} calls, "
+                         f"{stats['memory_growth_bytes'] / (1 << 20):+.1f} MB")
+        return "\n".join(lines)
+
+
+# The profiler of a --profile run; None otherwise, which makes every hook below a no-op
+_active = None
+
+
+def start(output_dir=DEFAULT_PROFILE_DIR, top=DEFAULT_TOP, frames=TRACEMALLOC_FRAMES):
+    global _active
+    _active = StageProfiler(output_dir, top, frames)
+    _active.start()
+    return _active
+
+
+def start_worker(enabled):
+    """In a worker process: drop a profiler inherited through fork, and start a fresh one if enabled.
+
+    Returns the new profiler or None; the worker hands state() to the parent, which merge()s it.
+    """
+    global _active
+    _active = None
+    if tracemalloc.is_tracing():
+        tracemalloc.stop()
+    return start() if enabled else None
+
+
+def state():
+    """The active profiler's state() for the parent process, or None when not profiling."""
+    return _active.state() if _active is not None else None
+
+
+def merge(worker_state):
+    """Add a worker process's state() to the active profiler (a no-op without one or without a state)."""
+    if _active is not None and worker_state is not None:
+        _active.merge(worker_state)
+
+
+def is_active():
+    return _active is not None
+
+
+def finish():
+    """Write the active profiler's report, stop tracing and print where it went; returns the report path."""
+    global _active
+    profiler, _active = _active, None
+    if profiler is None:
+        return None
+    path = profiler.write_report()
+    tracemalloc.stop()
+    print(profiler.format_summary())
+    print(f"🔬 Profile written to {path} (per-stage .prof/.txt files in {profiler.output_dir})")
+    return path
+
+
+class stage:
+    """with stage("name"): runs the block as that stage of the active profiler (a no-op without one)."""
+
+    def __init__(self, name):
+        self.name = name
+        self.profiler = _active
+
+    def __enter__(self):
+        if self.profiler is not None:
+            self.profiler.register_code(self.name, sys._getframe(1).f_code)
+            self.profiler.enter(self.name)
+        return self
+
+    def __exit__(self, *exc_info):
+        if self.profiler is not None:
+            self.profiler.exit()
+        return False
+
+
+def profiled(name):
+    """Decorator running every call of the function as stage name."""
+    def decorate(function):
+        @functools.wraps(function)
+        def wrapper(*args, **kwargs):
+            profiler = _active
+            if profiler is None:
+                return function(*args, **kwargs)
+            profiler.register_code(name, function.__code__)
+            profiler.enter(name)
+            try:
+                return function(*args, **kwargs)
+            finally:
+                profiler.exit()
+        return wrapper
+    return decorate
+
+
+def track(name, iterable):
+    """iterable with the production of each item run as stage name; iterable itself when not profiling."""
+    profiler = _active
+    if profiler is None:
+        return iterable
+    profiler.register_code(name, getattr(iterable, "gi_code", None))
+    return _tracked(profiler, name, iter(iterable))
+
+
+def _tracked(profiler, name, iterator):
+    while True:
+        profiler.enter(name)
+        try:
+            item = next(iterator)
+        except StopIteration:
+            return
+        finally:
+            profiler.exit()
+        yield item
+
+
+def add_arguments(parser):
+    group = parser.add_argument_group("profiling")
+    group.add_argument("--profile", action="store_true",
+                       help="Profile CPU (cProfile) and memory (tracemalloc) per stage; slows the run down")
+    group.add_argument("--profile-dir", default=DEFAULT_PROFILE_DIR,
+                       help=f"Directory for profile_report.json and the per-stage profiles (default: {DEFAULT_PROFILE_DIR})")
+    group.add_argument("--profile-top", type=int, default=DEFAULT_TOP,
+                       help=f"Functions and allocation sites listed per stage (default: {DEFAULT_TOP})")
+    return group
+
+
+def start_from_args(args):
+    if args.profile:
+        start(args.profile_dir, args.profile_top)
+
+
+def finish_from_args(args):
+    if args.profile:
+        return finish()
+    return None
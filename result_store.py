@@ -0,0 +1,109 @@
+import json
+import os
+import threading
+
+RESULTS_LOG = "all_results.jsonl"
+RESULTS_JSON = "all_results.json"
+
+
+class ResultStore:
+    """Append-only JSONL log of per-error agent results, keyed by error key.
+
+    Every finished error is one appended line, so a run costs O(n) disk writes
+    instead of rewriting the whole result file after each error. On restart the
+    log is replayed (the last record of a key wins) and keys that completed
+    successfully are skipped; failed ones are retried. Keys are positional
+    (page and index), so each record also carries the fingerprint of the error
+    it holds and the content hash of the script it was analyzed against, and
+    a key only counts as done for that same error and script. The JSON array
+    consumed downstream is written once, by compact(), at the end of the run.
+    """
+
+    def __init__(self, path=RESULTS_LOG, fresh=False):
+        self.path = path
+        self.records = {}
+        if fresh and os.path.exists(path):
+            os.remove(path)
+        self._load()
+        self._file = open(path, "a", encoding="utf-8")
+        self._lock = threading.Lock()
+
+    def _load(self):
+        if not os.path.exists(self.path):
+            return
+        with open(self.path, "r", encoding="utf-8") as f:
+            for line_no, line in enumerate(f, 1):
+                line = line.strip()
+                if not line:
+                    continue
+                try:
+                    record = json.loads(line)
+                except json.JSONDecodeError:
+                    # A crash mid-write leaves at most one torn line at the end; that error is redone
+                    print(f"⚠️ Ignoring unreadable line {line_no} in {self.path}")
+                    continue
+                self.records[record["key"]] = record
+        self._truncate_torn_tail()
+
+    def _truncate_torn_tail(self):
+        # Cut a trailing partial line so the next append starts on a line of its own
+        with open(self.path, "rb+") as f:
+            size = f.seek(0, os.SEEK_END)
+            if size == 0:
+                return
+            f.seek(size - 1)
+            if f.read(1) == b"\n":
+                return
+            f.seek(max(0, size - 65536))
+            tail = f.read()
+            newline = tail.rfind(b"\n")
+            if newline == -1:
+                # Torn line longer than the tail read: terminate it instead (it is skipped on load)
+                f.write(b"\n")
+            else:
+                f.truncate(size - len(tail) + newline + 1)
+
+    def __len__(self):
+        return len(self.records)
+
+    def is_done(self, key, fingerprint=None, content_hash=None):
+        """True if key completed successfully, for the error with this fingerprint and script content hash
+        when they are given.
+
+        Records written before fingerprints were logged never match a fingerprint, so they are redone.
+        """
+        record = self.records.get(key)
+        if record is None or record.get("status") != "ok":
+            return False
+        if fingerprint is not None and record.get("fingerprint") != fingerprint:
+            return False
+        return content_hash is None or record.get("content_hash") == content_hash
+
+    def append(self, key, result, status="ok", fingerprint=None, content_hash=None):
+        """Durably record the result for key; status is "ok" or "error". Safe to call from worker threads."""
+        record = {"key": key, "status": status, "fingerprint": fingerprint, "content_hash": content_hash,
+                  "result": result}
+        line = json.dumps(record, ensure_ascii=False) + "\n"
+        with self._lock:
+            self._file.write(line)
+            self._file.flush()
+            os.fsync(self._file.fileno())
+            self.records[key] = record
+
+    def close(self):
+        self._file.close()
+
+    def compact(self, json_path=RESULTS_JSON, keys=None):
+        """Write the latest result of every key as one JSON array (atomically) and return its length.
+
+        With keys, only those keys are written, in that order, so the output does
+        not depend on the order in which concurrent workers finished.
+        """
+        if keys is None:
+            keys = list(self.records)
+        results = [self.records[key]["result"] for key in keys if key in self.records]
+        tmp_path = json_path + ".tmp"
+        with open(tmp_path, "w", encoding="utf-8") as f:
+            json.dump(results, f, indent=2)
+        os.replace(tmp_path, json_path)
+        return len(results)
@@ -0,0 +1,150 @@
+import codecs
+import gzip
+import json
+import re
+
+import requests
+
+CHUNK_SIZE = 1 << 16
+
+# Cheap pre-filter applied to a session's raw JSON text before it is decoded
+ERROR_CHECKPOINT_PATTERN = re.compile(r'"checkpoint"\s*:\s*"error"')
+BUNDLES_ARRAY_PATTERN = re.compile(r'"rumBundles"\s*:\s*\[')
+_STRUCTURAL = re.compile(r'[{}"]')
+_IN_STRING = re.compile(r'["\\]')
+
+
+def has_error_event(session):
+    return any(event.get("checkpoint") == "error" for event in session.get("events", []))
+
+
+def iter_sessions(text_chunks, errors_only=True):
+    """Yield sessions from a RUM bundle document delivered as text chunks.
+
+    Accepts either {"rumBundles": [...]} or a bare list of sessions. Only the
+    current session's raw text (plus one chunk) is buffered at a time, and with
+    errors_only (the default) sessions without a `checkpoint == "error"` event
+    are never decoded at all.
+    """
+    chunks = iter(text_chunks)
+    buf = ""
+
+    def more():
+        nonlocal buf
+        for chunk in chunks:
+            if chunk:
+                buf += chunk
+                return True
+        return False
+
+    # Locate the start of the sessions array
+    while True:
+        stripped = buf.lstrip()
+        if stripped.startswith("["):
+            pos = len(buf) - len(stripped) + 1
+            break
+        match = BUNDLES_ARRAY_PATTERN.search(buf)
+        if match:
+            pos = match.end()
+            break
+        if len(buf) > CHUNK_SIZE:
+            buf = buf[-64:]
+        if not more():
+            return
+
+    while True:
+        if pos > CHUNK_SIZE:
+            buf = buf[pos:]
+            pos = 0
+
+        # Skip separators up to the next session object or the end of the array
+        while True:
+            while pos < len(buf) and buf[pos] in " \t\r\n,":
+                pos += 1
+            if pos < len(buf) or not more():
+                break
+        if pos >= len(buf) or buf[pos] == "]":
+            return
+        if buf[pos] != "{":
+            raise ValueError(f"Unexpected character {buf[pos]!r} in rumBundles array")
+
+        # Scan to the matching closing brace, pulling more input as needed
+        start = scan = pos
+        depth = 0
+        in_string = False
+        while True:
+            match = (_IN_STRING if in_string else _STRUCTURAL).search(buf, scan)
+            if match is None:
+                scan = len(buf)
+                if not more():
+                    raise ValueError("Truncated RUM bundle: unterminated session object")
+                continue
+            char = match.group()
+            scan = match.end()
+            if in_string:
+                if char == "\\":
+                    # Skip the escaped character, which may sit in the next chunk
+                    if scan >= len(buf) and not more():
+                        raise ValueError("Truncated RUM bundle: unterminated string")
+                    scan += 1
+                else:
+                    in_string = False
+            elif char == '"':
+                in_string = True
+            elif char == "{":
+                depth += 1
+            else:
+                depth -= 1
+                if depth == 0:
+                    break
+
+        raw = buf[start:scan]
+        pos = scan
+        if errors_only and not ERROR_CHECKPOINT_PATTERN.search(raw):
+            continue
+        session = json.loads(raw)
+        if errors_only and not has_error_event(session):
+            continue
+        yield session
+
+
+def _decode(byte_chunks, encoding="utf-8"):
+    decoder = codecs.getincrementaldecoder(encoding)(errors="replace")
+    for chunk in byte_chunks:
+        text = decoder.decode(chunk)
+        if text:
+            yield text
+    tail = decoder.decode(b"", final=True)
+    if tail:
+        yield tail
+
+
+def iter_error_sessions_from_file(path, chunk_size=CHUNK_SIZE):
+    """Stream error sessions from a local bundle file (plain or .gz)."""
+    opener = gzip.open if path.endswith(".gz") else open
+
+    def read_chunks():
+        with opener(path, "rb") as f:
+            while True:
+                chunk = f.read(chunk_size)
+                if not chunk:
+                    break
+                yield chunk
+
+    return iter_sessions(_decode(read_chunks()))
+
+
+def iter_error_sessions_from_url(url, session=None, timeout=60, chunk_size=CHUNK_SIZE):
+    """Stream error sessions straight from the HTTP body of a RUM bundle URL.
+
+    The request is issued (and HTTP errors raised) immediately; the body is
+    consumed lazily as the returned generator is iterated.
+    """
+    response = (session or requests).get(url, stream=True, timeout=timeout)
+    response.raise_for_status()
+
+    def read_chunks():
+        with response:
+            yield from response.iter_content(chunk_size=chunk_size)
+
+    return iter_sessions(_decode(read_chunks(), response.encoding or "utf-8"))
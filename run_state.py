@@ -0,0 +1,97 @@
+import json
+import os
+import threading
+import time
+
+from error_fingerprint import fingerprint_of
+
+RUN_STATE = "run_state.json"
+# Fingerprints not seen for this long are dropped when the state is saved
+DEFAULT_MAX_AGE_DAYS = 30
+
+
+class RunState:
+    """Persistent per-fingerprint state shared by main.py and test_iterate_single_error.py.
+
+    For every error fingerprint it keeps the content hash of the script it was
+    enriched from, the enriched fields themselves, and the hash and result key
+    of its last successful analysis. A later run reuses the stored enrichment
+    while the script's hash is unchanged and only analyzes fingerprints that
+    are new or whose script changed since they were analyzed.
+    """
+
+    def __init__(self, path=RUN_STATE, fresh=False):
+        self.path = path
+        self.fingerprints = {}
+        self._lock = threading.Lock()
+        if not fresh:
+            self._load()
+
+    def __len__(self):
+        return len(self.fingerprints)
+
+    def _load(self):
+        try:
+            with open(self.path, "r", encoding="utf-8") as f:
+                self.fingerprints = json.load(f).get("fingerprints", {})
+        except FileNotFoundError:
+            return
+        except (OSError, ValueError, AttributeError) as e:
+            print(f"⚠️ Ignoring unreadable run state {self.path}: {e}")
+            self.fingerprints = {}
+
+    def _entry(self, error):
+        entry = self.fingerprints.setdefault(fingerprint_of(error), {"first_seen": time.time()})
+        entry["last_seen"] = time.time()
+        return entry
+
+    def restore_enrichment(self, error, content_hash, fields):
+        """Copy the stored enriched fields into error if its script still has content_hash; returns True if it did."""
+        with self._lock:
+            entry = self._entry(error)
+            enriched = entry.get("enriched")
+            if content_hash is None or enriched is None or entry.get("code_content_hash") != content_hash:
+                return False
+            for field in fields:
+                error[field] = enriched.get(field)
+            return True
+
+    def record_enrichment(self, error, fields):
+        """Remember error's enriched fields; skipped when its script could not be fetched."""
+        content_hash = error.get("code_content_hash")
+        if content_hash is None:
+            return
+        with self._lock:
+            entry = self._entry(error)
+            entry["code_link"] = error.get("code_link")
+            entry["code_content_hash"] = content_hash
+            entry["enriched"] = {field: error.get(field) for field in fields}
+
+    def needs_analysis(self, error):
+        """True unless the fingerprint was analyzed against the script content error was enriched from."""
+        content_hash = error.get("code_content_hash")
+        entry = self.fingerprints.get(fingerprint_of(error))
+        return content_hash is None or entry is None or entry.get("analyzed_hash") != content_hash
+
+    def result_key(self, error):
+        """Result-log key of the fingerprint's last successful analysis, if any."""
+        entry = self.fingerprints.get(fingerprint_of(error))
+        return entry.get("result_key") if entry else None
+
+    def mark_analyzed(self, error, result_key):
+        with self._lock:
+            entry = self._entry(error)
+            entry["analyzed_hash"] = error.get("code_content_hash")
+            entry["result_key"] = result_key
+            entry["analyzed_at"] = time.time()
+
+    def save(self, max_age_days=DEFAULT_MAX_AGE_DAYS):
+        """Write the state atomically, dropping fingerprints not seen for max_age_days."""
+        cutoff = time.time() - max_age_days * 86400
+        with self._lock:
+            self.fingerprints = {fingerprint: entry for fingerprint, entry in self.fingerprints.items()
+                                 if entry.get("last_seen", 0) >= cutoff}
+            tmp_path = f"{self.path}.tmp.{os.getpid()}"
+            with open(tmp_path, "w", encoding="utf-8") as f:
+                json.dump({"version": 1, "fingerprints": self.fingerprints}, f)
+            os.replace(tmp_path, self.path)
@@ -0,0 +1,250 @@
+import base64
+import json
+import re
+import threading
+from array import array
+from bisect import bisect_right
+from collections import OrderedDict
+from urllib.parse import unquote, urljoin
+
+_BASE64 = "ABCDEFGHIJKLMNOPQRSTUVWXYZabcdefghijklmnopqrstuvwxyz0123456789+/"
+_BASE64_VALUES = {char: value for value, char in enumerate(_BASE64)}
+_SOURCE_MAPPING_URL = re.compile(r"[#@]\s*sourceMappingURL\s*=\s*(\S+)")
+
+
+def decode_vlq(segment):
+    """Decode one Base64 VLQ mappings segment into its list of integers."""
+    values = []
+    value = 0
+    shift = 0
+    for char in segment:
+        digit = _BASE64_VALUES[char]
+        value += (digit & 31) << shift
+        if digit & 32:
+            shift += 5
+            continue
+        values.append(-(value >> 1) if value & 1 else value >> 1)
+        value = 0
+        shift = 0
+    if shift:
+        raise ValueError(f"Truncated VLQ segment: {segment!r}")
+    return values
+
+
+class ParsedSourceMap:
+    """A source map decoded once into flat, sorted arrays for binary-search lookups.
+
+    Segments are stored generated-line by generated-line; line_starts[i] is the
+    index of the first segment of generated line i, and within a line segments
+    are sorted by generated column.
+    """
+
+    def __init__(self, data, map_url=""):
+        source_root = data.get("sourceRoot") or ""
+        if source_root and not source_root.endswith("/"):
+            source_root += "/"
+        self.sources = [urljoin(map_url, source_root + (s or "")) for s in data.get("sources", [])]
+        self.sources_content = data.get("sourcesContent") or []
+        # Indexes of the sources whose content is already seeded into the JSSourceCache
+        self.seeded_sources = set()
+        self.names = data.get("names", [])
+
+        self.line_starts = array("L", [0])
+        self.generated_columns = array("l")
+        self.source_indexes = array("l")
+        self.original_lines = array("l")
+        self.original_columns = array("l")
+        self.name_indexes = array("l")
+
+        source = original_line = original_column = name = 0
+        for line in data.get("mappings", "").split(";"):
+            segments = []
+            generated_column = 0
+            for segment in line.split(","):
+                if not segment:
+                    continue
+                fields = decode_vlq(segment)
+                generated_column += fields[0]
+                if len(fields) >= 4:
+                    source += fields[1]
+                    original_line += fields[2]
+                    original_column += fields[3]
+                    if len(fields) >= 5:
+                        name += fields[4]
+                    segments.append((generated_column, source, original_line, original_column,
+                                     name if len(fields) >= 5 else -1))
+                else:
+                    segments.append((generated_column, -1, -1, -1, -1))
+            segments.sort(key=lambda s: s[0])
+            for generated_column, source_index, line_no, column_no, name_index in segments:
+                self.generated_columns.append(generated_column)
+                self.source_indexes.append(source_index)
+                self.original_lines.append(line_no)
+                self.original_columns.append(column_no)
+                self.name_indexes.append(name_index)
+            self.line_starts.append(len(self.generated_columns))
+
+    def lookup(self, line, column):
+        """Map a 0-based generated (line, column) to its original position, or None."""
+        if line < 0 or line + 1 >= len(self.line_starts):
+            return None
+        lo, hi = self.line_starts[line], self.line_starts[line + 1]
+        i = bisect_right(self.generated_columns, column, lo, hi) - 1
+        if i < lo or self.source_indexes[i] < 0:
+            return None
+        source_index = self.source_indexes[i]
+        name_index = self.name_indexes[i]
+        return {
+            "source": self.sources[source_index] if source_index < len(self.sources) else None,
+            "source_index": source_index,
+            "line": self.original_lines[i],
+            "column": self.original_columns[i],
+            "name": self.names[name_index] if 0 <= name_index < len(self.names) else None,
+        }
+
+    def source_content(self, source_index):
+        if 0 <= source_index < len(self.sources_content):
+            return self.sources_content[source_index]
+        return None
+
+
+class IndexedSourceMap:
+    """An index map ("sections"), each section covering the generated code from its offset on."""
+
+    def __init__(self, data, map_url=""):
+        self.offsets = []
+        self.maps = []
+        for section in data.get("sections", []):
+            offset = section.get("offset", {})
+            if "map" not in section:
+                # Sections referencing external maps by URL are not supported
+                continue
+            self.offsets.append((offset.get("line", 0), offset.get("column", 0)))
+            self.maps.append(ParsedSourceMap(section["map"], map_url))
+
+    def lookup(self, line, column):
+        i = bisect_right(self.offsets, (line, column)) - 1
+        if i < 0:
+            return None
+        offset_line, offset_column = self.offsets[i]
+        result = self.maps[i].lookup(line - offset_line, column - offset_column if line == offset_line else column)
+        if result is not None:
+            result["map"] = self.maps[i]
+        return result
+
+    def source_content(self, source_index):
+        return None
+
+
+def parse_source_map(text, map_url=""):
+    # Maps may start with an XSSI guard line such as )]}'
+    if text.startswith(")]}"):
+        text = text.split("\n", 1)[1] if "\n" in text else ""
+    data = json.loads(text)
+    if "sections" in data:
+        return IndexedSourceMap(data, map_url)
+    return ParsedSourceMap(data, map_url)
+
+
+def find_source_map_url(js_url, js_text):
+    """URL of the source map for a script: its sourceMappingURL comment, else <script>.map."""
+    tail = js_text[-4096:]
+    matches = _SOURCE_MAPPING_URL.findall(tail)
+    if matches:
+        return urljoin(js_url, matches[-1])
+    return js_url + ".map"
+
+
+class SourceMapResolver:
+    """Resolve minified error positions to original file/line/column via source maps.
+
+    Maps are fetched through the shared JSSourceCache and parsed once; parsed maps
+    are kept in a small LRU so thousands of errors in the same bundle cost one
+    decode plus a binary search each. Scripts without a usable map are remembered
+    too, so they are not retried for every error.
+    """
+
+    def __init__(self, js_source_cache, max_maps=64):
+        self.js_source_cache = js_source_cache
+        self.max_maps = max_maps
+        self._maps = OrderedDict()
+        self._lock = threading.Lock()
+        self.stats = {"resolved": 0, "unresolved": 0, "maps_parsed": 0, "maps_missing": 0}
+
+    def resolve(self, js_url, line, column):
+        """Map a RUM position (1-based line and column, as in V8 stack traces) to the original source.
+
+        Returns {"source", "line", "column", "name"} with a 1-based line and column,
+        or None if the script has no usable map or the position is unmapped. When the
+        map embeds sourcesContent, the original source is seeded into the
+        JSSourceCache under its URL so enrichment can read it like any other script.
+        """
+        if not js_url or line is None or column is None:
+            return None
+        source_map = self._get_map(js_url)
+        result = source_map.lookup(line - 1, max(column - 1, 0)) if source_map else None
+        if result is None or not result["source"]:
+            self._count("unresolved")
+            return None
+
+        owner = result.pop("map", source_map)
+        source_index = result.pop("source_index")
+        if source_index not in owner.seeded_sources:
+            # Seed once per parsed map: put() encodes and hashes the whole original source
+            content = owner.source_content(source_index)
+            if content is not None:
+                self.js_source_cache.put(result["source"], content)
+            owner.seeded_sources.add(source_index)
+        self._count("resolved")
+        return {
+            "source": result["source"],
+            "line": result["line"] + 1,
+            "column": result["column"] + 1,
+            "name": result["name"],
+        }
+
+    def format_stats(self):
+        return (
+            f"Source maps: {self.stats['maps_parsed']} parsed, {self.stats['maps_missing']} missing, "
+            f"{self.stats['resolved']} errors resolved, {self.stats['unresolved']} unresolved"
+        )
+
+    def _count(self, key):
+        with self._lock:
+            self.stats[key] += 1
+
+    def _get_map(self, js_url):
+        with self._lock:
+            if js_url in self._maps:
+                self._maps.move_to_end(js_url)
+                return self._maps[js_url]
+
+        source_map = None
+        try:
+            source_map = self._load_map(js_url)
+        except Exception as e:
+            print(f"⚠️ Could not load source map for {js_url}: {str(e)}")
+
+        with self._lock:
+            self.stats["maps_parsed" if source_map else "maps_missing"] += 1
+            self._maps[js_url] = source_map
+            while len(self._maps) > self.max_maps:
+                self._maps.popitem(last=False)
+        return source_map
+
+    def _load_map(self, js_url):
+        script = self.js_source_cache.get(js_url)
+        if script.status_code != 200:
+            return None
+        map_url = find_source_map_url(js_url, script.text)
+        if map_url.startswith("data:"):
+            header, _, payload = map_url.partition(",")
+            if header.endswith(";base64"):
+                text = base64.b64decode(payload).decode("utf-8")
+            else:
+                text = unquote(payload)
+            return parse_source_map(text, js_url)
+        source = self.js_source_cache.get(map_url)
+        if source.status_code != 200:
+            return None
+        return parse_source_map(source.text, map_url)
@@ -0,0 +1,130 @@
+import argparse
+import json
+import re
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+STUB_ANSWER = (
+    "Thought: I now can give a great answer\n"
+    "Final Answer: [\n"
+    "  {\n"
+    "    'issue': 'stub root cause',\n"
+    "    'suggestion': 'stub fix',\n"
+    "    'fixed_code': '// stub fixed code'\n"
+    "  }\n"
+    "]"
+)
+
+_ERROR_ID = re.compile(r"error_[0-9a-f]{32}_\d+")
+
+
+def stub_answer(messages):
+    """The canned answer; batch prompts get one entry per error id they mention."""
+    prompt = "\n".join(str(m.get("content", "")) for m in messages)
+    if "keyed by error id" not in prompt:
+        return STUB_ANSWER
+    entries = {error_id: {"issue": "stub root cause", "suggestion": "stub fix",
+                          "Steps to fix the code": "- stub step", "fixed_code": "// stub fixed code"}
+               for error_id in dict.fromkeys(_ERROR_ID.findall(prompt))}
+    return "Thought: I now can give a great answer\nFinal Answer: " + json.dumps(entries, indent=2)
+
+
+class StubState:
+    def __init__(self, latency, fail_every):
+        self.latency = latency
+        self.fail_every = fail_every
+        self.requests = 0
+        self.rate_limited = 0
+        self.in_flight = 0
+        self.max_in_flight = 0
+        # Total time spent answering completions: the "LLM latency" a client saw
+        self.busy_seconds = 0.0
+        self.lock = threading.Lock()
+
+
+def make_handler(state):
+    class Handler(BaseHTTPRequestHandler):
+        def log_message(self, format, *args):
+            pass
+
+        def do_POST(self):
+            body = self.rfile.read(int(self.headers.get("Content-Length", 0)))
+            with state.lock:
+                state.requests += 1
+                number = state.requests
+                limited = state.fail_every and number % state.fail_every == 0
+                if limited:
+                    state.rate_limited += 1
+                else:
+                    state.in_flight += 1
+                    state.max_in_flight = max(state.max_in_flight, state.in_flight)
+
+            if limited:
+                payload = json.dumps({"error": {"message": "Rate limit reached (stub)", "type": "requests",
+                                                "code": "rate_limit_exceeded"}}).encode("utf-8")
+                self.send_response(429)
+                self.send_header("Retry-After", "0.2")
+                self.send_header("Content-Type", "application/json")
+                self.send_header("Content-Length", str(len(payload)))
+                self.end_headers()
+                self.wfile.write(payload)
+                return
+
+            started = time.perf_counter()
+            try:
+                time.sleep(state.latency)
+                request = json.loads(body or b"{}")
+                messages = request.get("messages", [])
+                answer = stub_answer(messages)
+                prompt_tokens = sum(len(str(m.get("content", ""))) // 4 for m in messages)
+                completion_tokens = len(answer) // 4
+                payload = json.dumps({
+                    "id": f"chatcmpl-stub-{number}",
+                    "object": "chat.completion",
+                    "created": int(time.time()),
+                    "model": request.get("model", "stub"),
+                    "choices": [{"index": 0, "finish_reason": "stop",
+                                 "message": {"role": "assistant", "content": answer}}],
+                    "usage": {"prompt_tokens": prompt_tokens, "completion_tokens": completion_tokens,
+                              "total_tokens": prompt_tokens + completion_tokens},
+                }).encode("utf-8")
+                self.send_response(200)
+                self.send_header("Content-Type", "application/json")
+                self.send_header("Content-Length", str(len(payload)))
+                self.end_headers()
+                self.wfile.write(payload)
+            finally:
+                with state.lock:
+                    state.in_flight -= 1
+                    state.busy_seconds += time.perf_counter() - started
+
+    return Handler
+
+
+def start_stub_server(port=0, latency=0.5, fail_every=0):
+    """Start the stub in a background thread; returns (server, state, base_url)."""
+    state = StubState(latency, fail_every)
+    server = ThreadingHTTPServer(("127.0.0.1", port), make_handler(state))
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    return server, state, f"http://127.0.0.1:{server.server_address[1]}/v1"
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(
+        description="Local OpenAI-compatible chat completions stub for testing the analysis workers without API costs"
+    )
+    parser.add_argument("--port", type=int, default=8808)
+    parser.add_argument("--latency", type=float, default=0.5, help="Seconds each completion takes")
+    parser.add_argument("--fail-every", type=int, default=0, help="Answer every Nth request with a 429")
+    args = parser.parse_args()
+
+    server, state, base_url = start_stub_server(args.port, args.latency, args.fail_every)
+    print(f"🧪 Stub LLM endpoint listening on {base_url}")
+    print(f"   Run: OPENAI_API_KEY=stub python3 test_iterate_single_error.py --base-url {base_url} --workers 8")
+    try:
+        while True:
+            time.sleep(5)
+            print(f"   {state.requests} requests, {state.rate_limited} answered 429, max {state.max_in_flight} in flight")
+    except KeyboardInterrupt:
+        server.shutdown()
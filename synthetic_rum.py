@@ -0,0 +1,182 @@
+import gzip
+import json
+import random
+import threading
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+from requests.adapters import HTTPAdapter
+
+# Scripts are referenced under this base URL in generated bundles. The RUM source
+# regex does not accept ports, so requests for it are routed to the local server
+# by LocalRouteAdapter rather than by putting 127.0.0.1:<port> in the bundle.
+SYNTHETIC_BASE_URL = "http://scripts.synthetic-rum.test/"
+SYNTHETIC_SITE = "https://www.synthetic-rum.test"
+
+_DESCRIPTIONS = (
+    "TypeError: Cannot read properties of undefined (reading 'value')",
+    "TypeError: Cannot read properties of null (reading 'dataset')",
+    "ReferenceError: options is not defined",
+    "TypeError: value.trim is not a function",
+    "RangeError: Maximum call stack size exceeded",
+)
+_USER_AGENTS = ("desktop:chrome", "desktop:firefox", "mobile:ios", "mobile:android")
+_CHECKPOINTS = ("click", "viewblock", "viewmedia", "enter", "cwv-lcp", "loadresource")
+
+
+def generate_script(index, target_bytes):
+    """(JavaScript text, [(line, column)] error sites) of a script of about target_bytes.
+
+    The script is a list of small commented handler functions, so enrichment
+    finds an enclosing function for every error site.
+    """
+    lines = [f"/* synthetic script {index}, generated for ingestion benchmarks */", "'use strict';", ""]
+    sites = []
+    size = sum(len(line) + 1 for line in lines)
+    n = 0
+    while size < target_bytes:
+        name = f"handler{index}_{n}"
+        block = [
+            f"// {name}: reads the item selected by the event target",
+            f"function {name}(event, options) {{",
+            "  const target = event && event.target;",
+            f"  const value = options.items[{n % 7}].value + target.dataset.id;",
+            "  if (!value) {",
+            "    return null;",
+            "  }",
+            "  return String(value).trim();",
+            "}",
+            "",
+        ]
+        # 1-based line of the `const value` statement; the column points at `options`
+        sites.append((len(lines) + 4, block[3].index("options")))
+        lines.extend(block)
+        size += sum(len(line) + 1 for line in block)
+        n += 1
+    return "\n".join(lines), sites
+
+
+def generate_scripts(count, script_kb):
+    """({file name: text}, [(file name, line, column)]) for count scripts of about script_kb KB each."""
+    scripts = {}
+    sites = []
+    for i in range(count):
+        name = f"blocks/block-{i}.js"
+        text, script_sites = generate_script(i, script_kb * 1024)
+        scripts[name] = text
+        sites.extend((name, line, column) for line, column in script_sites)
+    return scripts, sites
+
+
+def _page_slug(n):
+    """Page path of page n spelled in letters: digits in page URLs can trip is_safe_url's quote patterns."""
+    slug = ""
+    while True:
+        n, digit = divmod(n, 26)
+        slug = chr(ord("a") + digit) + slug
+        if not n:
+            return f"page-{slug}"
+
+
+def generate_sessions(events, sites, events_per_session=20, error_ratio=0.05, distinct_errors=500, pages=1000,
+                      missing_location_ratio=0.05, seed=1, base_url=SYNTHETIC_BASE_URL):
+    """Yield RUM sessions holding `events` events in total, shaped like bundles.aem.page sessions.
+
+    Each event is an error with probability error_ratio, raised at one of
+    distinct_errors (script, line, column, description) combinations drawn from
+    sites; missing_location_ratio of the errors carry no line/column. The rest
+    are ordinary checkpoints. Sessions are generated lazily, so 1M events cost
+    no more memory than one session.
+    """
+    rng = random.Random(seed)
+    locations = [(rng.choice(sites), rng.choice(_DESCRIPTIONS)) for _ in range(max(distinct_errors, 1))]
+    produced = 0
+    while produced < events:
+        count = min(events_per_session, events - produced)
+        session_events = []
+        for _ in range(count):
+            if rng.random() < error_ratio:
+                (script, line, column), description = rng.choice(locations)
+                source = f"{base_url}{script}"
+                if rng.random() >= missing_location_ratio:
+                    source += f":{line}:{column}"
+                session_events.append({"checkpoint": "error", "source": source, "target": description})
+            else:
+                session_events.append({"checkpoint": rng.choice(_CHECKPOINTS),
+                                       "source": f".block-{rng.randrange(50)}", "target": "https://www.synthetic-rum.test/"})
+        produced += count
+        yield {
+            "id": f"s{produced}",
+            "url": f"{SYNTHETIC_SITE}/{_page_slug(rng.randrange(pages))}",
+            "userAgent": rng.choice(_USER_AGENTS),
+            "weight": 100,
+            "events": session_events,
+        }
+
+
+def write_bundle(path, sessions):
+    """Write sessions as a {"rumBundles": [...]} document (gzip-compressed if path ends in .gz), one session at a time."""
+    opener = gzip.open if path.endswith(".gz") else open
+    count = 0
+    with opener(path, "wt", encoding="utf-8") as f:
+        f.write('{"rumBundles": [')
+        for session in sessions:
+            if count:
+                f.write(",\n")
+            f.write(json.dumps(session))
+            count += 1
+        f.write("]}\n")
+    return count
+
+
+def start_script_server(scripts, port=0):
+    """Serve {path: text} scripts from a background thread; returns (server, local_base_url, stats)."""
+    bodies = {"/" + name: text.encode("utf-8") for name, text in scripts.items()}
+    stats = {"requests": 0, "bytes": 0}
+    lock = threading.Lock()
+
+    class Handler(BaseHTTPRequestHandler):
+        protocol_version = "HTTP/1.1"
+
+        def log_message(self, format, *args):
+            pass
+
+        def do_GET(self):
+            body = bodies.get(self.path)
+            with lock:
+                stats["requests"] += 1
+                stats["bytes"] += len(body or b"")
+            if body is None:
+                self.send_response(404)
+                self.send_header("Content-Length", "0")
+                self.end_headers()
+                return
+            self.send_response(200)
+            self.send_header("Content-Type", "application/javascript; charset=utf-8")
+            self.send_header("Content-Length", str(len(body)))
+            self.end_headers()
+            self.wfile.write(body)
+
+    server = ThreadingHTTPServer(("127.0.0.1", port), Handler)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    return server, f"http://127.0.0.1:{server.server_address[1]}/", stats
+
+
+class LocalRouteAdapter(HTTPAdapter):
+    """Sends requests for public_base to local_base, e.g. SYNTHETIC_BASE_URL to a start_script_server address."""
+
+    def __init__(self, public_base, local_base, **kwargs):
+        super().__init__(**kwargs)
+        self.public_base = public_base
+        self.local_base = local_base
+
+    def send(self, request, **kwargs):
+        if request.url.startswith(self.public_base):
+            request.url = self.local_base + request.url[len(self.public_base):]
+        return super().send(request, **kwargs)
+
+
+def route_to_local(session, local_base, public_base=SYNTHETIC_BASE_URL, pool_size=10):
+    """Mount a LocalRouteAdapter on a requests session so public_base URLs hit the local script server."""
+    session.mount(public_base, LocalRouteAdapter(public_base, local_base,
+                                                 pool_connections=pool_size, pool_maxsize=pool_size))
+    return session
@@ -1,19 +1,171 @@
 import os
-from dotenv import load_dotenv
-load_dotenv()
+import argparse
 import json
-from crewai import Agent, Task, Crew, Process
-from langchain_openai import ChatOpenAI
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
 import hashlib
+from context_budget import count_tokens
+from context_compression import compress_context, compress_error, resolve_passes
+from error_batching import (DEFAULT_BATCH_CONTEXT_TOKENS, DEFAULT_BATCH_SIZE, group_errors, merge_contexts,
+                            parse_json_answer, parse_keyed_response)
+from error_fingerprint import fingerprint_of
+from llm_rate_limiter import LLMRateLimiter, call_with_backoff
+from metrics import add_arguments as add_metrics_arguments, configure_from_args, export_from_args, get_logger, metrics
+import profiling
+from llm_response_cache import CACHE_DB, DEFAULT_MAX_MB, DEFAULT_TTL_DAYS, LLMResponseCache, response_cache_key
+from result_store import RESULTS_JSON, RESULTS_LOG, ResultStore
+from run_state import RunState
+
+LLM_MODEL = "gpt-4o"
+LLM_TEMPERATURE = 0.5
+
+log = get_logger("analysis")
 
 def hash_url(url):
     return hashlib.md5(url.encode('utf-8')).hexdigest()
 
+def render_analyze_prompt(input_json):
+    """Task description sent to the error analyzer for a one-error input_json."""
+    return (
+        f"You are given this specific JavaScript error message: {input_json[list(input_json.keys())[0]]['error_description']} and specific error line from the code:\n{input_json[list(input_json.keys())[0]]['error_snippet']}\n\n"
+        f"The relevant code context holding that error is:\n{input_json[list(input_json.keys())[0]]['code_context']}\n\n"
+        "You are also given code_context around the error_snippet! The entire code context might not be syntactically absolutely right or complete, as few lines are fetched around the error snippet so as not to breach input token limit of LLM! "
+        "First locate the error line inside the context code provided to you then match the actual error description provided above. For the error:\n"
+        "1. Locate the error snippet in the code context.\n"
+        "2. Explain the root cause of this specific error.\n"
+        "3. Suggest steps to fix the error in the code!!!!!\n\n"
+        
+        "Return the suggestion:\n"
+        "[\n"
+        "  {\n"
+        f"   'error': '{list(input_json.keys())[0]}',\n"
+        "    'issue': '<specific root cause for this error>',\n"
+        "    'suggestion': '<specific fix for this code>'\n"
+        "    'Steps to fix the code': '<Bullet points to fix the error>'\n"
+        "  }\n"
+        "]"
+    )
+
+
+def render_fix_prompt(original_errors_json):
+    """Task description sent to the fix suggestor for a one-error input_json."""
+    return (
+        f"You are given this specific JavaScript error message: {original_errors_json[list(original_errors_json.keys())[0]]['error_description']} and specific error line from the code:\n{original_errors_json[list(original_errors_json.keys())[0]]['error_snippet']}\n\n"
+        f"IMPORTANT: You will receive the analysis from the Expert JavaScript Error Analyzer in the context from the previous task. Use his suggestions to fix that specific error in the code context and return bug free code context.\n\n"
+        f"The relevant code context holding that error is:\n{original_errors_json[list(original_errors_json.keys())[0]]['code_context']}\n\n"
+        "Just Return the updated code block after applying the fixes suggested by the Expert JavaScript Error Analyzer.\n\n"
+        "Output format:\n"
+        "[\n"
+        "  {\n"
+        #f"    'error': '{list(original_errors_json.keys())[0]}',\n"
+        "    'fixed_code': '<the corrected code for this specific error>'\n"
+        "  }\n"
+        "]"
+    )
+
+def render_single_call_prompt(input_json):
+    """Prompt asking for the analysis and the fixed code of one error in a single answer."""
+    error_key = list(input_json.keys())[0]
+    error = input_json[error_key]
+    return (
+        f"You are given this specific JavaScript error message: {error['error_description']} and specific error line from the code:\n{error['error_snippet']}\n\n"
+        f"The relevant code context holding that error is:\n{error['code_context']}\n\n"
+        "The code context might not be syntactically complete, as only the part of the script around the error snippet is included so as not to breach the input token limit. For the error:\n"
+        "1. Locate the error snippet in the code context.\n"
+        "2. Explain the root cause of this specific error.\n"
+        "3. Suggest steps to fix the error in the code.\n"
+        "4. Apply the fix to the code context and return the corrected code block.\n\n"
+        "Return only one JSON object:\n"
+        "{\n"
+        "  \"issue\": \"<specific root cause for this error>\",\n"
+        "  \"suggestion\": \"<specific fix for this code>\",\n"
+        "  \"Steps to fix the code\": \"<Bullet points to fix the error>\",\n"
+        "  \"fixed_code\": \"<the corrected code for this specific error>\"\n"
+        "}"
+    )
+
+
+def _batch_error_list(batch_input):
+    return "".join(
+        f"- {error_key}: {error['error_description']} (line {error['line']}, column {error['column']}); "
+        f"error snippet: {error['error_snippet']}\n"
+        for error_key, error in batch_input["errors"].items()
+    )
+
+
+def render_batch_analyze_prompt(batch_input):
+    """Task description sent to the error analyzer for a batch of errors sharing one code context."""
+    return (
+        f"You are given {len(batch_input['errors'])} JavaScript errors raised from the same script "
+        f"({batch_input['code_link']}), keyed by error id:\n{_batch_error_list(batch_input)}\n"
+        f"The relevant code context holding all of these errors starts at line {batch_input['context_start_line']} of the script:\n"
+        f"{batch_input['code_context']}\n\n"
+        "The code context might not be syntactically complete, as only the part of the script around the errors is included. For each error:\n"
+        "1. Locate its error snippet in the code context.\n"
+        "2. Explain the root cause of this specific error.\n"
+        "3. Suggest steps to fix the error in the code.\n\n"
+        "Return one JSON object keyed by error id, with an entry for every error above:\n"
+        "{\n"
+        "  \"<error id>\": {\n"
+        "    \"issue\": \"<specific root cause for this error>\",\n"
+        "    \"suggestion\": \"<specific fix for this code>\",\n"
+        "    \"Steps to fix the code\": \"<Bullet points to fix the error>\"\n"
+        "  }\n"
+        "}"
+    )
+
+
+def render_batch_fix_prompt(batch_input):
+    """Task description sent to the fix suggestor for a batch of errors sharing one code context."""
+    return (
+        f"You are given {len(batch_input['errors'])} JavaScript errors raised from the same script "
+        f"({batch_input['code_link']}), keyed by error id:\n{_batch_error_list(batch_input)}\n"
+        "IMPORTANT: You will receive the analysis of every error from the Expert JavaScript Error Analyzer in the context from the previous task. Use it to fix each error in the code context.\n\n"
+        f"The relevant code context holding all of these errors starts at line {batch_input['context_start_line']} of the script:\n"
+        f"{batch_input['code_context']}\n\n"
+        "Return one JSON object keyed by error id, with the corrected code block for every error above:\n"
+        "{\n"
+        "  \"<error id>\": {\n"
+        "    \"fixed_code\": \"<the corrected code for this specific error>\"\n"
+        "  }\n"
+        "}"
+    )
+
 class JavascriptErrorAgents:
-    def __init__(self, openai_api_key: str):
-        self.llm = ChatOpenAI(model="gpt-4o", temperature=0.5)
-    
+    """Builds the agents, tasks and crew for one error at a time.
+
+    Each agent is built once and then reused for every error (once per worker
+    thread, since an agent is not safe to run in two crews at the same time);
+    all of them share one LLM client. Pass reuse_agents=False to build fresh
+    agents on every call, as before.
+
+    crewai and langchain_openai are imported on first use, so tools that only
+    need this module's helpers (hash_url, the prompt renderers) start fast.
+    """
+
+    def __init__(self, openai_api_key: str, reuse_agents=True):
+        from langchain_openai import ChatOpenAI
+        self.llm = ChatOpenAI(model=LLM_MODEL, temperature=LLM_TEMPERATURE)
+        self.reuse_agents = reuse_agents
+        self._local = threading.local()
+
+    def _agent(self, name, build):
+        if not self.reuse_agents:
+            return build()
+        agents = self._local.__dict__.setdefault("agents", {})
+        if name not in agents:
+            agents[name] = build()
+        return agents[name]
+
     def expert_Javascript_error_analyzer(self):
+        return self._agent("analyzer", self._build_error_analyzer)
+
+    def expert_Javascript_fix_suggestor(self):
+        return self._agent("fix_suggestor", self._build_fix_suggestor)
+
+    def _build_error_analyzer(self):
+        from crewai import Agent
         return Agent(
             role="Expert JavaScript Error Analyzer and Senior Software Development Engineer",
             goal="Given the error message and the relevant code context/ code snippet, provide detailed root cause analysis on that error",
@@ -26,7 +178,8 @@ class JavascriptErrorAgents:
             max_iter=4
         )
 
-    def expert_Javascript_fix_suggestor(self):
+    def _build_fix_suggestor(self):
+        from crewai import Agent
         return Agent(
             role="Expert JavaScript Debugger and Senior Javascript Developer",
             goal="Apply specific fixes to JavaScript code based on error analysis given by expert_Javascript_error_analyzer and return the new fixed code",
@@ -38,52 +191,53 @@ class JavascriptErrorAgents:
             allow_delegation=False,
             max_iter=4
         )
+
+    def error_crew(self, analyze_task, fix_task, verbose=True):
+        """Crew running the analyze and fix tasks of one error with the shared agents."""
+        from crewai import Crew, Process
+        return Crew(
+            agents=[self.expert_Javascript_error_analyzer(), self.expert_Javascript_fix_suggestor()],
+            tasks=[analyze_task, fix_task],
+            process=Process.sequential,
+            verbose=verbose,
+            memory=False
+        )
+
     def analyze_errors_task(self, input_json):
+        from crewai import Task
         return Task(
-            description=(
-                f"You are given this specific JavaScript error message: {input_json[list(input_json.keys())[0]]['error_description']} and specific error line from the code:\n{input_json[list(input_json.keys())[0]]['error_snippet']}\n\n"
-                f"The relevant code context holding that error is:\n{input_json[list(input_json.keys())[0]]['code_context']}\n\n"
-                "You are also given code_context around the error_snippet! The entire code context might not be syntactically absolutely right or complete, as few lines are fetched around the error snippet so as not to breach input token limit of LLM! "
-                "First locate the error line inside the context code provided to you then match the actual error description provided above. For the error:\n"
-                "1. Locate the error snippet in the code context.\n"
-                "2. Explain the root cause of this specific error.\n"
-                "3. Suggest steps to fix the error in the code!!!!!\n\n"
-                
-                "Return the suggestion:\n"
-                "[\n"
-                "  {\n"
-                f"   'error': '{list(input_json.keys())[0]}',\n"
-                "    'issue': '<specific root cause for this error>',\n"
-                "    'suggestion': '<specific fix for this code>'\n"
-                "    'Steps to fix the code': '<Bullet points to fix the error>'\n"
-                "  }\n"
-                "]"
-            ),
+            description=render_analyze_prompt(input_json),
             agent=self.expert_Javascript_error_analyzer(),
             expected_output="List with one best suggestion for the specific error",
             input=input_json
         )
 
     def fix_errors_task(self, original_errors_json, analyzer_output):
+        from crewai import Task
         return Task(
-            description=(
-                f"You are given this specific JavaScript error message: {original_errors_json[list(original_errors_json.keys())[0]]['error_description']} and specific error line from the code:\n{original_errors_json[list(original_errors_json.keys())[0]]['error_snippet']}\n\n"
-                f"IMPORTANT: You will receive the analysis from the Expert JavaScript Error Analyzer in the context from the previous task. Use his suggestions to fix that specific error in the code context and return bug free code context.\n\n"
-                f"The relevant code context holding that error is:\n{original_errors_json[list(original_errors_json.keys())[0]]['code_context']}\n\n"
-                "Just Return the updated code block after applying the fixes suggested by the Expert JavaScript Error Analyzer.\n\n"
-                "Output format:\n"
-                "[\n"
-                "  {\n"
-                #f"    'error': '{list(original_errors_json.keys())[0]}',\n"
-                "    'fixed_code': '<the corrected code for this specific error>'\n"
-                "  }\n"
-                "]"
-            ),
+            description=render_fix_prompt(original_errors_json),
             agent=self.expert_Javascript_fix_suggestor(),
             expected_output="Fixed JavaScript code for the specific error using the suggestion from Expert JavaScript Debugger and Senior Javascript Developer",
             input=original_errors_json,
             context=[analyzer_output]
         )
+
+    def analyze_batch_task(self, batch_input):
+        from crewai import Task
+        return Task(
+            description=render_batch_analyze_prompt(batch_input),
+            agent=self.expert_Javascript_error_analyzer(),
+            expected_output="JSON object with one suggestion per error id"
+        )
+
+    def fix_batch_task(self, batch_input, analyzer_output):
+        from crewai import Task
+        return Task(
+            description=render_batch_fix_prompt(batch_input),
+            agent=self.expert_Javascript_fix_suggestor(),
+            expected_output="JSON object with the fixed JavaScript code per error id",
+            context=[analyzer_output]
+        )
     '''def analyze_errors_task(self, input_json):
         return Task(
             description=(
@@ -128,141 +282,549 @@ class JavascriptErrorAgents:
             context=[analyzer_output]
         )'''
 
+# Reserved per error: one call per agent, each with the agent's system prompt and an answer
+REQUESTS_PER_ERROR = 2
+PROMPT_OVERHEAD_TOKENS = 400
+COMPLETION_TOKENS_ESTIMATE = 600
+
+
+def estimate_error_tokens(error):
+    """Tokens reserved from the TPM budget for one error before its crew runs.
+
+    Both agents get the error prompt; the fixer also gets the analyzer's answer.
+    """
+    prompt_tokens = count_tokens(error.get("error_description") or "") + count_tokens(
+        error.get("error_part_in_code") or "") + count_tokens(error.get("context_code") or "")
+    return (REQUESTS_PER_ERROR * (prompt_tokens + PROMPT_OVERHEAD_TOKENS + COMPLETION_TOKENS_ESTIMATE)
+            + COMPLETION_TOKENS_ESTIMATE)
+
+
+def error_input_for(error_key, error):
+    return {
+        error_key: {
+            "error_description": error.get("error_description", ""),
+            "error_snippet": error.get("error_part_in_code", ""),
+            "code_context": error.get("context_code", "")
+        }
+    }
+
+
+def error_cache_key(error_key, error):
+    """LLM response cache key: both rendered prompts, model settings and the script's content hash."""
+    error_input = error_input_for(error_key, error)
+    return response_cache_key(render_analyze_prompt(error_input), render_fix_prompt(error_input),
+                              LLM_MODEL, LLM_TEMPERATURE, error.get("code_content_hash"))
+
+
+def run_error_crew(agents, error_key, error, verbose=True):
+    """Run the analyzer and fix-suggestor agents on one error; returns (agent1_response, agent2_response)."""
+    error_input = error_input_for(error_key, error)
+
+    # Create tasks
+    analyze_task = agents.analyze_errors_task(error_input)
+    fix_task = agents.fix_errors_task(error_input, analyzer_output=analyze_task)
+    fix_task.context = [analyze_task]
+
+    # Create and run the crew
+    crew = agents.error_crew(analyze_task, fix_task, verbose)
+    with profiling.stage("crew_kickoff"):
+        crew.kickoff()
+
+    agent1_response = analyze_task.output.raw if hasattr(analyze_task.output, 'raw') else str(analyze_task.output)
+    agent2_response = fix_task.output.raw if hasattr(fix_task.output, 'raw') else str(fix_task.output)
+    return agent1_response, agent2_response
+
+
+def analyze_error(agents, limiter, error_key, error, max_retries=5, verbose=True):
+    """run_error_crew within the shared rate limits, backing off and retrying on 429s."""
+    return call_with_backoff(
+        limiter, lambda: run_error_crew(agents, error_key, error, verbose),
+        REQUESTS_PER_ERROR, estimate_error_tokens(error), max_retries, kind="crew"
+    )
+
+
+def batch_input_for(group):
+    """Prompt input for a group from error_batching.group_errors: the merged context and every error in it."""
+    errors = [item[3] for item in group]
+    code_context, context_start_line = merge_contexts(errors)
+    return {
+        "code_link": errors[0].get("code_link"),
+        "code_content_hash": errors[0].get("code_content_hash"),
+        "context_start_line": context_start_line,
+        "code_context": code_context,
+        "errors": {
+            error_key: {
+                "error_description": error.get("error_description", ""),
+                "error_snippet": error.get("error_part_in_code", ""),
+                "line": error.get("line"),
+                "column": error.get("column")
+            }
+            for _, _, error_key, error in group
+        }
+    }
+
+
+def compress_batch_input(batch_input, passes):
+    """batch_input with its merged context compressed around every error line, and the report (None if skipped)."""
+    start = batch_input["context_start_line"]
+    code = batch_input["code_context"]
+    if not passes or start is None or not code or "\n" not in code:
+        return batch_input, None
+    keep_lines = {error["line"] for error in batch_input["errors"].values() if error["line"] is not None}
+    compressed, report = compress_context(code, start, keep_lines, passes)
+    return dict(batch_input, code_context=compressed), report
+
+
+def format_compression(report):
+    return (f"🗜️  Context compressed: {report['tokens_before']} → {report['tokens_after']} tokens "
+            f"({report['tokens_saved']} saved, {report['lines_elided']} lines elided)")
+
+
+def estimate_batch_tokens(batch_input):
+    """Tokens reserved for a batch: the shared context once per agent plus every error's own lines."""
+    error_tokens = sum(count_tokens(error["error_description"] or "") + count_tokens(error["error_snippet"] or "")
+                       for error in batch_input["errors"].values())
+    completion_tokens = COMPLETION_TOKENS_ESTIMATE * len(batch_input["errors"])
+    prompt_tokens = count_tokens(batch_input["code_context"] or "") + error_tokens + PROMPT_OVERHEAD_TOKENS
+    return REQUESTS_PER_ERROR * (prompt_tokens + completion_tokens) + completion_tokens
+
+
+def batch_cache_key(batch_input):
+    return response_cache_key(render_batch_analyze_prompt(batch_input), render_batch_fix_prompt(batch_input),
+                              LLM_MODEL, LLM_TEMPERATURE, batch_input["code_content_hash"])
+
+
+def run_batch_crew(agents, batch_input, verbose=True):
+    """Run both agents once for a whole batch; returns their raw (agent1, agent2) answers."""
+    analyze_task = agents.analyze_batch_task(batch_input)
+    fix_task = agents.fix_batch_task(batch_input, analyzer_output=analyze_task)
+    crew = agents.error_crew(analyze_task, fix_task, verbose)
+    with profiling.stage("crew_kickoff"):
+        crew.kickoff()
+    agent1_response = analyze_task.output.raw if hasattr(analyze_task.output, 'raw') else str(analyze_task.output)
+    agent2_response = fix_task.output.raw if hasattr(fix_task.output, 'raw') else str(fix_task.output)
+    return agent1_response, agent2_response
+
+
+def analyze_batch(agents, limiter, batch_input, max_retries=5, verbose=True):
+    """run_batch_crew within the shared rate limits (two requests for the whole batch)."""
+    return call_with_backoff(
+        limiter, lambda: run_batch_crew(agents, batch_input, verbose),
+        REQUESTS_PER_ERROR, estimate_batch_tokens(batch_input), max_retries, kind="batch"
+    )
+
+
+def structured_responses(error_key, analysis, fix):
+    """agent1/agent2 responses from parsed answers, in the same list format the single-error prompts ask for."""
+    agent1_response = json.dumps([{"error": error_key, **analysis}], indent=2)
+    agent2_response = json.dumps([{"fixed_code": fix.get("fixed_code", "")}], indent=2)
+    return agent1_response, agent2_response
+
+
+def single_call_cache_key(error_key, error):
+    return response_cache_key(render_single_call_prompt(error_input_for(error_key, error)), None,
+                              LLM_MODEL, LLM_TEMPERATURE, error.get("code_content_hash"))
+
+
+def run_single_call(agents, error_key, error):
+    """Analyze and fix one error with a single LLM call instead of the two-agent crew.
+
+    Returns (agent1_response, agent2_response, usage) where usage is the call's
+    token usage ({"input_tokens", "output_tokens", "total_tokens"}, empty if unknown).
+    """
+    with profiling.stage("single_call"):
+        message = agents.llm.invoke(render_single_call_prompt(error_input_for(error_key, error)))
+    answer = parse_json_answer(message.content)
+    if isinstance(answer, list) and answer and isinstance(answer[0], dict):
+        answer = answer[0]
+    if not isinstance(answer, dict) or "fixed_code" not in answer:
+        raise ValueError("Single-call answer is not a JSON object with the analysis and fixed_code")
+    fix = {"fixed_code": answer.pop("fixed_code")}
+    agent1_response, agent2_response = structured_responses(error_key, answer, fix)
+    return agent1_response, agent2_response, dict(getattr(message, "usage_metadata", None) or {})
+
+
+def analyze_error_single_call(agents, limiter, error_key, error, max_retries=5, verbose=True):
+    """run_single_call within the shared rate limits, backing off and retrying on 429s."""
+    prompt_tokens = count_tokens(render_single_call_prompt(error_input_for(error_key, error)))
+    agent1_response, agent2_response, _ = call_with_backoff(
+        limiter, lambda: run_single_call(agents, error_key, error),
+        1, prompt_tokens + 2 * COMPLETION_TOKENS_ESTIMATE, max_retries, kind="single-call"
+    )
+    return agent1_response, agent2_response
+
+
+def result_entry(error, agent1_response, agent2_response):
+    return {
+        "error_description": error.get("error_description", ""),
+        "error_snippet": error.get("error_part_in_code", ""),
+        "code_context": error.get("context_code", ""),
+        "agent1_response": agent1_response,  # Suggestion from Expert JavaScript Error Analyzer
+        "agent2_response": agent2_response   # Fixed code from Expert JavaScript Fix Suggestor
+    }
+
+
+def parse_args(argv=None):
+    parser = argparse.ArgumentParser(description="Run the CrewAI agents over every parsed RUM error")
+    parser.add_argument("--input", default="rum_errors_by_url_unique_description.json",
+                        help="Parsed errors file written by main.py")
+    parser.add_argument("--results-log", default=RESULTS_LOG,
+                        help="Append-only result log; errors already completed in it are skipped")
+    parser.add_argument("--output", default=RESULTS_JSON, help="Compacted results file written at the end")
+    parser.add_argument("--fresh", action="store_true", help="Discard the result log and start over")
+    parser.add_argument("--state",
+                        help="Run state file shared with main.py (e.g. run_state.json): skip fingerprints already "
+                             "analyzed against the same script content and record new analyses in it")
+    parser.add_argument("--workers", type=int, default=1,
+                        help="Errors analyzed in parallel (default: 1, sequential with verbose agent output)")
+    parser.add_argument("--rpm", type=int, default=500, help="LLM requests per minute across all workers (0: unlimited)")
+    parser.add_argument("--tpm", type=int, default=30000, help="LLM tokens per minute across all workers (0: unlimited)")
+    parser.add_argument("--max-retries", type=int, default=5, help="Retries of an error after 429 responses")
+    parser.add_argument("--base-url", help="OpenAI-compatible endpoint, e.g. a local stub_llm_server.py")
+    parser.add_argument("--cache-db", default=CACHE_DB, help="LLM response cache file")
+    parser.add_argument("--cache-ttl-days", type=float, default=DEFAULT_TTL_DAYS,
+                        help="Days a cached response stays valid")
+    parser.add_argument("--cache-max-mb", type=float, default=DEFAULT_MAX_MB,
+                        help="Size above which least recently used responses are evicted")
+    parser.add_argument("--no-cache", action="store_true", help="Always call the LLM and do not store responses")
+    parser.add_argument("--mode", choices=("crew", "single-call"), default="crew",
+                        help="crew: analyzer agent then fixer agent (default); single-call: one LLM call "
+                             "returning the analysis and the fixed code together")
+    parser.add_argument("--batch", action="store_true",
+                        help="Analyze errors of the same script with overlapping contexts in one prompt per agent")
+    parser.add_argument("--batch-size", type=int, default=DEFAULT_BATCH_SIZE, help="Maximum errors per batch")
+    parser.add_argument("--batch-context-tokens", type=int, default=DEFAULT_BATCH_CONTEXT_TOKENS,
+                        help="Maximum tokens of a batch's merged code context")
+    parser.add_argument("--compress", default="all",
+                        help="Code context compression passes run before prompting: all (default), none, "
+                             "or a comma-separated list of comments, blank, imports, siblings")
+    add_metrics_arguments(parser)
+    profiling.add_arguments(parser)
+    args = parser.parse_args(argv)
+    if args.batch and args.mode != "crew":
+        parser.error("--batch is only available with --mode crew")
+    try:
+        args.compress = resolve_passes(args.compress)
+    except ValueError as e:
+        parser.error(str(e))
+    return args
+
+
+class ErrorAnalysisRun:
+    """One analysis run: error selection, the worker pool, the caches and the result log.
+
+    Used by this script on a parsed errors file and by pipeline.analyze_stage on
+    errors streamed from the earlier pipeline stages. select() decides which
+    errors need analysis, analyze() runs a list of selected errors and may be
+    called once per window of errors, and finish() writes the compacted results
+    and prints the summary.
+    """
+
+    def __init__(self, args, agents=None, run_state=None):
+        self.args = args
+        if args.base_url:
+            os.environ["OPENAI_BASE_URL"] = args.base_url
+        # Built by the first analyze() call, so runs where nothing needs analysis never load the agent stack
+        self._agents = agents
+        self.limiter = LLMRateLimiter(args.rpm, args.tpm)
+        self.response_cache = None if args.no_cache else LLMResponseCache(
+            args.cache_db, args.cache_ttl_days * 86400, int(args.cache_max_mb * 1024 * 1024)
+        )
+        self.verbose = args.workers <= 1
+        if args.mode == "single-call":
+            self.cache_key_for, self.analyze_one = single_call_cache_key, analyze_error_single_call
+        else:
+            self.cache_key_for, self.analyze_one = error_cache_key, analyze_error
+
+        self.store = ResultStore(args.results_log, fresh=args.fresh)
+        if len(self.store):
+            print(f"📂 Resuming from {args.results_log} ({len(self.store)} errors already recorded)")
+        # The pipeline passes the state its enrichment stage already loaded
+        self.run_state = run_state or (RunState(args.state) if args.state else None)
+
+        self.total_errors = 0
+        self.skipped_count = 0
+        self.duplicate_count = 0
+        self.resumed_count = 0
+        self.unchanged_count = 0
+        self.failed_count = 0
+        self.analyzed_fingerprints = set()
+        # Result keys of this run, in order for compact(); the set makes membership checks O(1)
+        self.run_keys = []
+        self._run_key_set = set()
+        # Errors selected for analysis and units (errors or batches) started so far, for progress lines
+        self.pending_count = 0
+        self.unit_count = 0
+        self.compression_totals = {"contexts": 0, "tokens_before": 0, "tokens_saved": 0}
+        self._compression_lock = threading.Lock()
+
+    @property
+    def agents(self):
+        if self._agents is None:
+            # .env is read only when the agents are built, so importing this module has no side effects
+            from dotenv import load_dotenv
+            load_dotenv()
+            self._agents = JavascriptErrorAgents(os.environ["OPENAI_API_KEY"])
+        return self._agents
+
+    def add_run_key(self, key):
+        if key not in self._run_key_set:
+            self._run_key_set.add(key)
+            self.run_keys.append(key)
+
+    def select(self, url, idx, error):
+        """(url, idx, error_key, error) if the error needs analysis, else None (skipped, duplicate or done)."""
+        run_state = self.run_state
+        self.total_errors += 1
+        # Filter out errors without line/column numbers or with too long context
+        line = error.get('line')
+        column = error.get('column')
+        max_tokens = error.get('max_tokens_length_in_code_context', 0)
+
+        # Skip errors without line/column numbers
+        if line is None or column is None:
+            self.skipped_count += 1
+            metrics.inc("errors_selected_total", outcome="no_location")
+            log.info(f"⏭️  Skipping error {idx} for URL: {url} - Missing line/column numbers (line: {line}, column: {column})",
+                     extra={"sample": "skip"})
+            return None
+
+        # Contexts built with a token budget always fit; only older files need the length check
+        context_tokens = error.get('context_tokens')
+        if context_tokens is None and (max_tokens or 0) >= 1000:
+            self.skipped_count += 1
+            metrics.inc("errors_selected_total", outcome="context_too_long")
+            log.info(f"⏭️  Skipping error {idx} for URL: {url} - Context too long ({max_tokens} tokens)",
+                     extra={"sample": "skip"})
+            return None
+
+        # The same error on other pages is analyzed only once
+        fingerprint = fingerprint_of(error)
+        if fingerprint in self.analyzed_fingerprints:
+            self.duplicate_count += 1
+            metrics.inc("errors_selected_total", outcome="duplicate")
+            log.info(f"⏭️  Skipping error {idx} for URL: {url} - Already analyzed (fingerprint {fingerprint})",
+                     extra={"sample": "skip"})
+            return None
+        self.analyzed_fingerprints.add(fingerprint)
+
+        # Analyzed by an earlier run against the same script content: reuse that result. If the log no
+        # longer holds it for this fingerprint (discarded, or a state recorded from another error's
+        # result), the state is wrong and the error is analyzed again.
+        if run_state and not run_state.needs_analysis(error):
+            previous_key = run_state.result_key(error)
+            if self.store.is_done(previous_key, fingerprint, error.get("code_content_hash")):
+                self.unchanged_count += 1
+                metrics.inc("errors_selected_total", outcome="unchanged")
+                self.add_run_key(previous_key)
+                return None
+
+        error_key = f"error_{hash_url(url)}_{idx}"
+        self.add_run_key(error_key)
+        # A result the run state already recorded for this key predates a change of the script
+        stale = run_state is not None and run_state.result_key(error) == error_key
+        # A record under this key from a run on other data holds another error, and one from before a
+        # change of the script an outdated analysis: only this error's, against this content, counts
+        if self.store.is_done(error_key, fingerprint, error.get("code_content_hash")) and not stale:
+            self.resumed_count += 1
+            metrics.inc("errors_selected_total", outcome="resumed")
+            # Safe to record: is_done matched the logged record's fingerprint to this error's
+            if run_state:
+                run_state.mark_analyzed(error, error_key)
+            return None
+        self.pending_count += 1
+        metrics.inc("errors_selected_total", outcome="pending")
+        return url, idx, error_key, error
+
+    def record_compression(self, report):
+        log.info(format_compression(report), extra={"sample": "compression"})
+        metrics.inc("context_tokens_saved_total", report["tokens_saved"])
+        with self._compression_lock:
+            self.compression_totals["contexts"] += 1
+            self.compression_totals["tokens_before"] += report["tokens_before"]
+            self.compression_totals["tokens_saved"] += report["tokens_saved"]
+
+    def record_result(self, error_key, error, agent1_response, agent2_response):
+        self.store.append(error_key, result_entry(error, agent1_response, agent2_response),
+                          fingerprint=fingerprint_of(error), content_hash=error.get("code_content_hash"))
+        if self.run_state:
+            self.run_state.mark_analyzed(error, error_key)
+
+    def process(self, number, url, idx, error_key, error):
+        args = self.args
+        # Only the prompt sees the compressed context; the result keeps the original
+        prompt_error, compression = compress_error(error, args.compress)
+        log.info(f"\n{'='*80}\nProcessing error {number}/{self.pending_count} - Error {idx} for URL: {url}",
+                 extra={"sample": "error_start"})
+        log.debug(f"Line: {error.get('line')}, Column: {error.get('column')}, "
+                  f"Max tokens: {error.get('max_tokens_length_in_code_context', 0)}, Context tokens: {error.get('context_tokens')}\n"
+                  f"Error description: {error.get('error_description', '')}\n"
+                  f"Error snippet: {error.get('error_part_in_code', '')}\n"
+                  f"Code context: {prompt_error.get('context_code', '')[:100]} ...")
+        if compression:
+            self.record_compression(compression)
+
+        started = time.perf_counter()
+        outcome = "failed"
+        try:
+            cache_key = self.cache_key_for(error_key, prompt_error)
+            cached = self.response_cache.get(cache_key) if self.response_cache else None
+            if cached:
+                log.info(f"💾 Cached analysis reused for error {number}", extra={"sample": "cached"})
+                agent1_response, agent2_response = cached
+            else:
+                log.debug(f"Starting {'single-call' if args.mode == 'single-call' else 'CrewAI'} processing for error {number}...")
+                agent1_response, agent2_response = self.analyze_one(self.agents, self.limiter, error_key, prompt_error,
+                                                                    args.max_retries, self.verbose)
+                if self.response_cache:
+                    self.response_cache.put(cache_key, agent1_response, agent2_response)
+            self.record_result(error_key, error, agent1_response, agent2_response)
+            outcome = "cached" if cached else "analyzed"
+            log.info(f"✅ Successfully processed and saved error {number}/{self.pending_count} for URL: {url}",
+                     extra={"sample": "analyzed"})
+            return True
+        except Exception as e:
+            # Recorded as failed so the next run retries it
+            self.store.append(error_key, result_entry(error, "", ""), status="error",
+                              fingerprint=fingerprint_of(error), content_hash=error.get("code_content_hash"))
+            log.error(f"❌ ERROR processing error {number}/{self.pending_count} for URL: {url}\n"
+                      f"Error details: {str(e)}\n"
+                      f"Error type: {type(e).__name__}\n"
+                      f"⚠️  Added error entry and saved progress. Continuing with next error...")
+            return False
+        finally:
+            metrics.inc("analyses_total", mode=args.mode, outcome=outcome)
+            metrics.observe("error_analysis_seconds", time.perf_counter() - started, mode=args.mode, outcome=outcome)
+
+    def process_batch(self, number, group):
+        """Analyze a group with one prompt per agent; errors the answer does not cover are analyzed alone."""
+        args = self.args
+        batch_input, compression = compress_batch_input(batch_input_for(group), args.compress)
+        log.info(f"\n{'='*80}\nProcessing batch {number}/{self.unit_count} - {len(group)} errors in {batch_input['code_link']}",
+                 extra={"sample": "batch_start"})
+        log.debug(f"Lines: {', '.join(str(item[3].get('line')) for item in group)}, "
+                  f"Merged context starts at line {batch_input['context_start_line']}")
+        if compression:
+            self.record_compression(compression)
+
+        started = time.perf_counter()
+        try:
+            cache_key = batch_cache_key(batch_input)
+            cached = self.response_cache.get(cache_key) if self.response_cache else None
+            if cached:
+                log.info(f"💾 Cached analysis reused for batch {number}", extra={"sample": "cached"})
+                agent1_response, agent2_response = cached
+            else:
+                log.debug(f"Starting CrewAI processing for batch {number}...")
+                agent1_response, agent2_response = analyze_batch(self.agents, self.limiter, batch_input,
+                                                                 args.max_retries, self.verbose)
+            analyses = parse_keyed_response(agent1_response)
+            fixes = parse_keyed_response(agent2_response)
+        except Exception as e:
+            metrics.inc("batches_total", outcome="failed")
+            log.warning(f"❌ ERROR processing batch {number}/{self.unit_count}: {type(e).__name__}: {str(e)}\n"
+                        f"↩️  Analyzing its {len(group)} errors one by one instead")
+            return [self.process(number, *item) for item in group]
+        metrics.inc("batches_total", outcome="cached" if cached else "analyzed")
+        metrics.observe("batch_analysis_seconds", time.perf_counter() - started, outcome="cached" if cached else "analyzed")
+
+        answered = [item for item in group if item[2] in analyses and item[2] in fixes]
+        if self.response_cache and not cached and len(answered) == len(group):
+            self.response_cache.put(cache_key, agent1_response, agent2_response)
+        outcomes = []
+        for item in group:
+            url, idx, error_key, error = item
+            if item in answered:
+                self.record_result(error_key, error, *structured_responses(
+                    error_key, analyses[error_key], fixes[error_key]))
+                metrics.inc("analyses_total", mode="batch", outcome="cached" if cached else "analyzed")
+                outcomes.append(True)
+            else:
+                log.info(f"↩️  Error {idx} for URL: {url} missing from the batch answer, analyzing it alone",
+                         extra={"sample": "batch_fallback"})
+                outcomes.append(self.process(number, *item))
+        log.info(f"✅ Processed batch {number}/{self.unit_count}: {len(answered)}/{len(group)} errors answered by the batch prompt",
+                 extra={"sample": "analyzed"})
+        return outcomes
+
+    def process_unit(self, number, unit):
+        if len(unit) == 1:
+            return [self.process(number, *unit[0])]
+        return self.process_batch(number, unit)
+
+    def analyze(self, pending):
+        """Analyze selected (url, idx, error_key, error) items; returns one True/False outcome per item, in order."""
+        args = self.args
+        self.agents  # build them here, before the workers share them
+        if args.batch:
+            units = group_errors(pending, args.batch_size, args.batch_context_tokens)
+            print(f"🚀 Analyzing {len(pending)} errors in {len(units)} batches with {args.workers} worker(s)")
+        else:
+            units = [[item] for item in pending]
+            print(f"🚀 Analyzing {len(pending)} errors with {args.workers} worker(s)")
+        first = self.unit_count + 1
+        self.unit_count += len(units)
+        numbered = list(enumerate(units, first))
+        if args.workers <= 1:
+            unit_outcomes = [self.process_unit(number, unit) for number, unit in numbered]
+        else:
+            with ThreadPoolExecutor(max_workers=args.workers) as executor:
+                unit_outcomes = list(executor.map(lambda n: self.process_unit(*n), numbered))
+        by_key = {}
+        for unit, outcomes in zip(units, unit_outcomes):
+            for item, ok in zip(unit, outcomes):
+                by_key[item[2]] = ok
+        self.failed_count += list(by_key.values()).count(False)
+        return [by_key[item[2]] for item in pending]
+
+    def finish(self):
+        """Close the run, write the compacted results in selection order and print the summary."""
+        args = self.args
+        self.store.close()
+        if self.run_state:
+            self.run_state.save()
+        if self.response_cache:
+            self.response_cache.close()
+        # Written in file order whatever order the workers finished in
+        saved = self.store.compact(args.output, keys=self.run_keys)
+
+        print(f"\n🎉 Processing completed!")
+        print(f"📊 Summary:")
+        print(f"   - Total errors: {self.total_errors}")
+        print(f"   - Errors processed: {self.pending_count} ({self.failed_count} failed, will be retried on the next run)")
+        print(f"   - Errors already completed in a previous run: {self.resumed_count}")
+        print(f"   - Errors skipped: {self.skipped_count}")
+        print(f"   - Duplicate errors not re-analyzed: {self.duplicate_count}")
+        if self.run_state:
+            print(f"   - Errors unchanged since their last analysis: {self.unchanged_count}")
+        totals = self.compression_totals
+        if totals["contexts"]:
+            saved_share = totals["tokens_saved"] / max(totals["tokens_before"], 1)
+            print(f"   - Context compression: {totals['tokens_saved']} tokens saved over "
+                  f"{totals['contexts']} contexts ({saved_share:.0%} of their tokens)")
+        print(f"   - {self.limiter.format_stats()}")
+        if self.response_cache:
+            print(f"   - {self.response_cache.format_stats()}")
+        print(f"   - Final results saved to {args.output} with {saved} entries.")
+        return saved
+
+
 if __name__ == "__main__":
-    OPENAI_API_KEY = os.environ["OPENAI_API_KEY"]
-    agents = JavascriptErrorAgents(OPENAI_API_KEY)
+    args = parse_args()
+    configure_from_args(args)
+    profiling.start_from_args(args)
+    run = ErrorAnalysisRun(args)
 
     # Load the RUM errors JSON
-    with open("rum_errors_by_url_unique_description.json", "r", encoding="utf-8") as f:
+    with open(args.input, "r", encoding="utf-8") as f:
         rum_errors_by_url = json.load(f)
+    print(f"Total errors to process: {sum(len(errors) for errors in rum_errors_by_url.values())}")
 
-    all_results = []
-    processed_count = 0
-    skipped_count = 0
-    total_errors = sum(len(errors) for errors in rum_errors_by_url.values())
-    
-    print(f"Total errors to process: {total_errors}")
-
-    # Iterate over every error in every URL
-    for url, errors in rum_errors_by_url.items():
-        for idx, error in enumerate(errors):
-            # Filter out errors without line/column numbers or with too long context
-            line = error.get('line')
-            column = error.get('column')
-            max_tokens = error.get('max_tokens_length_in_code_context', 0)
-            
-            # Skip errors without line/column numbers
-            if line is None or column is None:
-                skipped_count += 1
-                print(f"⏭️  Skipping error {idx} for URL: {url} - Missing line/column numbers (line: {line}, column: {column})")
-                continue
-            
-            # Skip errors with too long context (>= 1000 tokens)
-            if max_tokens >= 1000:
-                skipped_count += 1
-                print(f"⏭️  Skipping error {idx} for URL: {url} - Context too long ({max_tokens} tokens)")
-                continue
-            
-            try:
-                processed_count += 1
-                print(f"\n{'='*80}")
-                print(f"Processing error {processed_count}/{total_errors} - Error {idx} for URL: {url}")
-                print(f"Line: {line}, Column: {column}, Max tokens: {max_tokens}")
-                print(f"Error description: {error.get('error_description', '')}")
-                print(f"Error snippet: {error.get('error_part_in_code', '')}")
-                print(f"Code context: {error.get('context_code', '')[:100]} ...")
-                print(f"{'='*80}")
-
-                error_key = f"error_{hash_url(url)}_{idx}"
-                error_input = {
-                    error_key: {
-                        "error_description": error.get("error_description", ""),
-                        "error_snippet": error.get("error_part_in_code", ""),
-                        "code_context": error.get("context_code", "")
-                    }
-                }
-
-                # Create tasks
-                analyze_task = agents.analyze_errors_task(error_input)
-                fix_task = agents.fix_errors_task(error_input, analyzer_output=analyze_task)
-                fix_task.context = [analyze_task]
-
-                # Create and run the crew
-                crew = Crew(
-                    agents=[agents.expert_Javascript_error_analyzer(), agents.expert_Javascript_fix_suggestor()],
-                    tasks=[analyze_task, fix_task],
-                    process=Process.sequential,
-                    verbose=True,
-                    memory=False
-                )
-                
-                print(f"Starting CrewAI processing for error {processed_count}...")
-                result = crew.kickoff()
-                print(f"CrewAI processing completed for error {processed_count}")
-
-                # Extract agent responses from the result
-                agent1_response = ""
-                agent2_response = ""
-                
-                # Convert result to dict if possible
-                if hasattr(result, 'dict'):
-                    result_dict = result.dict()
-                elif hasattr(result, 'to_dict'):
-                    result_dict = result.to_dict()
-                else:
-                    result_dict = {"raw_result": str(result)}
-                
-                # Extract Agent1 response (suggestion) - from the first task
-                '''if 'tasks_outputs' in result_dict and len(result_dict['tasks_outputs']) > 0:
-                    agent1_response = result_dict['tasks_outputs'][0] if len(result_dict['tasks_outputs']) > 0 else ""
-                
-                # Extract Agent2 response (fixed code) - from the second task
-                if 'tasks_outputs' in result_dict and len(result_dict['tasks_outputs']) > 1:
-                    agent2_response = result_dict['tasks_outputs'][1] if len(result_dict['tasks_outputs']) > 1 else ""'''
-                agent1_response = analyze_task.output.raw if hasattr(analyze_task.output, 'raw') else str(analyze_task.output)
-                agent2_response = fix_task.output.raw if hasattr(fix_task.output, 'raw') else str(fix_task.output)
-
-                # Collect the result for each error with the exact structure requested
-                result_entry = {
-                    "error_description": error.get("error_description", ""),
-                    "error_snippet": error.get("error_part_in_code", ""),
-                    "code_context": error.get("context_code", ""),
-                    "agent1_response": agent1_response,  # Suggestion from Expert JavaScript Error Analyzer
-                    "agent2_response": agent2_response   # Fixed code from Expert JavaScript Fix Suggestor
-                }
-                all_results.append(result_entry)
-                
-                # Save results after each iteration to prevent data loss
-                with open("all_results.json", "w", encoding="utf-8") as outf:
-                    json.dump(all_results, outf, indent=2)
-                
-                print(f"✅ Successfully processed and saved error {processed_count}/{total_errors} for URL: {url}")
-                
-            except Exception as e:
-                print(f"❌ ERROR processing error {processed_count}/{total_errors} for URL: {url}")
-                print(f"Error details: {str(e)}")
-                print(f"Error type: {type(e).__name__}")
-                
-                # Add error entry to results
-                error_entry = {
-                    "error_description": error.get("error_description", ""),
-                    "error_snippet": error.get("error_part_in_code", ""),
-                    "code_context": error.get("context_code", ""),
-                    "agent1_response": agent1_response,
-                    "agent2_response": agent2_response
-                }
-                all_results.append(error_entry)
-                
-                # Save results even after error
-                with open("all_results.json", "w", encoding="utf-8") as outf:
-                    json.dump(all_results, outf, indent=2)
-                
-                print(f"⚠️  Added error entry and saved progress. Continuing with next error...")
-                continue
-
-    print(f"\n🎉 Processing completed!")
-    print(f"📊 Summary:")
-    print(f"   - Total errors in file: {total_errors}")
-    print(f"   - Errors processed: {processed_count}")
-    print(f"   - Errors skipped: {skipped_count}")
-    print(f"   - Final results saved to all_results.json with {len(all_results)} entries.") 
\ No newline at end of file
+    # Select the errors to analyze, in file order
+    pending = [selected for url, errors in rum_errors_by_url.items()
+               for idx, error in enumerate(errors)
+               for selected in [run.select(url, idx, error)] if selected]
+    run.analyze(pending)
+    run.finish()
+    profiling.finish_from_args(args)
+    export_from_args(args)
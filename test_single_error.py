@@ -1,21 +1,18 @@
 #Purpose: Tests the CrewAI system with just ONE error to verify it works
 '''
 import os
-from dotenv import load_dotenv
-load_dotenv()
 import json
 from typing import List, Dict, Any
-from crewai import Agent, Task, Crew, Process
-from crewai.tools import BaseTool
-import tiktoken
-from langchain_openai import ChatOpenAI
 import hashlib
 
 class JavascriptErrorAgents:
     def __init__(self, openai_api_key: str):
+        # Imported here so importing this module (e.g. for hash_url) stays fast
+        from langchain_openai import ChatOpenAI
         self.llm = ChatOpenAI(model="gpt-4o", temperature=0.5)
         
     def expert_Javascript_error_analyzer(self):
+        from crewai import Agent
         return Agent(
             role="Expert JavaScript Error Analyzer and Senior Software Development Engineer",
             goal="Given the error message and the relevant code context/ code snippet, provide detailed root cause analysis on the error and steps to fix it!!",
@@ -29,6 +26,7 @@ class JavascriptErrorAgents:
         )
 
     def expert_Javascript_fix_suggestor(self):
+        from crewai import Agent
         return Agent(
             role="Expert JavaScript Debugger and Senior Javascript Developer",
             goal="Apply specific fixes to JavaScript code based on error analysis given by expert_Javascript_error_analyzer and return the new fixed code",
@@ -42,6 +40,7 @@ class JavascriptErrorAgents:
         )
 
     def analyze_errors_task(self, input_json):
+        from crewai import Task
         return Task(
             description=(
                 f"You are given this specific JavaScript error message: {input_json[list(input_json.keys())[0]]['error_description']} and specific error line from the code:\n{input_json[list(input_json.keys())[0]]['error_snippet']}\n\n"
@@ -68,6 +67,7 @@ class JavascriptErrorAgents:
         )
 
     def fix_errors_task(self, original_errors_json, analyzer_output):
+        from crewai import Task
         return Task(
             description=(
                 f"You are given this specific JavaScript error message: {original_errors_json[list(original_errors_json.keys())[0]]['error_description']} and specific error line from the code:\n{original_errors_json[list(original_errors_json.keys())[0]]['error_snippet']}\n\n"
@@ -92,6 +92,9 @@ def hash_url(url):
     return hashlib.md5(url.encode('utf-8')).hexdigest()
 
 if __name__ == "__main__":
+    from crewai import Crew, Process
+    from dotenv import load_dotenv
+    load_dotenv()
     OPENAI_API_KEY = os.environ["OPENAI_API_KEY"]
     agents = JavascriptErrorAgents(OPENAI_API_KEY)
 